@@ -1,5 +1,10 @@
 """__init__.py"""
 
+import time
+
 from dotenv import find_dotenv, load_dotenv
 
+# Start of the app's imports, for the startup report
+STARTED = time.perf_counter()
+
 load_dotenv(find_dotenv())
@@ -0,0 +1,143 @@
+"""answer_cache.py"""
+
+import os
+import time
+from threading import Lock
+from typing import Optional
+from uuid import UUID
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Minimum cosine similarity for a prior question to count as the same one
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Answers kept per library, the oldest are dropped first
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+
+
+class SemanticCache:
+    """Answers of prior questions, looked up by question embedding similarity.
+
+    Every answer is stored with the epoch of its library, a counter kept on
+    the library record and raised whenever the library changes, so answers
+    cached by any process before a change miss in all of them.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        maxsize: int = ANSWER_CACHE_SIZE,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.maxsize = maxsize
+
+        self.hits = 0
+        self.misses = 0
+
+        # (library, llm) -> list of (timestamp, epoch, question vector, answer)
+        self._entries: dict[
+            tuple[UUID, str], list[tuple[float, int, np.ndarray, str]]
+        ] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def _normalise(vector: list[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+
+        return array / norm if norm else array
+
+    def lookup(
+        self, library: UUID, llm: str, vector: list[float], epoch: int = 0
+    ) -> Optional[str]:
+        with self._lock:
+            now = time.monotonic()
+
+            entries = [
+                entry
+                for entry in self._entries.get((library, llm), [])
+                if now - entry[0] <= self.ttl and entry[1] >= epoch
+            ]
+
+            if entries:
+                self._entries[(library, llm)] = entries
+            else:
+                self._entries.pop((library, llm), None)
+
+            current = [entry for entry in entries if entry[1] == epoch]
+
+            if current:
+                matrix = np.stack([entry[2] for entry in current])
+                scores = matrix @ self._normalise(vector)
+                best = int(np.argmax(scores))
+
+                if scores[best] >= self.threshold:
+                    self.hits += 1
+                    return current[best][3]
+
+            self.misses += 1
+
+            return None
+
+    def store(
+        self,
+        library: UUID,
+        llm: str,
+        vector: list[float],
+        answer: str,
+        epoch: int = 0,
+    ):
+        with self._lock:
+            entries = self._entries.setdefault((library, llm), [])
+            entries.append((time.monotonic(), epoch, self._normalise(vector), answer))
+
+            del entries[: -self.maxsize]
+
+    def invalidate(self, library: UUID):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == library]:
+                del self._entries[key]
+
+    @property
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+
+        return {
+            "libraries": len({library for library, _ in self._entries}),
+            "size": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+answer_cache = SemanticCache()
+
+
+class LibraryAnswerCache:
+    """Binds the semantic cache to one library, chat model and embedding model."""
+
+    def __init__(self, library: UUID, llm: str, embeddings: Embeddings):
+        self.library = library
+        self.llm = llm
+        self.embeddings = embeddings
+
+    async def aembed(self, question: str) -> list[float]:
+        return await self.embeddings.aembed_query(question)
+
+    def lookup(self, vector: list[float], epoch: int = 0) -> Optional[str]:
+        return answer_cache.lookup(self.library, self.llm, vector, epoch)
+
+    def store(self, vector: list[float], answer: str, epoch: int = 0):
+        answer_cache.store(self.library, self.llm, vector, answer, epoch)
+
+
+def invalidate_answers(library: UUID):
+    """Frees the answers of a library cached in this process.
+
+    Other processes only drop theirs once they see the library's new epoch.
+    """
+    answer_cache.invalidate(library)
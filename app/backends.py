@@ -0,0 +1,375 @@
+"""backends.py"""
+
+import asyncio
+import os
+from functools import partial
+from threading import Lock
+from typing import Optional
+from uuid import UUID
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.vectorstores import VectorStore
+
+from app.data_connection.local import get_index as get_local_index
+from app.embedding_cache import CachedEmbeddings
+from app.embedding_scheduler import ScheduledEmbeddings
+from app.util.cache import LRUCache
+from app.util.registry import Registry
+from app.util.registry import get_stats as get_registry_stats
+from app.vectorstore import LocalVectorStore
+
+# Vector store wrappers kept alive, one per library and backend
+VECTORSTORE_CACHE_SIZE = int(os.getenv("VECTORSTORE_CACHE_SIZE", "256"))
+
+# Instances shared by ingestion and queries, so both use the same warmed
+# clients, embedding caches and rate limits
+embeddings: dict[str, Embeddings] = {}
+chat_models: dict[tuple[str, float], BaseChatModel] = {}
+vectorstores = LRUCache(maxsize=VECTORSTORE_CACHE_SIZE)
+
+# Collections known to exist, as (vectordb, collection)
+collections: set[tuple[str, UUID]] = set()
+
+_lock = Lock()
+_collection_lock = asyncio.Lock()
+
+
+def get_embeddings(embedding: str) -> Embeddings:
+    with _lock:
+        if embedding not in embeddings:
+            embeddings[embedding] = EMBEDDING_MAPPING[embedding]()
+
+        return embeddings[embedding]
+
+
+def get_chat_model(llm: str, temperature: float) -> BaseChatModel:
+    key = (llm, temperature)
+
+    with _lock:
+        if key not in chat_models:
+            chat_models[key] = CHAT_MAPPING[llm](temperature=temperature)
+
+        return chat_models[key]
+
+
+def get_vectorstore(vectordb: str, embedding: str, collection: UUID) -> VectorStore:
+    """Returns the shared vector store of a library's collection."""
+    key = (vectordb, embedding, collection)
+
+    instance = vectorstores.get(key)
+
+    if instance is None:
+        instance = VECTORDB_MAPPING[vectordb](
+            embedding=get_embeddings(embedding), collection=collection
+        )
+
+        # A store of a missing collection would not see it once created
+        if (bound := BOUND_MAPPING.get(vectordb)) is None or bound(instance):
+            vectorstores.set(key, instance)
+
+    return instance
+
+
+def is_vectorstore_bound(vectordb: str, embedding: str, collection: UUID) -> bool:
+    """Whether the shared store of a library sees its collection.
+
+    Stores of missing collections are not shared, see `get_vectorstore`.
+    """
+    if vectordb not in BOUND_MAPPING:
+        return True
+
+    return (vectordb, embedding, collection) in vectorstores
+
+
+async def ensure_collection(vectordb: str, embedding: str, collection: UUID):
+    """Creates a library's collection before its first documents are added."""
+    if (vectordb, collection) in collections:
+        return
+
+    # Concurrent first ingestions into a library create its collection once
+    async with _collection_lock:
+        if (vectordb, collection) in collections:
+            return
+
+        if (create := COLLECTION_MAPPING.get(vectordb)) is not None:
+            await create(get_embeddings(embedding), collection)
+
+            # Wrappers built before the collection existed may not see it
+            vectorstores.invalidate(
+                lambda key: key[0] == vectordb and key[2] == collection
+            )
+
+        collections.add((vectordb, collection))
+
+
+async def add_documents(
+    vectordb: str,
+    instance: VectorStore,
+    documents: list[Document],
+    ids: Optional[list[str]] = None,
+):
+    """Adds documents under `ids`, replacing any already stored with them."""
+    if ids is None:
+        return await instance.aadd_documents(documents=documents)
+
+    if (upsert := UPSERT_MAPPING.get(vectordb)) is not None:
+        return await upsert(instance, documents, ids)
+
+    return await instance.aadd_documents(documents=documents, ids=ids)
+
+
+async def upsert_milvus_documents(
+    instance: VectorStore, documents: list[Document], ids: list[str]
+):
+    # Milvus keeps duplicate primary keys, so stored copies are deleted first
+    if instance.col is not None:
+        await asyncio.to_thread(instance.delete, ids=ids)
+
+    return await instance.aadd_documents(documents=documents, ids=ids)
+
+
+def is_dashvector_bound(instance: VectorStore) -> bool:
+    # DashVector returns a falsy collection for a name that does not exist
+    return bool(instance._collection)
+
+
+def is_milvus_bound(instance: VectorStore) -> bool:
+    return instance.col is not None
+
+
+async def get_dimension(embedding: Embeddings) -> int:
+    return len(await embedding.aembed_query("dimension"))
+
+
+def get_cohere_embedding():
+    from langchain_community.embeddings.cohere import CohereEmbeddings
+
+    # return CohereEmbeddings(
+    #     model="embed-multilingual-light-v3.0", max_retries=5, request_timeout=20
+    # )
+    embeddings = ScheduledEmbeddings(
+        CohereEmbeddings(max_retries=5, request_timeout=20), provider="cohere"
+    )
+
+    return CachedEmbeddings(embeddings, namespace=f"cohere:{embeddings.model}")
+
+
+def get_dashscope_embedding():
+    from langchain_community.embeddings.dashscope import DashScopeEmbeddings
+
+    embeddings = ScheduledEmbeddings(
+        DashScopeEmbeddings(model="text-embedding-v2", max_retries=5),
+        provider="dashscope",
+    )
+
+    return CachedEmbeddings(embeddings, namespace=f"dashscope:{embeddings.model}")
+
+
+def get_dashvector_collection(embedding, collection: UUID):
+    from langchain_community.vectorstores.dashvector import DashVector
+
+    from app.data_connection.dashvector import get_client as get_dashvector_client
+
+    client = get_dashvector_client()
+
+    instance = DashVector(
+        # character must be in [a-zA-Z0-9] and symbols[_,-] and length must be in [3,32]
+        collection=client.get(name=collection.hex),
+        embedding=embedding,
+        text_field="text",
+    )
+
+    return instance
+
+
+def get_local_collection(embedding, collection: UUID):
+    instance = LocalVectorStore(
+        index=get_local_index(collection.hex), embedding=embedding
+    )
+
+    return instance
+
+
+def get_milvus_collection(embedding, collection: UUID):
+    from langchain_community.vectorstores.milvus import Milvus
+
+    from app.data_connection.milvus import get_connection_args as get_milvus_args
+    from app.data_connection.milvus import make_connection as make_milvus_connection
+
+    make_milvus_connection()
+
+    # The collection is created along with the first documents added
+    instance = Milvus(
+        embedding_function=embedding,
+        # The first character of a collection name must be an underscore or letter
+        collection_name=f"_{collection.hex}",
+        connection_args=get_milvus_args(),
+    )
+
+    return instance
+
+
+def get_qdrant_collection(embedding, collection: UUID):
+    from langchain_community.vectorstores.qdrant import Qdrant
+
+    from app.data_connection.qdrant import get_async_client as get_qdrant_async_client
+    from app.data_connection.qdrant import get_client as get_qdrant_client
+
+    instance = Qdrant(
+        client=get_qdrant_client(),
+        async_client=get_qdrant_async_client(),
+        collection_name=collection.hex,
+        embeddings=embedding,
+    )
+
+    return instance
+
+
+def get_weaviate_collection(embedding, collection: UUID):
+    from langchain_community.vectorstores.weaviate import Weaviate
+
+    from app.data_connection.weaviate import get_client as get_weaviate_client
+
+    client = get_weaviate_client()
+
+    instance = Weaviate(
+        client=client,
+        index_name=f"collection_{collection.hex}",
+        text_key="text",
+        embedding=embedding,
+        by_text=False,
+    )
+
+    return instance
+
+
+async def create_dashvector_collection(embedding: Embeddings, collection: UUID):
+    from app.data_connection.dashvector import pool as dashvector_pool
+
+    client = await dashvector_pool.aget()
+
+    if await asyncio.to_thread(client.get, name=collection.hex):
+        return
+
+    response = await asyncio.to_thread(
+        client.create, name=collection.hex, dimension=await get_dimension(embedding)
+    )
+
+    if not response:
+        raise ValueError(f"Failed to create collection: {response.message}")
+
+
+async def create_qdrant_collection(embedding: Embeddings, collection: UUID):
+    from qdrant_client import models
+
+    from app.data_connection.qdrant import async_pool as qdrant_async_pool
+
+    client = await qdrant_async_pool.aget()
+
+    if await client.collection_exists(collection_name=collection.hex):
+        return
+
+    await client.create_collection(
+        collection_name=collection.hex,
+        vectors_config=models.VectorParams(
+            size=await get_dimension(embedding), distance=models.Distance.COSINE
+        ),
+    )
+
+
+async def create_weaviate_collection(embedding: Embeddings, collection: UUID):
+    from langchain_community.vectorstores.weaviate import _default_schema
+
+    from app.data_connection.weaviate import pool as weaviate_pool
+
+    client = await weaviate_pool.aget()
+    index_name = f"collection_{collection.hex}"
+
+    if not await asyncio.to_thread(client.schema.exists, index_name):
+        await asyncio.to_thread(
+            client.schema.create_class, _default_schema(index_name, "text")
+        )
+
+
+def get_cohere_chat(temperature: float, model: Optional[str] = None):
+    from langchain_community.chat_models.cohere import ChatCohere
+
+    return ChatCohere(model=model, temperature=temperature)
+
+
+def get_tongyi_chat(temperature: float, model: str = "qwen-max"):
+    from langchain_community.chat_models.tongyi import ChatTongyi
+
+    return ChatTongyi(model=model, model_kwargs={"temperature": temperature})
+
+
+def get_stats() -> dict:
+    return {
+        **get_registry_stats(),
+        "instances": {
+            "embedding": sorted(embeddings),
+            "llm": sorted(f"{llm}@{temperature}" for llm, temperature in chat_models),
+            "vectordb": vectorstores.stats,
+        },
+    }
+
+
+CHAT_MAPPING = Registry(
+    "llm",
+    {
+        "cohere": get_cohere_chat,
+        "cohere-light": partial(get_cohere_chat, model="command-light"),
+        "dashscope": get_tongyi_chat,
+        "dashscope-turbo": partial(get_tongyi_chat, model="qwen-turbo"),
+    },
+)
+
+
+EMBEDDING_MAPPING = Registry(
+    "embedding",
+    {
+        "cohere": get_cohere_embedding,
+        "dashscope": get_dashscope_embedding,
+    },
+)
+
+
+VECTORDB_MAPPING = Registry(
+    "vectordb",
+    {
+        "dashvector": get_dashvector_collection,
+        "local": get_local_collection,
+        "milvus": get_milvus_collection,
+        "qdrant": get_qdrant_collection,
+        "weaviate": get_weaviate_collection,
+    },
+)
+
+
+# Backends whose collections must exist before documents are added to them
+COLLECTION_MAPPING = {
+    "dashvector": create_dashvector_collection,
+    "qdrant": create_qdrant_collection,
+    "weaviate": create_weaviate_collection,
+}
+
+
+# Backends whose stores are bound to their collection when built, and can
+# be reused only once it exists
+BOUND_MAPPING = {
+    "dashvector": is_dashvector_bound,
+    "milvus": is_milvus_bound,
+}
+
+
+# Backends whose stores map their scores to relevance in [0, 1], as
+# `score_threshold` requires
+RELEVANCE_SCORE_VECTORDBS = {"local", "qdrant", "weaviate"}
+
+
+# Backends whose writes insert rather than upsert by id
+UPSERT_MAPPING = {
+    "milvus": upsert_milvus_documents,
+}
@@ -1,8 +1,13 @@
 """chain.py"""
 
+from operator import itemgetter
+
+from langchain_core.messages import AIMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+
+from app.context import build_context
 
 
 class DummyChain:
@@ -13,10 +18,6 @@ class DummyChain:
         return f"Your prompt is {prompt}"
 
 
-def format_docs(docs) -> str:
-    return "\n\n".join(doc.page_content for doc in docs)
-
-
 condense_q_system_prompt = """Given a chat history and the latest user question \
 which might reference the chat history, formulate a standalone question \
 which can be understood without the chat history. Do NOT answer the question, \
@@ -49,19 +50,96 @@ qa_prompt = ChatPromptTemplate.from_messages(
 )
 
 
-def get_rag_chain(retriever, llm):
-    condense_q_chain = condense_q_prompt | llm | StrOutputParser()
+summary_system_prompt = """Progressively summarize the lines of conversation \
+provided, adding onto the previous summary and returning a new summary. \
+Keep the facts, names and open questions the user may refer to later, \
+and keep the summary within a few sentences."""
+
+
+summary_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", summary_system_prompt),
+        MessagesPlaceholder(variable_name="messages"),
+        ("human", "Current summary:\n{summary}\n\nNew summary:"),
+    ]
+)
+
+
+def get_summary_chain(llm):
+    return summary_prompt | llm | StrOutputParser()
+
+
+def get_retrieval_chain(retriever, reranker=None, top_n=4):
+    if reranker is None:
+        return itemgetter("standalone_question") | retriever
+
+    async def rerank(input: dict):
+        documents = await retriever.ainvoke(input["standalone_question"])
+
+        return await reranker.arerank(
+            input["standalone_question"], documents, top_n=top_n
+        )
+
+    return RunnableLambda(rerank)
+
+
+def get_rag_chain(
+    retriever,
+    llm,
+    answer_cache=None,
+    condenser=None,
+    condense_llm=None,
+    reranker=None,
+    top_n=4,
+    coalescer=None,
+):
+    condense_q_chain = condense_q_prompt | (condense_llm or llm) | StrOutputParser()
+
+    if condenser is not None:
+        condense_q_chain = condenser.wrap(condense_q_chain)
+
+    # Named and tagged so the condense model call is timed apart from the answer
+    condense_q_chain = condense_q_chain.with_config(
+        run_name="condense", tags=["condense"]
+    )
 
     def condense_question(input: dict):
         if input.get("chat_history"):
             return condense_q_chain
 
+        if condenser is not None:
+            condenser.record("no_history")
+
         return input["question"]
 
-    rag_chain = (
-        RunnablePassthrough.assign(context=condense_question | retriever | format_docs)
+    answer_chain = (
+        RunnablePassthrough.assign(
+            context=get_retrieval_chain(retriever, reranker, top_n) | build_context
+        )
         | qa_prompt
         | llm
     )
 
+    async def answer(input: dict):
+        vector = await answer_cache.aembed(input["standalone_question"])
+        epoch = input.get("answer_epoch", 0)
+
+        if (cached := answer_cache.lookup(vector, epoch)) is not None:
+            return AIMessage(content=cached)
+
+        def store(run):
+            answer_cache.store(vector, run.outputs["output"].content, epoch)
+
+        return answer_chain.with_listeners(on_end=store)
+
+    answer_step = answer_chain if answer_cache is None else RunnableLambda(answer)
+
+    # Identical requests in flight share one answer once condensed
+    if coalescer is not None:
+        answer_step = coalescer.wrap(answer_step)
+
+    rag_chain = (
+        RunnablePassthrough.assign(standalone_question=condense_question) | answer_step
+    )
+
     return rag_chain
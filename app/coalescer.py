@@ -0,0 +1,48 @@
+"""coalescer.py"""
+
+import os
+from typing import AsyncIterator, Hashable
+
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from app.condenser import hash_history
+from app.util.singleflight import SingleFlight
+
+# Set to "false" to answer every request on its own
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+
+# Answers being generated, keyed by chain, question and history
+flights = SingleFlight()
+
+
+class RequestCoalescer:
+    """Lets identical concurrent requests to a chain share one answer.
+
+    Requests are matched once their question is condensed, on the question,
+    the standalone question and the history the answer is conditioned on.
+    Followers receive the leader's tokens as they are generated, so a burst
+    of the same question costs one retrieval and one model call.
+    """
+
+    def __init__(self, scope: Hashable):
+        self.scope = scope
+
+    def wrap(self, answer_chain: Runnable) -> Runnable:
+        async def answer(input: dict, config: RunnableConfig) -> AsyncIterator:
+            key = (
+                self.scope,
+                input["question"],
+                input["standalone_question"],
+                hash_history(input.get("chat_history") or []),
+            )
+
+            async for chunk in flights.stream(
+                key, lambda: answer_chain.astream(input, config)
+            ):
+                yield chunk
+
+        return RunnableLambda(answer)
+
+
+def get_stats() -> dict:
+    return flights.stats
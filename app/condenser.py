@@ -0,0 +1,113 @@
+"""condenser.py"""
+
+import hashlib
+import os
+import re
+
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from app.util.cache import LRUCache
+
+# One of the keys of CONDENSE_STRATEGY_MAPPING
+CONDENSE_STRATEGY = os.getenv("CONDENSE_STRATEGY", "heuristic")
+# Chat model rewriting follow-up questions, the answering model when empty
+CONDENSE_LLM = os.getenv("CONDENSE_LLM", "")
+CONDENSE_CACHE_SIZE = int(os.getenv("CONDENSE_CACHE_SIZE", "1024"))
+CONDENSE_CACHE_TTL = float(os.getenv("CONDENSE_CACHE_TTL", "3600"))
+
+# Words and phrases that usually point back to the conversation
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|this|that|these|those|he|him|his|she|her|"
+    r"there|former|latter|above|previous|earlier|same|else|another|other|more)\b",
+    re.IGNORECASE,
+)
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|but|so|or|also|then|why|how about|what about)\b", re.IGNORECASE
+)
+CJK_REFERENCE_PATTERN = re.compile(
+    "它|他|她|这|那|其|此|上面|上述|之前|刚才|前面|还有|另外|呢"
+)
+CJK_PATTERN = re.compile("[\u3000-\u9fff]")
+
+# Questions shorter than this are assumed to rely on the context
+MIN_WORDS = 4
+MIN_CJK_CHARACTERS = 6
+
+# Standalone questions keyed by condensing model, history hash and question
+condensed_questions = LRUCache(maxsize=CONDENSE_CACHE_SIZE, ttl=CONDENSE_CACHE_TTL)
+
+stats = {"no_history": 0, "skipped": 0, "cached": 0, "condensed": 0}
+
+
+def needs_condensing(question: str) -> bool:
+    """Guesses whether a question can only be understood with the history."""
+    if CJK_PATTERN.search(question):
+        return (
+            len(CJK_PATTERN.findall(question)) < MIN_CJK_CHARACTERS
+            or CJK_REFERENCE_PATTERN.search(question) is not None
+        )
+
+    return (
+        len(question.split()) < MIN_WORDS
+        or REFERENCE_PATTERN.search(question) is not None
+        or FOLLOW_UP_PATTERN.search(question) is not None
+    )
+
+
+CONDENSE_STRATEGY_MAPPING = {
+    "always": lambda question: True,
+    "heuristic": needs_condensing,
+    "never": lambda question: False,
+}
+
+
+def hash_history(messages: list[BaseMessage]) -> str:
+    digest = hashlib.sha256()
+
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode())
+
+    return digest.hexdigest()
+
+
+class QuestionCondenser:
+    """Decides whether a follow-up question goes through the condense chain.
+
+    Questions judged self-contained by the strategy are used as they are, and
+    standalone questions are cached so repeated turns skip the model call.
+    """
+
+    def __init__(self, llm: str, strategy: str = CONDENSE_STRATEGY):
+        self.llm = llm
+        self.should_condense = CONDENSE_STRATEGY_MAPPING[strategy]
+
+    def record(self, path: str):
+        stats[path] += 1
+
+    def wrap(self, condense_chain: Runnable) -> Runnable:
+        async def condense(input: dict) -> str:
+            question = input["question"]
+
+            if not self.should_condense(question):
+                self.record("skipped")
+                return question
+
+            key = (self.llm, hash_history(input["chat_history"]), question)
+
+            if (standalone := condensed_questions.get(key)) is not None:
+                self.record("cached")
+                return standalone
+
+            standalone = await condense_chain.ainvoke(input)
+
+            condensed_questions.set(key, standalone)
+            self.record("condensed")
+
+            return standalone
+
+        return RunnableLambda(condense)
+
+
+def get_stats() -> dict:
+    return {**stats, "cache": condensed_questions.stats}
@@ -0,0 +1,111 @@
+"""context.py"""
+
+import logging
+import os
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from app.util.tokens import count_tokens
+
+# Upper bound on the tokens of retrieved text put into the answer prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+SEPARATOR = "\n\n"
+
+logger = logging.getLogger(__name__)
+
+stats = {"requests": 0, "tokens_in": 0, "tokens_out": 0}
+
+
+def _get_span_key(document: Document) -> Optional[tuple]:
+    """Chunks sharing this key come from the same text and can be merged."""
+    if "start_index" not in document.metadata:
+        return None
+
+    return document.metadata.get("source"), document.metadata.get("page")
+
+
+def merge_chunks(documents: list[Document]) -> list[str]:
+    """Merges overlapping or adjacent chunks of the same source and page.
+
+    The splitter records where every chunk starts in its page, so chunks
+    whose spans touch are joined without repeating the overlap. Passages are
+    returned in the order of their best ranked chunk.
+    """
+    groups: dict[object, list[Document]] = {}
+
+    for rank, document in enumerate(documents):
+        key = _get_span_key(document)
+
+        groups.setdefault(rank if key is None else key, []).append(document)
+
+    passages = []
+
+    for chunks in groups.values():
+        chunks.sort(key=lambda chunk: chunk.metadata.get("start_index", 0))
+
+        text, end = "", None
+
+        for chunk in chunks:
+            start = chunk.metadata.get("start_index", 0)
+
+            if end is not None and start <= end:
+                text += chunk.page_content[end - start :]
+            else:
+                if text:
+                    passages.append(text)
+                text = chunk.page_content
+
+            end = max(end or 0, start + len(chunk.page_content))
+
+        passages.append(text)
+
+    # Identical passages retrieved from several libraries are kept once
+    return list(dict.fromkeys(passages))
+
+
+def truncate(text: str, budget: int) -> str:
+    """Cuts a text to about `budget` tokens at a whitespace boundary."""
+    ratio = budget / max(count_tokens(text), 1)
+    cut = text[: int(len(text) * ratio)]
+
+    return cut.rsplit(None, 1)[0] if " " in cut else cut
+
+
+def build_context(documents: list[Document], budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Formats retrieved chunks for the prompt within a token budget."""
+    passages = []
+    remaining = budget
+
+    for passage in merge_chunks(documents):
+        tokens = count_tokens(passage)
+
+        if tokens > remaining:
+            if remaining > 0:
+                passages.append(truncate(passage, remaining))
+            break
+
+        passages.append(passage)
+        remaining -= tokens + count_tokens(SEPARATOR)
+
+    context = SEPARATOR.join(passages)
+
+    tokens_in = count_tokens(SEPARATOR.join(doc.page_content for doc in documents))
+    tokens_out = count_tokens(context)
+
+    stats["requests"] += 1
+    stats["tokens_in"] += tokens_in
+    stats["tokens_out"] += tokens_out
+
+    logger.debug("Context of %d tokens, %d saved", tokens_out, tokens_in - tokens_out)
+
+    return context
+
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "tokens_saved": stats["tokens_in"] - stats["tokens_out"],
+        "budget": CONTEXT_TOKEN_BUDGET,
+    }
@@ -1,27 +1,122 @@
 """controller.py"""
 
+import asyncio
+import logging
 import os
-from datetime import datetime
-from typing import Optional, Union
-from uuid import UUID
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Iterator,
+    Optional,
+    Union,
+)
+from uuid import UUID, uuid4
 
-from fastapi import UploadFile
+from bson.errors import InvalidId
+from fastapi import HTTPException, UploadFile, status
 from langchain_core.messages import AIMessage, HumanMessage
 
+from app.answer_cache import answer_cache, invalidate_answers
+from app.backends import RELEVANCE_SCORE_VECTORDBS
+from app.backends import get_stats as get_backend_stats
+from app.coalescer import get_stats as get_coalescer_stats
+from app.condenser import get_stats as get_condenser_stats
+from app.context import get_stats as get_context_stats
 from app.data_connection.mongo import get_client
 from app.document_processor import process_document
+from app.embedding_cache import get_stats as get_embedding_cache_stats
+from app.embedding_scheduler import get_stats as get_embedding_scheduler_stats
 from app.entity import (
+    BulkImportStatus,
     Dialogue,
     DialogueList,
     Document,
     DocumentList,
+    DocumentSource,
+    Job,
     Library,
     LibraryList,
+    Message,
+    RetrievalSettings,
     UserPrompt,
 )
-from app.prompt_processor import construct_chat_history, get_prompt_processor
+from app.history import get_window_start, with_summary
+from app.job_queue import (
+    JOB_LEASE,
+    JOB_MAX_ATTEMPTS,
+    enqueue,
+    enqueue_many,
+    get_retry_delay,
+)
+from app.metrics import DIALOGUE_STAGE_DURATION, StageTimer, register_gauge
+from app.prompt_processor import (
+    chain_cache,
+    construct_chat_history,
+    get_prompt_processor,
+    get_prompt_streamer,
+    get_summariser,
+    invalidate_chains,
+)
+from app.reranker import get_stats as get_reranker_stats
+from app.util.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    encode_cursor,
+    get_keyset_filter,
+)
 
 PROJECT_NAME = os.getenv("PROJECT_NAME", "knowledgeable-cobra")
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+# Limits of one bulk upload, archive entries included
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "10000"))
+UPLOAD_MAX_FILE_SIZE = int(os.getenv("UPLOAD_MAX_FILE_SIZE", str(100 * 2**20)))
+UPLOAD_MAX_TOTAL_SIZE = int(os.getenv("UPLOAD_MAX_TOTAL_SIZE", str(2**30)))
+COPY_BUFFER_SIZE = 2**20
+# Most recent messages of a dialogue loaded on each turn, the prompts only
+# get the latest turns within HISTORY_TOKEN_BUDGET and a summary of the rest
+DIALOGUE_HISTORY_WINDOW = int(os.getenv("DIALOGUE_HISTORY_WINDOW", "20"))
+# Characters of the first question kept as the dialogue preview
+PREVIEW_LENGTH = 128
+
+# Loader type by file extension for uploaded files and imported URLs
+EXTENSION_TYPE_MAPPING = {
+    ".pdf": "pdf",
+}
+
+# Indexes backing the lookups and keyset-paginated listings below
+INDEX_MAPPING = {
+    "library": [
+        [("user_id", 1), ("uuid", 1)],
+        [("user_id", 1), ("datetime_created", -1), ("_id", -1)],
+    ],
+    "document": [
+        [("user_id", 1), ("uuid", 1)],
+        [("user_id", 1), ("library_id", 1), ("datetime_created", -1), ("_id", -1)],
+    ],
+    "dialogue": [
+        [("user_id", 1), ("uuid", 1)],
+        [("user_id", 1), ("library_id", 1), ("datetime_updated", -1), ("_id", -1)],
+    ],
+    "message": [
+        [("dialogue_id", 1), ("_id", -1)],
+    ],
+    "job": [
+        [("uuid", 1)],
+        [("user_id", 1), ("document_id", 1), ("datetime_created", -1)],
+        [("user_id", 1), ("batch_id", 1)],
+        [("status", 1), ("next_attempt_at", 1)],
+    ],
+}
+
+logger = logging.getLogger(__name__)
+
+# Keeps a reference to running summaries so they are not garbage collected
+summarising: set[asyncio.Task] = set()
 
 
 def _get_collection(collection_name: str):
@@ -30,14 +125,63 @@ def _get_collection(collection_name: str):
     return client.get_database(PROJECT_NAME).get_collection(name=collection_name)
 
 
-async def get_libraries(user_id: UUID):
-    collection = _get_collection(collection_name="library")
+async def ensure_indexes():
+    for collection_name, indexes in INDEX_MAPPING.items():
+        collection = _get_collection(collection_name=collection_name)
+
+        for keys in indexes:
+            await collection.create_index(keys)
+
+
+async def _paginate(
+    collection_name: str,
+    query: dict,
+    sort_field: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """Fetches one page in (sort_field, _id) descending order.
+
+    Returns:
+        tuple: The page and the cursor of the next page, None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    if cursor:
+        try:
+            query = {**query, **get_keyset_filter(sort_field, cursor)}
+        except (ValueError, KeyError, InvalidId) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            ) from exc
+
+    documents = (
+        await _get_collection(collection_name=collection_name)
+        .find(query, projection=projection)
+        .sort([(sort_field, -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+
+    if len(documents) > limit:
+        return documents[:limit], encode_cursor(documents[limit - 1], sort_field)
+
+    return documents, None
 
-    cursor = collection.find({"user_id": user_id})
 
-    libraries = await cursor.to_list(length=10)
+async def get_libraries(
+    user_id: UUID, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE
+):
+    libraries, next_cursor = await _paginate(
+        collection_name="library",
+        query={"user_id": user_id, "datetime_removed": None},
+        sort_field="datetime_created",
+        limit=limit,
+        cursor=cursor,
+    )
 
-    return LibraryList(libraries=libraries)
+    return LibraryList(libraries=libraries, next_cursor=next_cursor)
 
 
 async def create_library(instance: Library):
@@ -57,32 +201,102 @@ async def get_library(user_id: UUID, library_id: UUID):
         {
             "user_id": user_id,
             "uuid": library_id,
+            "datetime_removed": None,
         }
     )
 
     return resp
 
 
-async def update_library(instance: Library):
-    # collection = _get_collection(collection_name="library")
+async def _invalidate_answers(library_id: UUID):
+    """Makes the cached answers of a library miss in every server process."""
+    await _get_collection(collection_name="library").update_one(
+        {"uuid": library_id}, {"$inc": {"answer_epoch": 1}}
+    )
 
-    ...
+    invalidate_answers(library=library_id)
 
 
-async def remove_library(user_id: UUID, library_id: UUID):
-    # collection = _get_collection(collection_name="library")
+async def update_library(user_id: UUID, library_id: UUID, instance: Library):
+    """Updates the name, description and answer cache setting of a library.
 
-    ...
+    The embedding and vector store stay those the documents were stored
+    with, and retrieval settings go through `update_retrieval`.
+    """
+    collection = _get_collection(collection_name="library")
 
+    await collection.update_one(
+        {"user_id": user_id, "uuid": library_id, "datetime_removed": None},
+        {
+            "$set": {
+                "name": instance.name,
+                "description": instance.description,
+                "answer_cache": instance.answer_cache,
+            }
+        },
+    )
 
-async def get_documents(user_id: UUID, library_id: UUID):
-    collection = _get_collection(collection_name="document")
+    invalidate_chains(collection=library_id)
+    await _invalidate_answers(library_id=library_id)
+
+    return await get_library(user_id=user_id, library_id=library_id)
+
+
+async def update_retrieval(
+    user_id: UUID, library_id: UUID, settings: RetrievalSettings
+):
+    library = await get_library(user_id=user_id, library_id=library_id)
+
+    if (
+        library is not None
+        and settings.score_threshold is not None
+        and library["vectordb"] not in RELEVANCE_SCORE_VECTORDBS
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{library['vectordb']} does not support score_threshold",
+        )
+
+    collection = _get_collection(collection_name="library")
+
+    await collection.update_one(
+        {"user_id": user_id, "uuid": library_id},
+        {"$set": {"retrieval": settings.model_dump()}},
+    )
+
+    invalidate_chains(collection=library_id)
+    await _invalidate_answers(library_id=library_id)
+
+    return await get_library(user_id=user_id, library_id=library_id)
+
+
+async def remove_library(user_id: UUID, library_id: UUID):
+    collection = _get_collection(collection_name="library")
+
+    await collection.update_one(
+        {"user_id": user_id, "uuid": library_id, "datetime_removed": None},
+        {"$set": {"datetime_removed": datetime.now()}},
+    )
 
-    cursor = collection.find({"user_id": user_id, "library_id": library_id})
+    invalidate_chains(collection=library_id)
+    await _invalidate_answers(library_id=library_id)
 
-    documents = await cursor.to_list(length=20)
 
-    return DocumentList(documents=documents)
+async def get_documents(
+    user_id: UUID,
+    library_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    documents, next_cursor = await _paginate(
+        collection_name="document",
+        query={"user_id": user_id, "library_id": library_id},
+        sort_field="datetime_created",
+        limit=limit,
+        cursor=cursor,
+    )
+
+    return DocumentList(documents=documents, next_cursor=next_cursor)
 
 
 async def create_document(
@@ -123,7 +337,12 @@ async def get_document(user_id: UUID, document_id: UUID):
     return resp
 
 
-async def emb_document(user_id: UUID, document_id: UUID):
+async def emb_document(
+    user_id: UUID,
+    document_id: UUID,
+    on_progress: Optional[Callable[[int, int, Optional[float]], Awaitable]] = None,
+    checkpoint: int = 0,
+):
     collection = _get_collection(collection_name="document")
 
     document = await collection.find_one(
@@ -142,17 +361,418 @@ async def emb_document(user_id: UUID, document_id: UUID):
         }
     )
 
-    result = await process_document(
-        document_type=document["type"],
-        document_path=document["path"],
-        library_uuid=library["uuid"],
-        library_embedding=library["embedding"],
-        library_vectordb=library["vectordb"],
+    try:
+        result = await process_document(
+            document_type=document["type"],
+            document_path=document["path"],
+            library_uuid=library["uuid"],
+            library_embedding=library["embedding"],
+            library_vectordb=library["vectordb"],
+            on_progress=on_progress,
+            checkpoint=checkpoint,
+            document_uuid=document["uuid"],
+        )
+    finally:
+        # Cached answers may be outdated once any batch has been committed, and
+        # cached chains may hold a store built before the collection existed
+        await _invalidate_answers(library_id=library["uuid"])
+        invalidate_chains(collection=library["uuid"])
+
+    return result
+
+
+def _get_source_type(path: str) -> str:
+    return EXTENSION_TYPE_MAPPING.get(
+        Path(path.split("?")[0]).suffix.lower(), "web_page"
+    )
+
+
+async def _create_embed_jobs(
+    user_id: UUID, library_id: UUID, documents: list[Document]
+) -> BulkImportStatus:
+    """Inserts the documents and their embed jobs in bulk, then enqueues them.
+
+    The jobs share a batch id and are picked up by the job workers in
+    parallel, reusing the pooled vector store clients.
+    """
+    batch_id = uuid4()
+
+    jobs = [
+        Job(
+            user_id=user_id,
+            document_id=document.uuid,
+            batch_id=batch_id,
+            next_attempt_at=_get_lease_end(),
+        )
+        for document in documents
+    ]
+
+    records = []
+
+    for document in documents:
+        record = document.model_dump(by_alias=True, exclude=["id"])
+        record["path"] = str(record["path"])
+        records.append(record)
+
+    await _get_collection(collection_name="document").insert_many(records)
+
+    await _get_collection(collection_name="job").insert_many(
+        [job.model_dump(by_alias=True, exclude=["id"]) for job in jobs]
+    )
+
+    await enqueue_many([str(job.uuid) for job in jobs])
+
+    return BulkImportStatus(
+        batch_id=batch_id,
+        library_id=library_id,
+        total=len(jobs),
+        statuses={"pending": len(jobs)},
+    )
+
+
+async def import_documents(
+    user_id: UUID, library_id: UUID, sources: list[DocumentSource]
+):
+    documents = [
+        Document(
+            user_id=user_id,
+            library_id=library_id,
+            type=source.type or _get_source_type(str(source.path)),
+            path=str(source.path),
+            name=source.name or str(source.path)[-128:],
+        )
+        for source in sources
+    ]
+
+    return await _create_embed_jobs(user_id, library_id, documents)
+
+
+def _too_large(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail
+    )
+
+
+def _copy_limited(source: BinaryIO, target: BinaryIO, limit: int) -> int:
+    """Copies at most `limit` bytes and returns the number copied.
+
+    Bytes are counted as they are read, as archives may understate sizes.
+    """
+    copied = 0
+
+    while chunk := source.read(COPY_BUFFER_SIZE):
+        copied += len(chunk)
+
+        if copied > limit:
+            raise _too_large("Upload exceeds the size limit")
+
+        target.write(chunk)
+
+    return copied
+
+
+def _iter_archive(name: str, file: BinaryIO) -> Iterator[tuple[str, BinaryIO]]:
+    try:
+        with zipfile.ZipFile(file) as archive:
+            entries = [info for info in archive.infolist() if not info.is_dir()]
+
+            if len(entries) > UPLOAD_MAX_FILES:
+                raise _too_large(f"Uploads are limited to {UPLOAD_MAX_FILES} files")
+
+            for info in entries:
+                if info.file_size > UPLOAD_MAX_FILE_SIZE:
+                    raise _too_large(f"{info.filename} exceeds the size limit")
+
+                with archive.open(info) as source:
+                    yield info.filename, source
+    except zipfile.BadZipFile as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{name} is not a valid zip archive",
+        ) from exc
+
+
+def _save_uploads(
+    library_id: UUID, files: list[tuple[str, BinaryIO]]
+) -> tuple[list[tuple[str, Path]], list[str]]:
+    """Writes uploaded files to UPLOAD_DIR, unpacking zip archives.
+
+    Returns the saved files and the names of those skipped for their type.
+    Uploads of more than UPLOAD_MAX_FILES files, with a file larger than
+    UPLOAD_MAX_FILE_SIZE or over UPLOAD_MAX_TOTAL_SIZE in all are rejected,
+    and none of their files are kept.
+    """
+    directory = UPLOAD_DIR / library_id.hex
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths: list[tuple[str, Path]] = []
+    skipped: list[str] = []
+    remaining = UPLOAD_MAX_TOTAL_SIZE
+
+    try:
+        for name, file in files:
+            if Path(name).suffix.lower() == ".zip":
+                sources = _iter_archive(name, file)
+            else:
+                sources = [(name, file)]
+
+            for source_name, source in sources:
+                suffix = Path(source_name).suffix.lower()
+
+                if suffix not in EXTENSION_TYPE_MAPPING:
+                    skipped.append(source_name)
+                    continue
+
+                if len(paths) >= UPLOAD_MAX_FILES:
+                    raise _too_large(f"Uploads are limited to {UPLOAD_MAX_FILES} files")
+
+                # Stored under a generated name, so archive entries cannot escape
+                path = directory / f"{uuid4().hex}{suffix}"
+                paths.append((Path(source_name).name, path))
+
+                with open(path, "wb") as target:
+                    remaining -= _copy_limited(
+                        source, target, min(UPLOAD_MAX_FILE_SIZE, remaining)
+                    )
+    except Exception:
+        for _, path in paths:
+            path.unlink(missing_ok=True)
+
+        raise
+
+    return paths, skipped
+
+
+async def upload_documents(user_id: UUID, library_id: UUID, files: list[UploadFile]):
+    paths, skipped = await asyncio.to_thread(
+        _save_uploads,
+        library_id,
+        [(file.filename or "file", file.file) for file in files],
     )
 
+    if not paths:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "message": "No files of a supported type",
+                "supported": sorted(EXTENSION_TYPE_MAPPING),
+                "skipped": skipped,
+            },
+        )
+
+    documents = [
+        Document(
+            user_id=user_id,
+            library_id=library_id,
+            type=_get_source_type(str(path)),
+            path=str(path),
+            name=name[:128],
+        )
+        for name, path in paths
+    ]
+
+    result = await _create_embed_jobs(user_id, library_id, documents)
+    result.skipped = skipped
+
     return result
 
 
+async def get_import(user_id: UUID, library_id: UUID, batch_id: UUID):
+    collection = _get_collection(collection_name="job")
+
+    cursor = collection.find(
+        {"user_id": user_id, "batch_id": batch_id},
+        projection={"status": True, "chunks": True},
+    )
+
+    statuses: dict[str, int] = {}
+    chunks = 0
+
+    async for job in cursor:
+        statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        chunks += job.get("chunks", 0)
+
+    total = sum(statuses.values())
+    finished = statuses.get("done", 0) + statuses.get("failed", 0)
+
+    return BulkImportStatus(
+        batch_id=batch_id,
+        library_id=library_id,
+        total=total,
+        statuses=statuses,
+        chunks=chunks,
+        progress=finished / total if total else 0.0,
+    )
+
+
+async def create_embed_job(user_id: UUID, document_id: UUID):
+    collection = _get_collection(collection_name="job")
+
+    job = Job(
+        user_id=user_id, document_id=document_id, next_attempt_at=_get_lease_end()
+    )
+
+    await collection.insert_one(document=job.model_dump(by_alias=True, exclude=["id"]))
+
+    await enqueue(job_id=str(job.uuid))
+
+    return job
+
+
+async def get_job(user_id: UUID, job_id: UUID):
+    collection = _get_collection(collection_name="job")
+
+    resp = await collection.find_one({"user_id": user_id, "uuid": job_id})
+
+    return resp
+
+
+async def get_document_job(user_id: UUID, document_id: UUID):
+    collection = _get_collection(collection_name="job")
+
+    resp = await collection.find_one(
+        {"user_id": user_id, "document_id": document_id},
+        sort=[("datetime_created", -1)],
+    )
+
+    return resp
+
+
+async def _update_job(job_id: UUID, **fields):
+    collection = _get_collection(collection_name="job")
+
+    await collection.update_one(
+        {"uuid": job_id},
+        {"$set": {**fields, "datetime_updated": datetime.now()}},
+    )
+
+
+def _get_lease_end() -> datetime:
+    return datetime.now() + timedelta(seconds=JOB_LEASE)
+
+
+async def run_embed_job(job_id: str):
+    """Job handler executed by the job queue workers."""
+    collection = _get_collection(collection_name="job")
+
+    job_uuid = UUID(job_id)
+    now = datetime.now()
+
+    # Claims the job, so that duplicate queue entries of it are skipped
+    result = await collection.update_one(
+        {
+            "uuid": job_uuid,
+            "$or": [
+                {"status": "pending"},
+                {"status": "retrying", "next_attempt_at": {"$lte": now}},
+            ],
+        },
+        {
+            "$set": {
+                "status": "running",
+                "error": None,
+                "next_attempt_at": _get_lease_end(),
+                "datetime_updated": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+    )
+
+    if not result.modified_count:
+        return
+
+    job = await collection.find_one({"uuid": job_uuid})
+    attempt = job["attempts"]
+
+    async def on_progress(checkpoint: int, chunks: int, progress: Optional[float]):
+        fields = {"checkpoint": checkpoint, "chunks": chunks}
+
+        if progress is not None:
+            fields["progress"] = progress
+
+        # Progress renews the lease of a running job
+        await _update_job(job_uuid, next_attempt_at=_get_lease_end(), **fields)
+
+    try:
+        # Resumes after the last batch committed by a previous attempt
+        await emb_document(
+            user_id=job["user_id"],
+            document_id=job["document_id"],
+            on_progress=on_progress,
+            checkpoint=job.get("checkpoint", 0),
+        )
+    except Exception as exc:
+        if attempt < JOB_MAX_ATTEMPTS:
+            await _update_job(
+                job_uuid,
+                status="retrying",
+                error=repr(exc),
+                next_attempt_at=datetime.now()
+                + timedelta(seconds=get_retry_delay(attempt)),
+            )
+        else:
+            await _update_job(
+                job_uuid, status="failed", error=repr(exc), next_attempt_at=None
+            )
+
+        raise
+
+    await _update_job(job_uuid, status="done", progress=1.0, next_attempt_at=None)
+
+
+async def recover_embed_jobs(pending: bool = False) -> list[str]:
+    """Puts due retries and lost jobs back to pending, returning their ids.
+
+    Running jobs are lost with the process that stopped renewing their
+    lease. Pending jobs are only lost along with the queue holding them, so
+    they are recovered only when `pending` is set.
+    """
+    collection = _get_collection(collection_name="job")
+
+    now = datetime.now()
+
+    query = {
+        "status": {"$in": ["running", "retrying"]},
+        "next_attempt_at": {"$lte": now},
+    }
+
+    if pending:
+        query = {"$or": [query, {"status": "pending"}]}
+
+    jobs = await collection.find(
+        query,
+        projection={
+            "uuid": True,
+            "status": True,
+            "attempts": True,
+            "next_attempt_at": True,
+        },
+    ).to_list(None)
+
+    job_ids = []
+
+    for job in jobs:
+        if job["status"] == "running" and job["attempts"] >= JOB_MAX_ATTEMPTS:
+            fields = {"status": "failed", "error": "Lost", "next_attempt_at": None}
+        else:
+            fields = {"status": "pending", "next_attempt_at": _get_lease_end()}
+
+        # Skips jobs another process claimed or recovered in the meantime
+        result = await collection.update_one(
+            {
+                "uuid": job["uuid"],
+                "status": job["status"],
+                "next_attempt_at": job.get("next_attempt_at"),
+            },
+            {"$set": {**fields, "datetime_updated": now}},
+        )
+
+        if result.modified_count and fields["status"] == "pending":
+            job_ids.append(str(job["uuid"]))
+
+    return job_ids
+
+
 async def remove_document(user_id: UUID, document_id: UUID):
     # collection = _get_collection(collection_name="document")
     ...
@@ -161,6 +781,9 @@ async def remove_document(user_id: UUID, document_id: UUID):
 async def create_dialogue(user_id: UUID, instance: Dialogue):
     collection = _get_collection(collection_name="dialogue")
 
+    # Initial messages stay inline, later ones go to the message collection
+    instance.message_count = len(instance.content)
+
     await collection.insert_one(
         document=instance.model_dump(by_alias=True, exclude=["id"])
     )
@@ -168,14 +791,51 @@ async def create_dialogue(user_id: UUID, instance: Dialogue):
     return instance
 
 
-async def get_dialogues(user_id: UUID, library_id: UUID):
-    collection = _get_collection(collection_name="dialogue")
+async def get_dialogues(
+    user_id: UUID,
+    library_id: UUID,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    dialogues, next_cursor = await _paginate(
+        collection_name="dialogue",
+        query={"user_id": user_id, "library_id": library_id},
+        sort_field="datetime_updated",
+        limit=limit,
+        cursor=cursor,
+        # Dialogues stored before messages had their own collection keep their
+        # history inline, only its first message is needed for the preview
+        projection={"content": {"$slice": 1}},
+    )
 
-    cursor = collection.find({"user_id": user_id, "library_id": library_id})
+    return DialogueList(dialogues=dialogues, next_cursor=next_cursor)
 
-    dialogues = await cursor.to_list(length=20)
 
-    return DialogueList(dialogues=dialogues)
+async def _get_messages(dialogue: dict, limit: Optional[int] = None) -> list[dict]:
+    """Returns the latest `limit` messages of a dialogue, oldest first.
+
+    Messages are stored one per record, dialogues created before that keep
+    their earlier history in the `content` array of the dialogue itself.
+    """
+    collection = _get_collection(collection_name="message")
+
+    cursor = collection.find(
+        {"dialogue_id": dialogue["uuid"]},
+        projection={"_id": False, "type": True, "content": True},
+    ).sort("_id", -1)
+
+    if limit:
+        cursor = cursor.limit(limit)
+
+    messages = await cursor.to_list(length=limit)
+    messages.reverse()
+
+    legacy = dialogue.get("content") or []
+
+    if limit:
+        legacy = legacy[max(0, len(legacy) - limit + len(messages)) :]
+
+    return legacy + messages
 
 
 async def get_dialogue(user_id: UUID, dialogue_id: UUID):
@@ -188,41 +848,274 @@ async def get_dialogue(user_id: UUID, dialogue_id: UUID):
         }
     )
 
+    if resp is not None:
+        resp["content"] = await _get_messages(dialogue=resp)
+
     return resp
 
 
-async def update_dialogue(user_id: UUID, dialogue_id: UUID, user_prompt: UserPrompt):
+async def _count_messages(dialogue: dict) -> int:
+    """Backfills the message count of dialogues stored before it was kept."""
+    dialogue_collection = _get_collection(collection_name="dialogue")
+
+    legacy = await dialogue_collection.find_one(
+        {"uuid": dialogue["uuid"]}, projection={"content": True}
+    )
+
+    count = len(legacy.get("content") or []) + await _get_collection(
+        collection_name="message"
+    ).count_documents({"dialogue_id": dialogue["uuid"]})
+
+    await dialogue_collection.update_one(
+        {"uuid": dialogue["uuid"]},
+        {"$set": {"message_count": count, "summary_count": 0}},
+    )
+
+    return count
+
+
+async def _summarise_dialogue(dialogue: dict, messages: list, until: int):
+    """Folds messages leaving the history window into the dialogue summary.
+
+    Runs in the background, `until` is the number of messages the new summary
+    covers so an older summary never replaces a newer one.
+    """
+    try:
+        summary = await get_summariser(dialogue["llm"])(
+            {"summary": dialogue.get("summary") or "", "messages": messages}
+        )
+
+        await _get_collection(collection_name="dialogue").update_one(
+            {"uuid": dialogue["uuid"], "summary_count": {"$lt": until}},
+            {"$set": {"summary": summary, "summary_count": until}},
+        )
+    except Exception:
+        logger.exception("Failed to summarise dialogue %s", dialogue["uuid"])
+
+
+async def _load_dialogue(user_id: UUID, dialogue_id: UUID):
     dialogue_collection = _get_collection(collection_name="dialogue")
 
     dialogue = await dialogue_collection.find_one(
-        {"user_id": user_id, "uuid": dialogue_id}
+        {"user_id": user_id, "uuid": dialogue_id},
+        projection={"content": {"$slice": -DIALOGUE_HISTORY_WINDOW}},
     )
 
+    if "message_count" not in dialogue:
+        dialogue["message_count"] = await _count_messages(dialogue=dialogue)
+        dialogue["summary_count"] = 0
+
     library_collection = _get_collection(collection_name="library")
 
-    library = await library_collection.find_one(
-        {"user_id": user_id, "uuid": dialogue["library_id"]}
+    libraries = await library_collection.find(
+        {
+            "user_id": user_id,
+            "uuid": {"$in": [dialogue["library_id"], *dialogue.get("library_ids", [])]},
+        }
+    ).to_list(length=None)
+
+    # The library the dialogue was created in comes first
+    libraries.sort(key=lambda library: library["uuid"] != dialogue["library_id"])
+
+    messages = construct_chat_history(
+        messages=await _get_messages(dialogue=dialogue, limit=DIALOGUE_HISTORY_WINDOW)
     )
 
-    history = construct_chat_history(messages=dialogue["content"])
+    # Position of the first loaded message in the whole dialogue
+    offset = dialogue["message_count"] - len(messages)
+    start = get_window_start(messages)
+
+    # Messages leaving the window that the summary does not cover yet
+    pending = messages[max(0, dialogue["summary_count"] - offset) : start]
+
+    if pending:
+        task = asyncio.create_task(
+            _summarise_dialogue(dialogue, pending, until=offset + start)
+        )
+        summarising.add(task)
+        task.add_done_callback(summarising.discard)
+
+    history = with_summary(dialogue.get("summary"), messages[start:])
+
+    return dialogue, libraries, history
+
+
+def _get_retrieval(library: dict) -> str:
+    # Serialised to be part of the chain cache key
+    return RetrievalSettings(**library.get("retrieval") or {}).model_dump_json()
 
-    response: AIMessage = await get_prompt_processor(
-        embedding=library["embedding"],
-        vectordb=library["vectordb"],
-        collection=library["uuid"],
-        llm=dialogue["llm"],
-    )({"question": user_prompt.content, "chat_history": history})
 
-    history.append(HumanMessage(content=user_prompt.content))
-    history.append(response)
+def _get_chain_kwargs(dialogue: dict, libraries: list[dict]) -> dict:
+    library, *others = libraries
 
-    history = [
-        {"type": message.type, "content": message.content} for message in history
+    return {
+        "embedding": library["embedding"],
+        "vectordb": library["vectordb"],
+        "collection": library["uuid"],
+        "llm": dialogue["llm"],
+        "answer_cache": library.get("answer_cache", False),
+        "libraries": tuple(
+            (
+                other["embedding"],
+                other["vectordb"],
+                other["uuid"],
+                _get_retrieval(other),
+            )
+            for other in others
+        ),
+        "retrieval": _get_retrieval(library),
+    }
+
+
+def _get_chain_input(user_prompt: UserPrompt, history: list, libraries: list[dict]):
+    return {
+        "question": user_prompt.content,
+        "chat_history": history,
+        "answer_epoch": libraries[0].get("answer_epoch", 0),
+    }
+
+
+async def _save_dialogue(
+    user_id: UUID,
+    dialogue: dict,
+    user_prompt: UserPrompt,
+    response: AIMessage,
+):
+    """Appends the turn as two message records, leaving prior ones untouched."""
+    messages = [
+        Message(
+            dialogue_id=dialogue["uuid"],
+            user_id=user_id,
+            type=message.type,
+            content=message.content,
+        )
+        for message in (HumanMessage(content=user_prompt.content), response)
     ]
 
-    dialogue_collection.update_one(
-        {"user_id": user_id, "uuid": dialogue_id},
-        {"$set": {"content": history, "datetime_updated": datetime.now()}},
+    await _get_collection(collection_name="message").insert_many(
+        [message.model_dump(by_alias=True, exclude=["id"]) for message in messages]
+    )
+
+    fields = {"datetime_updated": datetime.now()}
+
+    if not dialogue["message_count"]:
+        fields["preview"] = user_prompt.content[:PREVIEW_LENGTH]
+
+    await _get_collection(collection_name="dialogue").update_one(
+        {"user_id": user_id, "uuid": dialogue["uuid"]},
+        {"$set": fields, "$inc": {"message_count": len(messages)}},
+    )
+
+
+def _get_metric_labels(dialogue: dict, libraries: list[dict]) -> dict:
+    return {
+        "vectordb": libraries[0]["vectordb"],
+        "embedding": libraries[0]["embedding"],
+        "llm": dialogue["llm"],
+    }
+
+
+async def update_dialogue(user_id: UUID, dialogue_id: UUID, user_prompt: UserPrompt):
+    with DIALOGUE_STAGE_DURATION.time(stage="load") as load_labels:
+        dialogue, libraries, history = await _load_dialogue(user_id, dialogue_id)
+        labels = _get_metric_labels(dialogue, libraries)
+        load_labels.update(labels)
+
+    response: AIMessage = await get_prompt_processor(
+        **_get_chain_kwargs(dialogue, libraries)
+    )(
+        _get_chain_input(user_prompt, history, libraries),
+        config={"callbacks": [StageTimer(**labels)]},
     )
 
+    # Streamed answers, e.g. shared by coalesced requests, add up to a chunk
+    response = AIMessage(content=response.content)
+
+    with DIALOGUE_STAGE_DURATION.time(stage="save", **labels):
+        await _save_dialogue(user_id, dialogue, user_prompt, response)
+
     return response
+
+
+async def stream_dialogue(
+    user_id: UUID, dialogue_id: UUID, user_prompt: UserPrompt
+) -> AsyncIterator[str]:
+    """Yields the response tokens as they are generated.
+
+    The completed message is persisted once the stream is exhausted, so an
+    aborted stream leaves the dialogue untouched.
+    """
+    with DIALOGUE_STAGE_DURATION.time(stage="load") as load_labels:
+        dialogue, libraries, history = await _load_dialogue(user_id, dialogue_id)
+        labels = _get_metric_labels(dialogue, libraries)
+        load_labels.update(labels)
+
+    stream = get_prompt_streamer(**_get_chain_kwargs(dialogue, libraries))(
+        _get_chain_input(user_prompt, history, libraries),
+        config={"callbacks": [StageTimer(**labels)]},
+    )
+
+    tokens = []
+
+    async for chunk in stream:
+        if chunk.content:
+            tokens.append(chunk.content)
+            yield chunk.content
+
+    response = AIMessage(content="".join(tokens))
+
+    with DIALOGUE_STAGE_DURATION.time(stage="save", **labels):
+        await _save_dialogue(user_id, dialogue, user_prompt, response)
+
+
+async def get_stats():
+    return {
+        "chain_cache": chain_cache.stats,
+        "embedding_cache": get_embedding_cache_stats(),
+        "answer_cache": answer_cache.stats,
+        "condenser": get_condenser_stats(),
+        "reranker": get_reranker_stats(),
+        "context": get_context_stats(),
+        "embedding_scheduler": get_embedding_scheduler_stats(),
+        "backends": get_backend_stats(),
+        "coalescer": get_coalescer_stats(),
+    }
+
+
+def _get_cache_stats() -> dict[str, dict]:
+    return {
+        "chain": chain_cache.stats,
+        "embedding": get_embedding_cache_stats()["local"],
+        "answer": answer_cache.stats,
+        "condenser": get_condenser_stats()["cache"],
+        "reranker": get_reranker_stats()["cache"],
+    }
+
+
+def _collect_cache_stats(field: str) -> Callable[[], dict[tuple, float]]:
+    def collect():
+        return {
+            (("cache", name),): stats[field]
+            for name, stats in _get_cache_stats().items()
+        }
+
+    return collect
+
+
+register_gauge(
+    "cache_size", "Entries held by each cache.", _collect_cache_stats("size")
+)
+register_gauge(
+    "cache_hits", "Lookups served by each cache.", _collect_cache_stats("hits")
+)
+register_gauge(
+    "cache_misses", "Lookups missed by each cache.", _collect_cache_stats("misses")
+)
+register_gauge(
+    "coalesced_requests",
+    "Requests that led or followed an identical answer in flight.",
+    lambda: {
+        (("role", role),): get_coalescer_stats()[f"{role}s"]
+        for role in ("leader", "follower")
+    },
+)
@@ -0,0 +1,194 @@
+"""bm25.py"""
+
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from threading import RLock
+from typing import Optional
+
+from app.data_connection.local import locked, matches
+from app.util.cache import LRUCache
+
+DIRECTORY = Path(os.getenv("LEXICAL_INDEX_DIR", "lexical"))
+# Libraries whose inverted index is kept in memory
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", "64"))
+
+# Okapi BM25 parameters
+K1 = 1.5
+B = 0.75
+
+WORD_PATTERN = re.compile(r"[^\W\u3400-\u9fff]+")
+CJK_PATTERN = re.compile(r"[\u3400-\u9fff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased words, plus character bigrams for CJK text without spaces."""
+    text = text.lower()
+
+    tokens = WORD_PATTERN.findall(text)
+
+    for run in CJK_PATTERN.findall(text):
+        tokens.extend(
+            run if len(run) == 1 else (run[i : i + 2] for i in range(len(run) - 1))
+        )
+
+    return tokens
+
+
+class BM25Index:
+    """Inverted index of one library, persisted as an append-only JSON lines file.
+
+    Every chunk is appended with its term frequencies at ingestion time, so
+    the index grows incrementally and is rebuilt in memory by replaying the
+    file. Chunks appended by other processes are picked up on the next query,
+    and a lock on the file keeps their lines from interleaving.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.documents: list[dict] = []
+        self.lengths: list[int] = []
+        self.postings: dict[str, dict[int, int]] = {}
+        self.total_length = 0
+        # Ids chunks were added with, if any
+        self.ids: set[str] = set()
+
+        self._offset = 0
+        self._lock = RLock()
+
+    @property
+    def _file(self) -> Path:
+        return self.path / "chunks.jsonl"
+
+    @property
+    def _lock_file(self) -> Path:
+        return self.path / "lock"
+
+    def _index(self, record: dict):
+        doc_id = len(self.documents)
+
+        if "id" in record:
+            self.ids.add(record["id"])
+
+        self.documents.append({"text": record["text"], "metadata": record["metadata"]})
+        self.lengths.append(record["length"])
+        self.total_length += record["length"]
+
+        for term, frequency in record["terms"].items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+
+    def _refresh(self):
+        with open(self._file, "a+b") as file:
+            file.seek(self._offset)
+
+            for line in file:
+                # A partially written line is read again on the next refresh
+                if not line.endswith(b"\n"):
+                    break
+
+                self._index(json.loads(line))
+                self._offset += len(line)
+
+    def __len__(self) -> int:
+        with self._lock, locked(self._lock_file):
+            self._refresh()
+
+            return len(self.documents)
+
+    def add(
+        self, texts: list[str], metadatas: list[dict], ids: Optional[list[str]] = None
+    ):
+        """Appends chunks, skipping those whose id was added before."""
+        records = []
+
+        for i, (text, metadata) in enumerate(zip(texts, metadatas, strict=True)):
+            tokens = tokenize(text)
+
+            record = {
+                "text": text,
+                "metadata": metadata,
+                "length": len(tokens),
+                "terms": Counter(tokens),
+            }
+
+            if ids is not None:
+                record["id"] = ids[i]
+
+            records.append(record)
+
+        with self._lock, locked(self._lock_file, exclusive=True):
+            self._refresh()
+
+            # A line left partial by a crashed writer would swallow the next one
+            if self._file.stat().st_size > self._offset:
+                os.truncate(self._file, self._offset)
+
+            records = [record for record in records if record.get("id") not in self.ids]
+
+            with open(self._file, "ab") as file:
+                file.writelines(
+                    json.dumps(record, ensure_ascii=False, default=str).encode() + b"\n"
+                    for record in records
+                )
+
+            self._refresh()
+
+    def search(
+        self, query: str, k: int, where: Optional[dict] = None
+    ) -> list[tuple[dict, float]]:
+        with self._lock, locked(self._lock_file):
+            self._refresh()
+
+            count = len(self.documents)
+
+            if not count:
+                return []
+
+            average_length = self.total_length / count
+            scores: dict[int, float] = {}
+
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+
+                if not postings:
+                    continue
+
+                idf = math.log(
+                    1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)
+                )
+
+                for doc_id, frequency in postings.items():
+                    if where and not matches(self.documents[doc_id]["metadata"], where):
+                        continue
+
+                    norm = K1 * (1 - B + B * self.lengths[doc_id] / average_length)
+
+                    weight = idf * frequency * (K1 + 1) / (frequency + norm)
+
+                    scores[doc_id] = scores.get(doc_id, 0.0) + weight
+
+            top = heapq.nlargest(k, scores, key=scores.get)
+
+            return [(self.documents[doc_id], scores[doc_id]) for doc_id in top]
+
+
+indexes = LRUCache(maxsize=LEXICAL_INDEX_CACHE_SIZE)
+
+_lock = RLock()
+
+
+def get_index(name: str) -> BM25Index:
+    with _lock:
+        index = indexes.get(name)
+
+        if index is None:
+            index = BM25Index(path=DIRECTORY / name)
+            indexes.set(name, index)
+
+        return index
@@ -4,10 +4,24 @@ import os
 
 from dashvector import Client
 
+from app.data_connection.manager import ClientPool
+
 API_KEY = os.getenv("DASHVECTOR_API_KEY", "")
 
 
-def get_client():
+def _create_client() -> Client:
     client = Client(api_key=API_KEY, timeout=5)
 
     return client
+
+
+pool = ClientPool(
+    name="dashvector",
+    factory=_create_client,
+    check=lambda client: bool(client.list()),
+    close=lambda client: client.close(),
+)
+
+
+def get_client() -> Client:
+    return pool.get()
@@ -0,0 +1,351 @@
+"""local.py"""
+
+import fcntl
+import json
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from threading import RLock
+from typing import Optional
+
+import numpy as np
+
+DIRECTORY = Path(os.getenv("LOCAL_VECTOR_DIR", "vectors"))
+# Libraries with at least this many chunks are searched through an IVF index
+IVF_THRESHOLD = int(os.getenv("LOCAL_IVF_THRESHOLD", "20000"))
+# Inverted lists scanned per query once the IVF index is built
+IVF_PROBES = int(os.getenv("LOCAL_IVF_PROBES", "8"))
+# Rows sampled to train the IVF centroids
+IVF_TRAINING_SIZE = 50000
+IVF_ITERATIONS = 10
+
+logger = logging.getLogger(__name__)
+
+
+def matches(metadata: dict, where: dict) -> bool:
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+@contextmanager
+def locked(path: Path, exclusive: bool = False):
+    """Holds an flock on `path` against other processes."""
+    with open(path, "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+class LocalIndex:
+    """Normalised vectors of one library in memory-mapped files.
+
+    Vectors are appended to `vectors.f32` and their documents to
+    `documents.jsonl`. Queries scan every vector until the library reaches
+    IVF_THRESHOLD rows, then only the IVF_PROBES inverted lists whose
+    centroids are nearest to the query. Rows written by other processes are
+    picked up on the next query, and a lock on the library's files keeps
+    their vectors and documents in the same order.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+        self.dim: Optional[int] = None
+        self.vectors: Optional[np.memmap] = None
+        self.documents: list[dict] = []
+        # Rows by the id they were added with, if any
+        self.ids: dict[str, int] = {}
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+
+        self._documents_offset = 0
+        self._lock = RLock()
+
+        meta = self._read_meta()
+        self.dim = meta.get("dim")
+        self.trained = meta.get("trained", 0)
+
+        if self.dim is not None:
+            with locked(self._file("lock"), exclusive=True):
+                self._refresh()
+                self._repair()
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _read_meta(self) -> dict:
+        try:
+            return json.loads(self._file("meta.json").read_text())
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self):
+        meta = {"dim": self.dim, "trained": self.trained}
+
+        self._file("meta.json").write_text(json.dumps(meta))
+
+    def _refresh(self):
+        if self.dim is None:
+            self.dim = self._read_meta().get("dim")
+
+        if self.dim is None:
+            return
+
+        with open(self._file("documents.jsonl"), "a+b") as file:
+            file.seek(self._documents_offset)
+
+            for line in file:
+                # A partially written line is read again on the next refresh
+                if not line.endswith(b"\n"):
+                    break
+
+                document = json.loads(line)
+
+                if "id" in document:
+                    self.ids[document["id"]] = len(self.documents)
+
+                self.documents.append(document)
+                self._documents_offset += len(line)
+
+        rows = len(self.documents)
+
+        # Vectors past the last document, left by a crash, are not mapped
+        if rows and self._file("vectors.f32").stat().st_size < rows * self.dim * 4:
+            raise ValueError(f"{self.path} has documents without vectors")
+
+        if self.vectors is None or len(self.vectors) != rows:
+            self.vectors = (
+                np.memmap(
+                    self._file("vectors.f32"),
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(rows, self.dim),
+                )
+                if rows
+                else np.empty((0, self.dim), dtype=np.float32)
+            )
+
+        trained = self._read_meta().get("trained", 0)
+
+        if trained != self.trained or (trained and self.centroids is None):
+            self.trained = trained
+            self._load_ivf()
+
+        if self.centroids is not None and len(self.assignments) < rows:
+            self._assign(start=len(self.assignments))
+
+    def _repair(self):
+        """Cuts what a crashed writer left after the last complete row.
+
+        Appending after an orphan vector or a partial document line would
+        shift every later row, so this runs under the exclusive lock, after
+        `_refresh`, before anything is appended.
+        """
+        sizes = {
+            "documents.jsonl": self._documents_offset,
+            "vectors.f32": len(self.documents) * self.dim * 4,
+        }
+
+        for name, size in sizes.items():
+            path = self._file(name)
+
+            if path.exists() and path.stat().st_size > size:
+                logger.warning("Truncating %s after an incomplete write", path)
+                os.truncate(path, size)
+
+    def __len__(self) -> int:
+        with self._lock, locked(self._file("lock")):
+            self._refresh()
+
+            return len(self.documents)
+
+    @staticmethod
+    def normalise(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add(
+        self,
+        vectors: list[list[float]],
+        documents: list[dict],
+        ids: Optional[list[str]] = None,
+    ) -> list[int]:
+        """Appends rows, returning their positions.
+
+        Rows whose id was added before are skipped, so adding a batch again,
+        e.g. when an ingestion resumes, does not duplicate it.
+        """
+        vectors = self.normalise(vectors)
+
+        with self._lock, locked(self._file("lock"), exclusive=True):
+            if self.dim is None:
+                self.dim = self._read_meta().get("dim")
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta()
+
+            self._refresh()
+            self._repair()
+
+            if ids is not None:
+                new = [i for i, key in enumerate(ids) if key not in self.ids]
+                vectors = vectors[new]
+                documents = [{**documents[i], "id": ids[i]} for i in new]
+
+            start = len(self.documents)
+
+            # Vectors first, so a crash never leaves a document without one.
+            # A vector left without its document is cut by the next writer
+            with open(self._file("vectors.f32"), "ab") as file:
+                file.write(vectors.tobytes())
+
+            with open(self._file("documents.jsonl"), "ab") as file:
+                file.writelines(
+                    json.dumps(document, ensure_ascii=False, default=str).encode()
+                    + b"\n"
+                    for document in documents
+                )
+
+            self._refresh()
+
+            if len(self.documents) >= max(IVF_THRESHOLD, 2 * self.trained):
+                self._train_ivf()
+
+            if ids is not None:
+                return [self.ids[key] for key in ids]
+
+            return list(range(start, len(self.documents)))
+
+    def _load_ivf(self):
+        try:
+            self.centroids = np.load(self._file("centroids.npy"))
+            self.assignments = np.fromfile(self._file("assignments.i32"), np.int32)
+        except FileNotFoundError:
+            self.centroids = self.assignments = None
+            return
+
+        self.assignments = self.assignments[: self.trained]
+
+    def _assign(self, start: int):
+        rows = np.asarray(self.vectors[start:])
+        assignments = np.argmax(rows @ self.centroids.T, axis=1).astype(np.int32)
+
+        self.assignments = np.concatenate([self.assignments, assignments])
+
+    def _train_ivf(self):
+        """Clusters the vectors with spherical k-means into sqrt(n) lists."""
+        rows = len(self.vectors)
+        lists = int(np.sqrt(rows))
+
+        generator = np.random.default_rng(0)
+        sample = np.asarray(
+            self.vectors[
+                np.sort(
+                    generator.choice(rows, min(rows, IVF_TRAINING_SIZE), replace=False)
+                )
+            ]
+        )
+
+        centroids = sample[generator.choice(len(sample), lists, replace=False)]
+
+        for _ in range(IVF_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+
+            for label in range(lists):
+                members = sample[labels == label]
+
+                if len(members):
+                    centroids[label] = members.mean(axis=0)
+
+            centroids = self.normalise(centroids)
+
+        self.centroids = centroids
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._assign(start=0)
+
+        np.save(self._file("centroids.npy"), self.centroids)
+        self.assignments.tofile(self._file("assignments.i32"))
+
+        self.trained = rows
+        self._write_meta()
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+
+        probes = np.argsort(self.centroids @ query)[-IVF_PROBES:]
+
+        return np.flatnonzero(np.isin(self.assignments, probes))
+
+    def search(
+        self, vector: list[float], k: int, where: Optional[dict] = None
+    ) -> list[tuple[int, float]]:
+        """Returns the ids and cosine similarities of the `k` nearest rows.
+
+        `where` restricts the search to rows whose metadata has its values.
+        """
+        query = self.normalise(vector)
+
+        with self._lock, locked(self._file("lock")):
+            self._refresh()
+
+            if self.dim is None or not self.documents:
+                return []
+
+            candidates = self._candidates(query)
+
+            if where:
+                allowed = np.flatnonzero(
+                    [
+                        matches(document["metadata"], where)
+                        for document in self.documents
+                    ]
+                )
+                candidates = (
+                    allowed
+                    if candidates is None
+                    else np.intersect1d(candidates, allowed)
+                )
+
+            if candidates is None:
+                scores = self.vectors @ query
+                candidates = np.arange(len(scores))
+            else:
+                scores = self.vectors[candidates] @ query
+
+        if not len(scores):
+            return []
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def get_vectors(self, ids: list[int]) -> np.ndarray:
+        with self._lock:
+            return np.asarray(self.vectors[ids])
+
+    def get_documents(self, ids: list[int]) -> list[dict]:
+        with self._lock:
+            return [self.documents[i] for i in ids]
+
+
+indexes: dict[str, LocalIndex] = {}
+
+_lock = RLock()
+
+
+def get_index(name: str) -> LocalIndex:
+    with _lock:
+        if name not in indexes:
+            indexes[name] = LocalIndex(path=DIRECTORY / name)
+
+        return indexes[name]
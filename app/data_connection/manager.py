@@ -0,0 +1,200 @@
+"""manager.py"""
+
+import asyncio
+import inspect
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, Callable, Optional
+
+HEALTH_CHECK_INTERVAL = float(os.getenv("CONNECTION_HEALTH_CHECK_INTERVAL", "30"))
+# Consecutive failed checks before a client is replaced
+HEALTH_CHECK_FAILURES = int(os.getenv("CONNECTION_HEALTH_CHECK_FAILURES", "3"))
+# Seconds a replaced client is kept open for the requests still using it
+CLIENT_DRAIN_TIMEOUT = float(os.getenv("CONNECTION_DRAIN_TIMEOUT", "30"))
+
+logger = logging.getLogger(__name__)
+
+pools: dict[str, "ClientPool"] = {}
+
+
+def get_pool_size(backend: str, default: int = 10) -> int:
+    return int(os.getenv(f"{backend.upper()}_POOL_SIZE", str(default)))
+
+
+class ClientPool:
+    """Lazily creates one client per backend and reuses it process-wide.
+
+    The client is created on first use. When a `check` callable is given, the
+    client is health-checked at most once every `HEALTH_CHECK_INTERVAL`
+    seconds by `acheck`, which `monitor_clients` runs in the background and
+    `aget` before handing the client out. A client failing
+    HEALTH_CHECK_FAILURES checks in a row is replaced and the `listeners`
+    are told, so objects holding it drop it, and it is closed once the
+    requests still using it had CLIENT_DRAIN_TIMEOUT seconds to finish.
+    Clients that `reconnect` by themselves are only reported, never
+    replaced. `check` and `close` may be coroutine functions, sync checks
+    run in a thread so they never block the event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        check: Optional[Callable[[Any], Any]] = None,
+        close: Optional[Callable[[Any], Any]] = None,
+        reconnects: bool = False,
+    ):
+        self.name = name
+        self.factory = factory
+        self.check = check
+        self.close_client = close
+        self.reconnects = reconnects
+
+        self.client = None
+        self.last_checked = 0.0
+        self.failures = 0
+
+        self._lock = Lock()
+        # Replaced clients by the task closing them
+        self._draining: dict[asyncio.Task, Any] = {}
+
+        pools[name] = self
+
+    def _create(self):
+        self.client = self.factory()
+        self.last_checked = time.monotonic()
+
+        logger.info("Created %s client", self.name)
+
+        return self.client
+
+    def _check_due(self) -> bool:
+        return (
+            self.check is not None
+            and self.client is not None
+            and time.monotonic() - self.last_checked > HEALTH_CHECK_INTERVAL
+        )
+
+    def _verify(self, result):
+        # Checks either raise or return False when the client is unhealthy
+        if result is False:
+            raise ConnectionError(f"{self.name} client is unhealthy")
+
+    def get(self):
+        with self._lock:
+            if self.client is None:
+                return self._create()
+
+            return self.client
+
+    async def aget(self):
+        if self._check_due():
+            await self.acheck()
+
+        return self.get()
+
+    async def acheck(self):
+        """Health-checks the client, replacing it if the check fails."""
+        client = self.client
+
+        if client is None or self.check is None:
+            return
+
+        self.last_checked = time.monotonic()
+
+        try:
+            if inspect.iscoroutinefunction(self.check):
+                result = await self.check(client)
+            else:
+                result = await asyncio.to_thread(self.check, client)
+
+            self._verify(result)
+            self.failures = 0
+            return
+        except Exception:
+            self.failures += 1
+            logger.warning(
+                "Health check %d failed for %s client", self.failures, self.name
+            )
+
+        if self.reconnects or self.failures < HEALTH_CHECK_FAILURES:
+            return
+
+        with self._lock:
+            # Another caller may have replaced it during the check
+            if self.client is not client:
+                return
+
+            self.client = None
+            self.failures = 0
+
+        # Holders drop the old client before it is closed
+        for listener in listeners:
+            try:
+                listener(self.name)
+            except Exception:
+                logger.exception("Failed to notify %s client replacement", self.name)
+
+        task = asyncio.create_task(self._drain(client))
+        self._draining[task] = client
+        task.add_done_callback(self._draining.pop)
+
+    async def _drain(self, client):
+        """Closes a replaced client once requests using it had time to end."""
+        await asyncio.sleep(CLIENT_DRAIN_TIMEOUT)
+        await self._aclose_client(client)
+
+    async def _aclose_client(self, client):
+        if self.close_client is None:
+            return
+
+        try:
+            result = self.close_client(client)
+
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.warning("Failed to close %s client", self.name)
+
+    async def aclose(self):
+        # Replaced clients still draining are closed right away
+        draining = [
+            client for task, client in list(self._draining.items()) if task.cancel()
+        ]
+
+        await asyncio.gather(*(self._aclose_client(client) for client in draining))
+
+        with self._lock:
+            client, self.client = self.client, None
+
+        if client is not None:
+            await self._aclose_client(client)
+
+
+# Called with a pool's name after its client was replaced
+listeners: list[Callable[[str], Any]] = []
+
+
+def on_replace(listener: Callable[[str], Any]):
+    listeners.append(listener)
+
+
+async def check_clients():
+    await asyncio.gather(*(pool.acheck() for pool in list(pools.values())))
+
+
+async def monitor_clients():
+    """Health-checks the pooled clients until cancelled."""
+    while True:
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+        try:
+            await check_clients()
+        except Exception:
+            logger.exception("Failed to check clients")
+
+
+async def close_clients():
+    await asyncio.gather(*(pool.aclose() for pool in pools.values()))
@@ -2,11 +2,33 @@
 
 import os
 
-from pymilvus import connections
+from pymilvus import connections, utility
+
+from app.data_connection.manager import ClientPool
 
 URI = os.getenv("MILVUS_URI", "")
 API_KEY = os.getenv("MILVUS_API_KEY", "")
+ALIAS = "default"
+
+
+def get_connection_args() -> dict:
+    return {"uri": URI, "token": API_KEY, "secure": URI.startswith("https")}
+
+
+def _connect() -> str:
+    # langchain's Milvus wrapper reuses any open connection to the same address
+    connections.connect(alias=ALIAS, **get_connection_args())
+
+    return ALIAS
+
+
+pool = ClientPool(
+    name="milvus",
+    factory=_connect,
+    check=lambda alias: utility.get_server_version(using=alias),
+    close=lambda alias: connections.disconnect(alias),
+)
 
 
-def make_connection():
-    connections.connect(uri=URI, token=API_KEY)
+def make_connection() -> str:
+    return pool.get()
@@ -4,17 +4,33 @@ import os
 
 from motor import motor_asyncio as motor
 
+from app.data_connection.manager import ClientPool, get_pool_size
+
 URI = os.getenv("MONGO_URI", "")
+POOL_SIZE = get_pool_size("mongo", default=100)
 
-client = None
 
+def _create_client() -> motor.AsyncIOMotorClient:
+    # Explicitly set uuidRepresentation = "standard" to handle UUID fields
+    # Reference: https://pymongo.readthedocs.io/en/stable/examples/uuid.html
+    return motor.AsyncIOMotorClient(
+        URI, uuidRepresentation="standard", maxPoolSize=POOL_SIZE
+    )
 
-def get_client() -> motor.AsyncIOMotorClient:
-    global client
 
-    if client is None:
-        # Explicitly set uuidRepresentation = "standard" to handle UUID fields
-        # Reference: https://pymongo.readthedocs.io/en/stable/examples/uuid.html
-        client = motor.AsyncIOMotorClient(URI, uuidRepresentation="standard")
+async def _ping(client: motor.AsyncIOMotorClient):
+    return await client.admin.command("ping")
+
 
-    return client
+pool = ClientPool(
+    name="mongo",
+    factory=_create_client,
+    check=_ping,
+    close=lambda client: client.close(),
+    # Motor reconnects by itself, failed pings are only reported
+    reconnects=True,
+)
+
+
+def get_client() -> motor.AsyncIOMotorClient:
+    return pool.get()
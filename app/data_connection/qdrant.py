@@ -2,13 +2,58 @@
 
 import os
 
-from qdrant_client import QdrantClient
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from app.data_connection.manager import ClientPool, get_pool_size
 
 URI = os.getenv("QDRANT_URI", "")
 API_KEY = os.getenv("QDRANT_API_KEY", "")
+POOL_SIZE = get_pool_size("qdrant")
+
+
+def _get_limits() -> httpx.Limits:
+    return httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+
+
+def _create_client() -> QdrantClient:
+    return QdrantClient(url=URI, api_key=API_KEY, limits=_get_limits())
+
+
+def _create_async_client() -> AsyncQdrantClient:
+    return AsyncQdrantClient(url=URI, api_key=API_KEY, limits=_get_limits())
+
+
+async def _acheck(client: AsyncQdrantClient):
+    return await client.get_collections()
+
+
+async def _aclose(client: AsyncQdrantClient):
+    await client.close()
+
+
+pool = ClientPool(
+    name="qdrant",
+    factory=_create_client,
+    check=lambda client: client.get_collections(),
+    close=lambda client: client.close(),
+    # httpx reconnects by itself, failed checks are only reported
+    reconnects=True,
+)
+
+async_pool = ClientPool(
+    name="qdrant_async",
+    factory=_create_async_client,
+    check=_acheck,
+    close=_aclose,
+    # httpx reconnects by itself, failed checks are only reported
+    reconnects=True,
+)
+
 
+def get_client() -> QdrantClient:
+    return pool.get()
 
-def get_client():
-    client = QdrantClient(url=URI, api_key=API_KEY)
 
-    return client
+def get_async_client() -> AsyncQdrantClient:
+    return async_pool.get()
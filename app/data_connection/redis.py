@@ -2,17 +2,32 @@
 
 import os
 
+from redis import ConnectionPool as SyncConnectionPool
+from redis import Redis as SyncRedis
 from redis import asyncio as redis
 
+from app.data_connection.manager import ClientPool, get_pool_size
+
 URI = os.getenv("REDIS_URI", "")
+POOL_SIZE = get_pool_size("redis", default=50)
+
+pool = ClientPool(
+    name="redis",
+    factory=lambda: redis.ConnectionPool.from_url(url=URI, max_connections=POOL_SIZE),
+    close=lambda connection_pool: connection_pool.disconnect(),
+)
 
-pool = None
+# Blocking client for code running in executor threads, e.g. sync embeddings
+sync_pool = ClientPool(
+    name="redis_sync",
+    factory=lambda: SyncConnectionPool.from_url(url=URI, max_connections=POOL_SIZE),
+    close=lambda connection_pool: connection_pool.disconnect(),
+)
 
 
-def get_client():
-    global pool
+def get_client() -> redis.Redis:
+    return redis.Redis(connection_pool=pool.get())
 
-    if pool is None:
-        pool = redis.ConnectionPool.from_url(url=URI)
 
-    return redis.Redis.from_pool(connection_pool=pool)
+def get_sync_client() -> SyncRedis:
+    return SyncRedis(connection_pool=sync_pool.get())
@@ -0,0 +1,94 @@
+"""test_bm25.py"""
+
+from app.data_connection import bm25
+from app.data_connection.bm25 import BM25Index, get_index, tokenize
+from app.util.cache import LRUCache
+
+TEXTS = [
+    "BM25 ranks documents by term frequency",
+    "Vector search ranks documents by embedding similarity",
+    "Reciprocal rank fusion merges keyword and vector results",
+]
+
+
+def make_index(path) -> BM25Index:
+    index = BM25Index(path=path)
+    index.add(TEXTS, [{"topic": i % 2} for i in range(len(TEXTS))])
+
+    return index
+
+
+def test_tokenize_words_and_cjk_bigrams():
+    assert tokenize("BM25, ranks!") == ["bm25", "ranks"]
+    assert tokenize("向量检索") == ["向量", "量检", "检索"]
+    assert tokenize("库") == ["库"]
+
+
+def test_search_ranks_matching_chunks(tmp_path):
+    index = make_index(tmp_path)
+
+    results = index.search("term frequency", 3)
+
+    assert [document["text"] for document, _ in results] == [TEXTS[0]]
+
+    results = index.search("ranks documents", 3)
+
+    assert {document["text"] for document, _ in results} == set(TEXTS[:2])
+    assert results[0][1] >= results[1][1] > 0
+
+
+def test_search_where_and_empty(tmp_path):
+    index = make_index(tmp_path)
+
+    results = index.search("ranks", 3, where={"topic": 1})
+
+    assert [document["text"] for document, _ in results] == [TEXTS[1]]
+    assert index.search("unknown words", 3) == []
+    assert BM25Index(path=tmp_path / "empty").search("ranks", 3) == []
+
+
+def test_appends_are_replayed_by_other_instances(tmp_path):
+    index = make_index(tmp_path)
+    other = BM25Index(path=tmp_path)
+
+    assert len(other) == 3
+
+    index.add(["Late chunk about fusion"], [{}])
+
+    assert len(other) == 4
+    assert other.search("late", 1)[0][0]["text"] == "Late chunk about fusion"
+
+
+def test_known_ids_are_skipped(tmp_path):
+    index = BM25Index(path=tmp_path)
+
+    index.add(TEXTS, [{}] * 3, ids=["a", "b", "c"])
+    index.add(TEXTS, [{}] * 3, ids=["a", "b", "c"])
+
+    assert len(BM25Index(path=tmp_path)) == 3
+
+
+def test_partial_line_is_cut_before_next_add(tmp_path):
+    index = make_index(tmp_path)
+
+    with open(tmp_path / "chunks.jsonl", "ab") as file:
+        file.write(b'{"text": "tor')
+
+    index.add(["Chunk after a crash"], [{}])
+
+    assert len(BM25Index(path=tmp_path)) == 4
+
+
+def test_cached_indexes_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(bm25, "DIRECTORY", tmp_path)
+    monkeypatch.setattr(bm25, "indexes", LRUCache(maxsize=2))
+
+    first = get_index("first")
+
+    assert get_index("first") is first
+
+    get_index("second")
+    get_index("third")
+
+    assert len(bm25.indexes) == 2
+    assert get_index("first") is not first
@@ -0,0 +1,111 @@
+"""test_local.py"""
+
+import numpy as np
+import pytest
+
+from app.data_connection import local
+from app.data_connection.local import LocalIndex
+
+
+def make_rows(count: int, dim: int = 8) -> tuple[np.ndarray, list[dict]]:
+    vectors = np.random.default_rng(0).normal(size=(count, dim))
+    documents = [
+        {"page_content": f"chunk {i}", "metadata": {"parity": i % 2}}
+        for i in range(count)
+    ]
+
+    return vectors, documents
+
+
+def test_search_empty(tmp_path):
+    index = LocalIndex(path=tmp_path)
+
+    assert index.search([1.0, 0.0], 4) == []
+    assert len(index) == 0
+
+
+def test_search_brute_force(tmp_path):
+    vectors, documents = make_rows(50)
+    index = LocalIndex(path=tmp_path)
+    index.add(vectors.tolist(), documents)
+
+    results = index.search(vectors[7].tolist(), 3)
+
+    assert len(results) == 3
+    assert results[0][0] == 7
+    assert results[0][1] == pytest.approx(1.0)
+    assert [score for _, score in results] == sorted(
+        (score for _, score in results), reverse=True
+    )
+    assert index.centroids is None
+
+
+def test_search_ivf(tmp_path, monkeypatch):
+    monkeypatch.setattr(local, "IVF_THRESHOLD", 100)
+    vectors, documents = make_rows(200)
+    index = LocalIndex(path=tmp_path)
+    index.add(vectors.tolist(), documents)
+
+    assert index.centroids is not None
+    assert len(index.assignments) == 200
+
+    for row in (0, 99, 199):
+        assert index.search(vectors[row].tolist(), 1)[0][0] == row
+
+
+def test_search_where(tmp_path):
+    vectors, documents = make_rows(20)
+    index = LocalIndex(path=tmp_path)
+    index.add(vectors.tolist(), documents)
+
+    results = index.search(vectors[4].tolist(), 20, where={"parity": 1})
+
+    assert len(results) == 10
+    assert all(i % 2 for i, _ in results)
+    assert index.search(vectors[4].tolist(), 4, where={"parity": 2}) == []
+
+
+def test_add_skips_known_ids(tmp_path):
+    vectors, documents = make_rows(4)
+    ids = [f"id-{i}" for i in range(4)]
+    index = LocalIndex(path=tmp_path)
+
+    assert index.add(vectors.tolist(), documents, ids) == [0, 1, 2, 3]
+    assert index.add(vectors.tolist(), documents, ids) == [0, 1, 2, 3]
+    assert len(LocalIndex(path=tmp_path)) == 4
+
+
+def test_orphan_vector_is_cut_before_next_add(tmp_path):
+    vectors, documents = make_rows(3)
+    LocalIndex(path=tmp_path).add(vectors[:1].tolist(), documents[:1])
+
+    # A crash between the two appends leaves a vector without its document
+    with open(tmp_path / "vectors.f32", "ab") as file:
+        file.write(LocalIndex.normalise(vectors[1]).tobytes())
+
+    index = LocalIndex(path=tmp_path)
+    index.add(vectors[2:].tolist(), documents[2:])
+
+    assert len(index) == 2
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 8 * 4
+
+    [(row, score)] = index.search(vectors[2].tolist(), 1)
+
+    assert index.get_documents([row])[0]["page_content"] == "chunk 2"
+    assert score == pytest.approx(1.0)
+
+
+def test_partial_document_line_is_cut_before_next_add(tmp_path):
+    vectors, documents = make_rows(2)
+    index = LocalIndex(path=tmp_path)
+    index.add(vectors[:1].tolist(), documents[:1])
+
+    with open(tmp_path / "documents.jsonl", "ab") as file:
+        file.write(b'{"page_content": "tor')
+
+    index.add(vectors[1:].tolist(), documents[1:])
+
+    reopened = LocalIndex(path=tmp_path)
+
+    assert len(reopened) == 2
+    assert reopened.get_documents([1])[0]["page_content"] == "chunk 1"
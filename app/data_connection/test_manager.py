@@ -0,0 +1,115 @@
+"""test_manager.py"""
+
+import asyncio
+import itertools
+
+import pytest
+
+from app.data_connection import manager
+from app.data_connection.manager import ClientPool
+
+
+class Client:
+    def __init__(self, number: int):
+        self.number = number
+        self.healthy = True
+        self.closed = False
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(manager, "HEALTH_CHECK_FAILURES", 2)
+    monkeypatch.setattr(manager, "CLIENT_DRAIN_TIMEOUT", 60)
+
+    numbers = itertools.count()
+    names = []
+
+    def make_pool(**kwargs) -> ClientPool:
+        names.append(f"test_{len(names)}")
+
+        return ClientPool(
+            name=names[-1],
+            factory=lambda: Client(next(numbers)),
+            check=lambda client: client.healthy,
+            close=lambda client: setattr(client, "closed", True),
+            **kwargs,
+        )
+
+    yield make_pool
+
+    for name in names:
+        manager.pools.pop(name, None)
+
+
+def test_transient_failure_keeps_client(make_pool):
+    async def main():
+        pool = make_pool()
+        client = pool.get()
+
+        client.healthy = False
+        await pool.acheck()
+        client.healthy = True
+        await pool.acheck()
+        client.healthy = False
+        await pool.acheck()
+
+        assert pool.get() is client
+        assert pool.failures == 1
+
+    asyncio.run(main())
+
+
+def test_consecutive_failures_replace_and_drain_client(make_pool, monkeypatch):
+    replaced = []
+    monkeypatch.setattr(manager, "listeners", [replaced.append])
+
+    async def main():
+        pool = make_pool()
+        client = pool.get()
+        client.healthy = False
+
+        await pool.acheck()
+        await pool.acheck()
+
+        assert replaced == [pool.name]
+        assert pool.get() is not client
+        # Requests still holding the old client can finish with it
+        assert not client.closed
+
+        await pool.aclose()
+
+        assert client.closed
+
+    asyncio.run(main())
+
+
+def test_replaced_client_is_closed_after_drain(make_pool, monkeypatch):
+    monkeypatch.setattr(manager, "CLIENT_DRAIN_TIMEOUT", 0.01)
+
+    async def main():
+        pool = make_pool()
+        client = pool.get()
+        client.healthy = False
+
+        await pool.acheck()
+        await pool.acheck()
+        await asyncio.sleep(0.05)
+
+        assert client.closed
+
+    asyncio.run(main())
+
+
+def test_reconnecting_client_is_never_replaced(make_pool):
+    async def main():
+        pool = make_pool(reconnects=True)
+        client = pool.get()
+        client.healthy = False
+
+        for _ in range(5):
+            await pool.acheck()
+
+        assert pool.get() is client
+        assert not client.closed
+
+    asyncio.run(main())
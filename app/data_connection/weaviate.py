@@ -3,12 +3,36 @@
 import os
 
 from weaviate import AuthApiKey, Client
+from weaviate.config import Config, ConnectionConfig
+
+from app.data_connection.manager import ClientPool, get_pool_size
 
 URI = os.getenv("WEAVIATE_URI", "")
 API_KEY = os.getenv("WEAVIATE_API_KEY", "")
+POOL_SIZE = get_pool_size("weaviate", default=20)
 
 
-def get_client():
+def _create_client() -> Client:
     auth_config = AuthApiKey(api_key=API_KEY)
-    client = Client(url=URI, auth_client_secret=auth_config)
+    connection_config = ConnectionConfig(
+        session_pool_connections=POOL_SIZE, session_pool_maxsize=POOL_SIZE
+    )
+    client = Client(
+        url=URI,
+        auth_client_secret=auth_config,
+        additional_config=Config(connection_config=connection_config),
+    )
     return client
+
+
+pool = ClientPool(
+    name="weaviate",
+    factory=_create_client,
+    check=lambda client: client.is_ready(),
+    # The HTTP session reconnects by itself, failed checks are only reported
+    reconnects=True,
+)
+
+
+def get_client() -> Client:
+    return pool.get()
@@ -1,161 +1,269 @@
 """document_processor.py"""
 
+import asyncio
 import os
-from uuid import UUID
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
+from uuid import UUID, uuid5
 
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, WebBaseLoader
-from langchain_community.embeddings.cohere import CohereEmbeddings
-from langchain_community.embeddings.dashscope import DashScopeEmbeddings
-from langchain_community.vectorstores.dashvector import DashVector
-from langchain_community.vectorstores.milvus import Milvus
-from langchain_community.vectorstores.qdrant import Qdrant
-from langchain_community.vectorstores.weaviate import Weaviate
 
-from app.data_connection.dashvector import get_client as get_dashvector_client
-from app.data_connection.weaviate import get_client as get_weaviate_client
+from app.backends import add_documents, ensure_collection, get_vectorstore
+from app.data_connection.bm25 import get_index as get_lexical_index
+from app.metrics import INGESTION_STAGE_DURATION
+from app.util.registry import Registry
+
+# "process" suits CPU-bound PDF extraction, "thread" avoids pickling overhead
+PARSER_EXECUTOR = os.getenv("PARSER_EXECUTOR", "thread")
+PARSER_MAX_WORKERS = int(os.getenv("PARSER_MAX_WORKERS", "2"))
+
+# Chunks embedded and upserted per vector store call, split further into
+# concurrent provider-sized requests by the embedding scheduler
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+# Parsed batches buffered ahead of the embedding step
+EMBED_PREFETCH = int(os.getenv("EMBED_PREFETCH", "2"))
+
+executor = None
+
+
+def get_executor() -> Executor:
+    global executor
+
+    if executor is None:
+        if PARSER_EXECUTOR == "process":
+            executor = ProcessPoolExecutor(max_workers=PARSER_MAX_WORKERS)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=PARSER_MAX_WORKERS, thread_name_prefix="parser"
+            )
+
+    return executor
+
+
+def shutdown_executor():
+    global executor
+
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+        executor = None
 
 
 def get_pdf_loader(document_path: str):
+    from langchain_community.document_loaders import PyPDFLoader
+
     loader = PyPDFLoader(file_path=document_path)
 
     return loader
 
 
 def get_web_page_loader(document_path: str):
+    from langchain_community.document_loaders import WebBaseLoader
+
     loader = WebBaseLoader(web_path=document_path)
 
     return loader
 
 
-def get_cohere_embedding():
-    # return CohereEmbeddings(
-    #     model="embed-multilingual-light-v3.0", max_retries=5, request_timeout=20
-    # )
-    return CohereEmbeddings(max_retries=5, request_timeout=20)
+def count_pdf_pages(document_path: str) -> Optional[int]:
+    from pypdf import PdfReader
 
+    # Remote documents are only downloaded by their loader
+    if not os.path.isfile(document_path):
+        return None
 
-def get_dashscope_embedding():
-    return DashScopeEmbeddings(model="text-embedding-v2", max_retries=5)
+    return len(PdfReader(document_path).pages)
 
 
-async def get_dashvector_collection(
-    library_embedding: str, library_uuid: UUID, documents: list[Document]
-):
-    client = get_dashvector_client()
+def get_progress(batch: list[Document], pages: Optional[int]) -> Optional[float]:
+    """Share of the pages committed up to the last chunk of `batch`."""
+    page = batch[-1].metadata.get("page")
 
-    # character must be in [a-zA-Z0-9] and symbols[_, -] and length must be in [3,32]
-    collection_name = library_uuid.hex
+    if not pages or not isinstance(page, int):
+        return None
 
-    collection = client.get(name=collection_name)
+    return min((page + 1) / pages, 1.0)
 
-    if not collection:
-        instance = await DashVector.afrom_documents(
-            documents=documents,
-            embedding=EMBEDDING_MAPPING[library_embedding](),
-            collection_name=collection_name,
-        )
-    else:
-        instance = await DashVector(
-            collection=collection,
-            embedding=EMBEDDING_MAPPING[library_embedding](),
-            text_field="text",
-        ).aadd_documents(
-            documents=documents,
-        )
 
-    return instance
+def get_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200,
+        add_start_index=True,
+    )
 
 
-async def get_milvus_collection(
-    library_embedding: str, library_uuid: UUID, documents: list[Document]
-):
-    instance = await Milvus.afrom_documents(
-        documents=documents,
-        embedding=EMBEDDING_MAPPING[library_embedding](),
-        # The first character of a collection name must be an underscore or letter
-        collection_name=f"_{library_uuid.hex}",
-        connection_args={
-            "uri": os.getenv("MILVUS_URI", ""),
-            "token": os.getenv("MILVUS_API_KEY", ""),
-            "secure": os.getenv("MILVUS_URI", "").startswith("https"),
-        },
-    )
+def load_and_split(document_type: str, document_path: str) -> list[Document]:
+    """Parses and splits a whole document, blocking; run it in the parser executor."""
+    loader = LOADER_MAPPING[document_type](document_path=document_path)
 
-    return instance
+    return get_splitter().split_documents(documents=loader.load())
 
 
-async def get_qdrant_collection(
-    library_embedding: str, library_uuid: UUID, documents: list[Document]
-):
-    instance = await Qdrant.afrom_documents(
-        documents=documents,
-        embedding=EMBEDDING_MAPPING[library_embedding](),
-        collection_name=library_uuid.hex,
-        prefer_grpc=True,
-        url=os.getenv("QDRANT_URI", ""),
-        api_key=os.getenv("QDRANT_API_KEY", ""),
+def iter_batches(
+    document_type: str, document_path: str, batch_size: int
+) -> Iterator[list[Document]]:
+    """Lazily parses a document page by page and yields batches of chunks."""
+    loader = LOADER_MAPPING[document_type](document_path=document_path)
+
+    splitter = get_splitter()
+
+    chunks = (
+        chunk
+        for page in loader.lazy_load()
+        for chunk in splitter.split_documents(documents=[page])
     )
 
-    return instance
+    while batch := list(islice(chunks, batch_size)):
+        yield batch
 
 
-async def get_weaviate_collection(
-    library_embedding: str, library_uuid: UUID, documents: list[Document]
-):
-    instance = await Weaviate.afrom_documents(
-        client=get_weaviate_client(),
-        documents=documents,
-        index_name=f"collection_{library_uuid.hex}",
-        embedding=EMBEDDING_MAPPING[library_embedding](),
-        by_text=False,
-    )
+async def aiter_batches(
+    document_type: str, document_path: str, batch_size: int = EMBED_BATCH_SIZE
+) -> AsyncIterator[list[Document]]:
+    """Yields batches of chunks parsed in the parser executor.
 
-    return instance
+    A producer parses ahead into a queue holding at most EMBED_PREFETCH
+    batches, so parsing overlaps with embedding but never runs away from it.
+    """
+    loop = asyncio.get_running_loop()
 
+    if PARSER_EXECUTOR == "process":
+        # Generators cannot cross process boundaries, so parse in one go
+        with INGESTION_STAGE_DURATION.time(stage="parse"):
+            chunks = await loop.run_in_executor(
+                get_executor(), load_and_split, document_type, document_path
+            )
 
-async def process_document(
-    document_type: str,
-    document_path: str,
-    library_uuid: UUID,
-    library_embedding: str,
-    library_vectordb: str,
-):
-    loader = LOADER_MAPPING[document_type](document_path=document_path)
+        for start in range(0, len(chunks), batch_size):
+            yield chunks[start : start + batch_size]
 
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        add_start_index=True,
-    )
+        return
 
-    splitted_documents = splitter.split_documents(documents=loader.load())
+    batches = iter_batches(document_type, document_path, batch_size)
 
-    await VECTORDB_MAPPING[library_vectordb](
-        library_embedding=library_embedding,
-        library_uuid=library_uuid,
-        documents=splitted_documents,
-    )
+    queue: asyncio.Queue = asyncio.Queue(maxsize=EMBED_PREFETCH)
 
-    return True
+    async def produce():
+        try:
+            while True:
+                with INGESTION_STAGE_DURATION.time(stage="parse"):
+                    batch = await loop.run_in_executor(
+                        get_executor(), next, batches, None
+                    )
 
+                if not batch:
+                    break
 
-EMBEDDING_MAPPING = {
-    "cohere": get_cohere_embedding,
-    "dashscope": get_dashscope_embedding,
-}
+                await queue.put(batch)
+        except Exception as exc:
+            await queue.put(exc)
+        else:
+            await queue.put(None)
 
+    producer = asyncio.create_task(produce())
 
-VECTORDB_MAPPING = {
-    "dashvector": get_dashvector_collection,
-    "milvus": get_milvus_collection,
-    "qdrant": get_qdrant_collection,
-    "weaviate": get_weaviate_collection,
-}
+    try:
+        while (batch := await queue.get()) is not None:
+            if isinstance(batch, Exception):
+                raise batch
+
+            yield batch
+    finally:
+        producer.cancel()
 
 
-LOADER_MAPPING = {
-    "pdf": get_pdf_loader,
-    "web_page": get_web_page_loader,
+async def process_document(
+    document_type: str,
+    document_path: str,
+    library_uuid: UUID,
+    library_embedding: str,
+    library_vectordb: str,
+    on_progress: Optional[Callable[[int, int, Optional[float]], Awaitable]] = None,
+    checkpoint: int = 0,
+    batch_size: int = EMBED_BATCH_SIZE,
+    document_uuid: Optional[UUID] = None,
+):
+    """Embeds a document into the library's collection batch by batch.
+
+    `on_progress` is awaited after every committed batch with the number of
+    committed batches and chunks, and the share of the document committed
+    when its page count is known. Passing the last reported batch count as
+    `checkpoint` resumes a failed ingestion after the last committed batch.
+    Chunks are stored under ids derived from `document_uuid` and their
+    position, so a batch stored again on resume replaces its first copy.
+
+    Returns:
+        int: Number of chunks in the document.
+    """
+    instance = None
+    pages = None
+
+    if (count_pages := PAGE_COUNT_MAPPING.get(document_type)) is not None:
+        try:
+            pages = await asyncio.to_thread(count_pages, document_path)
+        except Exception:
+            # Unreadable documents fail with the loader's error instead
+            pages = None
+
+    batch_count = chunk_count = 0
+
+    labels = {"vectordb": library_vectordb, "embedding": library_embedding}
+
+    async for batch in aiter_batches(document_type, document_path, batch_size):
+        batch_count += 1
+        chunk_count += len(batch)
+
+        if batch_count <= checkpoint:
+            continue
+
+        ids = (
+            [
+                str(uuid5(document_uuid, str(ordinal)))
+                for ordinal in range(chunk_count - len(batch), chunk_count)
+            ]
+            if document_uuid is not None
+            else None
+        )
+
+        # Embedding and upserting are one call to the vector store
+        with INGESTION_STAGE_DURATION.time(stage="embed_store", **labels):
+            if instance is None:
+                await ensure_collection(
+                    library_vectordb, library_embedding, library_uuid
+                )
+                instance = get_vectorstore(
+                    library_vectordb, library_embedding, library_uuid
+                )
+
+            await add_documents(library_vectordb, instance, batch, ids)
+
+        # Keyword index of the library, kept in step with the vector store
+        with INGESTION_STAGE_DURATION.time(stage="lexical", **labels):
+            await asyncio.to_thread(
+                get_lexical_index(library_uuid.hex).add,
+                [chunk.page_content for chunk in batch],
+                [chunk.metadata for chunk in batch],
+                ids,
+            )
+
+        if on_progress is not None:
+            await on_progress(batch_count, chunk_count, get_progress(batch, pages))
+
+    return chunk_count
+
+
+LOADER_MAPPING = Registry(
+    "loader",
+    {
+        "pdf": get_pdf_loader,
+        "web_page": get_web_page_loader,
+    },
+)
+
+
+# Page counters of the document types whose chunks carry a page number
+PAGE_COUNT_MAPPING = {
+    "pdf": count_pdf_pages,
 }
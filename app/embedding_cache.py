@@ -0,0 +1,192 @@
+"""embedding_cache.py"""
+
+import hashlib
+import logging
+import os
+from array import array
+from typing import Awaitable, Callable
+
+from langchain_core.embeddings import Embeddings
+
+from app.data_connection.redis import URI as REDIS_URI
+from app.data_connection.redis import get_client as get_redis_client
+from app.data_connection.redis import get_sync_client as get_sync_redis_client
+from app.util.cache import LRUCache
+
+PROJECT_NAME = os.getenv("PROJECT_NAME", "knowledgeable-cobra")
+
+# Entries kept in the in-process tier, shared by every embedding model
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "20000"))
+# Seconds an embedding is kept in Redis, 30 days by default
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", "2592000"))
+
+KEY_PREFIX = f"{PROJECT_NAME}:embedding:"
+
+logger = logging.getLogger(__name__)
+
+local_cache = LRUCache(maxsize=EMBEDDING_CACHE_SIZE)
+
+counters = {"remote_hits": 0, "remote_misses": 0, "computed": 0}
+
+
+def get_cache_key(namespace: str, text: str) -> str:
+    digest = hashlib.sha256(f"{namespace}\0{text}".encode()).hexdigest()
+
+    return KEY_PREFIX + digest
+
+
+def _dumps(vector: list[float]) -> bytes:
+    return array("d", vector).tobytes()
+
+
+def _loads(raw: bytes) -> list[float]:
+    vector = array("d")
+    vector.frombytes(raw)
+
+    return vector.tolist()
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model with a content-addressed two-tier cache.
+
+    Vectors are keyed by a hash of `namespace` (provider and model name) and
+    the text, looked up in a local LRU tier first and in Redis second, and
+    only the misses are sent to the wrapped model. Document and query
+    embeddings are cached separately as some models embed them differently.
+    """
+
+    def __init__(self, embeddings: Embeddings, namespace: str):
+        self.embeddings = embeddings
+        self.namespace = namespace
+
+    def _prepare(self, texts: list[str], kind: str):
+        keys = [get_cache_key(f"{self.namespace}:{kind}", text) for text in texts]
+
+        vectors = [local_cache.get(key) for key in keys]
+
+        # Identical texts in one call share a key and are looked up once
+        pending: dict[str, list[int]] = {}
+
+        for index, (key, vector) in enumerate(zip(keys, vectors, strict=True)):
+            if vector is None:
+                pending.setdefault(key, []).append(index)
+
+        return vectors, pending
+
+    def _fill(self, vectors: list, pending: dict, keys: list, found: list):
+        for key, vector in zip(keys, found, strict=True):
+            if vector is None:
+                continue
+
+            local_cache.set(key, vector)
+
+            for index in pending.pop(key):
+                vectors[index] = vector
+
+    def _fill_remote(self, vectors: list, pending: dict, keys: list, raws: list):
+        found = [None if raw is None else _loads(raw) for raw in raws]
+
+        hits = sum(vector is not None for vector in found)
+        counters["remote_hits"] += hits
+        counters["remote_misses"] += len(found) - hits
+
+        self._fill(vectors, pending, keys, found)
+
+    def _embed(self, texts: list[str], kind: str, compute: Callable) -> list:
+        vectors, pending = self._prepare(texts, kind)
+
+        if pending and REDIS_URI:
+            keys = list(pending)
+
+            try:
+                raws = get_sync_redis_client().mget(keys)
+            except Exception:
+                logger.warning("Embedding cache lookup failed", exc_info=True)
+                raws = [None] * len(keys)
+
+            self._fill_remote(vectors, pending, keys, raws)
+
+        if pending:
+            keys = list(pending)
+            computed = compute([texts[pending[key][0]] for key in keys])
+            counters["computed"] += len(computed)
+
+            self._fill(vectors, pending, keys, computed)
+
+            if REDIS_URI:
+                try:
+                    with get_sync_redis_client().pipeline() as pipe:
+                        for key, vector in zip(keys, computed, strict=True):
+                            pipe.set(key, _dumps(vector), ex=EMBEDDING_CACHE_TTL)
+                        pipe.execute()
+                except Exception:
+                    logger.warning("Embedding cache write failed", exc_info=True)
+
+        return vectors
+
+    async def _aembed(
+        self,
+        texts: list[str],
+        kind: str,
+        compute: Callable[[list[str]], Awaitable[list]],
+    ) -> list:
+        vectors, pending = self._prepare(texts, kind)
+
+        if pending and REDIS_URI:
+            keys = list(pending)
+
+            try:
+                raws = await get_redis_client().mget(keys)
+            except Exception:
+                logger.warning("Embedding cache lookup failed", exc_info=True)
+                raws = [None] * len(keys)
+
+            self._fill_remote(vectors, pending, keys, raws)
+
+        if pending:
+            keys = list(pending)
+            computed = await compute([texts[pending[key][0]] for key in keys])
+            counters["computed"] += len(computed)
+
+            self._fill(vectors, pending, keys, computed)
+
+            if REDIS_URI:
+                try:
+                    async with get_redis_client().pipeline() as pipe:
+                        for key, vector in zip(keys, computed, strict=True):
+                            pipe.set(key, _dumps(vector), ex=EMBEDDING_CACHE_TTL)
+                        await pipe.execute()
+                except Exception:
+                    logger.warning("Embedding cache write failed", exc_info=True)
+
+        return vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await self._aembed(texts, "document", self.embeddings.aembed_documents)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(
+            [text],
+            "query",
+            lambda texts: [self.embeddings.embed_query(texts[0])],
+        )[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        async def compute(texts: list[str]) -> list[list[float]]:
+            return [await self.embeddings.aembed_query(texts[0])]
+
+        return (await self._aembed([text], "query", compute))[0]
+
+
+def get_stats() -> dict:
+    lookups = local_cache.hits + local_cache.misses
+    hits = local_cache.hits + counters["remote_hits"]
+
+    return {
+        "local": local_cache.stats,
+        **counters,
+        "hit_rate": hits / lookups if lookups else 0.0,
+    }
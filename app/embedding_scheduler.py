@@ -0,0 +1,243 @@
+"""embedding_scheduler.py"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from langchain_core.embeddings import Embeddings
+
+# Largest batch each provider accepts per request and its default request
+# rates, for documents and for queries apart so that queries never wait
+# behind a throttled ingestion
+PROVIDER_LIMITS = {
+    "cohere": {"batch_size": 96, "rate": 10.0, "query_rate": 5.0},
+    "dashscope": {"batch_size": 25, "rate": 10.0, "query_rate": 5.0},
+}
+# Limits of other providers, and of those missing from PROVIDER_LIMITS
+DEFAULT_LIMITS = {"batch_size": 32, "rate": 5.0, "query_rate": 2.0}
+
+# Batches of one embedding call sent to the provider at the same time
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def get_provider_limit(provider: str, name: str):
+    default = PROVIDER_LIMITS.get(provider, {}).get(name, DEFAULT_LIMITS[name])
+
+    value = os.getenv(f"{provider.upper()}_EMBEDDING_{name.upper()}")
+
+    return type(default)(value) if value else default
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate adapts to provider throttling.
+
+    The rate is halved whenever the provider answers 429 and recovers
+    additively on success, never exceeding the configured rate.
+    """
+
+    def __init__(self, rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+
+            return max(0.0, -self.tokens / self.rate)
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 64, self.rate / 2)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+# Buckets by provider and limit, "rate" for documents or "query_rate"
+buckets: dict[tuple[str, str], TokenBucket] = {}
+
+stats: dict[str, dict] = {}
+
+
+def _get_record(provider: str) -> dict:
+    return stats.setdefault(
+        provider, {"chunks": 0, "batches": 0, "seconds": 0.0, "throttled": 0}
+    )
+
+
+def get_bucket(provider: str, limit: str = "rate") -> TokenBucket:
+    key = (provider, limit)
+
+    if key not in buckets:
+        buckets[key] = TokenBucket(rate=get_provider_limit(provider, limit))
+
+    return buckets[key]
+
+
+def is_rate_limited(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(
+        getattr(exc, "response", None), "status_code", None
+    )
+
+    return status == 429 or "rate limit" in str(exc).lower()
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeds large inputs in provider-sized batches issued concurrently.
+
+    Every request first takes a token from the provider's bucket, shared by all
+    instances in the process, and rate-limited requests are retried with the
+    bucket slowed down. Queries take theirs from a bucket of their own, so a
+    question is not queued behind the batches of an ingestion.
+    """
+
+    def __init__(self, embeddings: Embeddings, provider: str):
+        self.embeddings = embeddings
+        self.provider = provider
+        self.batch_size = get_provider_limit(provider, "batch_size")
+        self.bucket = get_bucket(provider)
+        self.query_bucket = get_bucket(provider, "query_rate")
+
+    def __getattr__(self, name: str):
+        # Exposes attributes such as `model` of the wrapped embeddings
+        if name == "embeddings":
+            raise AttributeError(name)
+
+        return getattr(self.embeddings, name)
+
+    def _batches(self, texts: list[str]) -> list[list[str]]:
+        return [
+            texts[start : start + self.batch_size]
+            for start in range(0, len(texts), self.batch_size)
+        ]
+
+    def _record(self, chunks: int, batches: int, started: float):
+        record = _get_record(self.provider)
+
+        record["chunks"] += chunks
+        record["batches"] += batches
+        record["seconds"] += time.monotonic() - started
+
+    def _throttled(self, exc: Exception, attempt: int, bucket: TokenBucket) -> bool:
+        if not is_rate_limited(exc) or attempt >= EMBEDDING_MAX_RETRIES:
+            return False
+
+        logger.warning("Rate limited by %s, slowing down", self.provider)
+
+        bucket.throttle()
+        _get_record(self.provider)["throttled"] += 1
+
+        return True
+
+    def _call(self, bucket: TokenBucket, func, *args):
+        attempt = 0
+
+        while True:
+            time.sleep(bucket.reserve())
+
+            try:
+                result = func(*args)
+            except Exception as exc:
+                if not self._throttled(exc, attempt, bucket):
+                    raise
+                attempt += 1
+                continue
+
+            bucket.recover()
+
+            return result
+
+    async def _acall(self, bucket: TokenBucket, func, *args):
+        attempt = 0
+
+        while True:
+            await asyncio.sleep(bucket.reserve())
+
+            try:
+                result = await func(*args)
+            except Exception as exc:
+                if not self._throttled(exc, attempt, bucket):
+                    raise
+                attempt += 1
+                continue
+
+            bucket.recover()
+
+            return result
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        started = time.monotonic()
+
+        batches = self._batches(texts)
+
+        with ThreadPoolExecutor(max_workers=EMBEDDING_CONCURRENCY) as executor:
+            results = executor.map(
+                lambda batch: self._call(
+                    self.bucket, self.embeddings.embed_documents, batch
+                ),
+                batches,
+            )
+
+            vectors = [vector for result in results for vector in result]
+
+        self._record(len(texts), len(batches), started)
+
+        return vectors
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        started = time.monotonic()
+
+        batches = self._batches(texts)
+
+        semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+        async def embed(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                return await self._acall(
+                    self.bucket, self.embeddings.aembed_documents, batch
+                )
+
+        results = await asyncio.gather(*(embed(batch) for batch in batches))
+
+        self._record(len(texts), len(batches), started)
+
+        return [vector for result in results for vector in result]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._call(self.query_bucket, self.embeddings.embed_query, text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self._acall(self.query_bucket, self.embeddings.aembed_query, text)
+
+
+def get_stats() -> dict:
+    return {
+        provider: {
+            **record,
+            **{
+                limit: bucket.rate
+                for (name, limit), bucket in buckets.items()
+                if name == provider
+            },
+            "chunks_per_second": (
+                record["chunks"] / record["seconds"] if record["seconds"] else 0.0
+            ),
+        }
+        for provider, record in stats.items()
+    }
@@ -29,6 +29,22 @@ class User(BaseModel):
     date_purged: Optional[date] = Field(default=None)
 
 
+class RetrievalSettings(BaseModel):
+    k: int = Field(default=4, ge=1, le=50)
+    # Minimum relevance in [0, 1], ignored when `mmr` is set
+    score_threshold: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    mmr: bool = Field(default=False)
+    fetch_k: int = Field(default=20, ge=1, le=200)
+    lambda_mult: float = Field(default=0.5, ge=0.0, le=1.0)
+    # Metadata filter in the format of the library's vector store
+    filter: Optional[Union[dict, str]] = Field(default=None)
+    # Keyword search weight. When unset, LEXICAL_WEIGHT for the vector stores in
+    # LEXICAL_VECTORDBS and 0 for others
+    lexical_weight: Optional[float] = Field(default=None, ge=0.0)
+    # Over-fetches candidates and keeps the `k` best according to RERANKER
+    rerank: bool = Field(default=False)
+
+
 class Library(BaseModel):
     id: Optional[PyObjectId] = Field(alias="_id", default=None)
     uuid: UUID = Field(default_factory=uuid4)
@@ -37,12 +53,15 @@ class Library(BaseModel):
     description: str = Field(..., min_length=3, max_length=64)
     embedding: str = Field(..., min_length=1, max_length=64)
     vectordb: str = Field(..., min_length=1, max_length=128)
+    answer_cache: bool = Field(default=False)
+    retrieval: RetrievalSettings = Field(default_factory=RetrievalSettings)
     datetime_created: datetime = Field(default_factory=datetime.now)
     datetime_removed: Optional[datetime] = Field(default=None)
 
 
 class LibraryList(BaseModel):
     libraries: list[Library]
+    next_cursor: Optional[str] = Field(default=None)
 
 
 class Document(BaseModel):
@@ -59,6 +78,28 @@ class Document(BaseModel):
 
 class DocumentList(BaseModel):
     documents: list[Document]
+    next_cursor: Optional[str] = Field(default=None)
+
+
+class DocumentSource(BaseModel):
+    path: Union[HttpUrl, str] = Field(..., min_length=1)
+    type: Optional[str] = Field(default=None, max_length=64)
+    name: Optional[str] = Field(default=None, min_length=1, max_length=128)
+
+
+class BulkImport(BaseModel):
+    documents: list[DocumentSource] = Field(..., min_length=1, max_length=10000)
+
+
+class BulkImportStatus(BaseModel):
+    batch_id: UUID = Field(...)
+    library_id: UUID = Field(...)
+    total: int = Field(default=0, ge=0)
+    statuses: dict[str, int] = Field(default={})
+    chunks: int = Field(default=0, ge=0)
+    progress: float = Field(default=0.0, ge=0.0, le=1.0)
+    # Uploaded files left out for their type
+    skipped: list[str] = Field(default=[])
 
 
 class Dialogue(BaseModel):
@@ -66,9 +107,15 @@ class Dialogue(BaseModel):
     uuid: UUID = Field(default_factory=uuid4)
     user_id: UUID = Field(...)
     library_id: UUID = Field(...)
+    # Further libraries searched along with `library_id`
+    library_ids: list[UUID] = Field(default=[], max_length=16)
     llm: str = Field(..., min_length=3, max_length=128)
     title: str = Field(default="New Dialogue", min_length=3, max_length=128)
     content: list = Field(default=[], min_length=0)
+    preview: Optional[str] = Field(default=None)
+    message_count: int = Field(default=0, ge=0)
+    summary: Optional[str] = Field(default=None)
+    summary_count: int = Field(default=0, ge=0)
     datetime_created: datetime = Field(default_factory=datetime.now)
     datetime_updated: datetime = Field(default_factory=datetime.now)
     datetime_removed: Optional[datetime] = Field(default=None)
@@ -76,7 +123,36 @@ class Dialogue(BaseModel):
 
 class DialogueList(BaseModel):
     dialogues: list[Dialogue]
+    next_cursor: Optional[str] = Field(default=None)
+
+
+class Message(BaseModel):
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    dialogue_id: UUID = Field(...)
+    user_id: UUID = Field(...)
+    type: str = Field(..., max_length=32)
+    content: str = Field(default="")
+    datetime_created: datetime = Field(default_factory=datetime.now)
 
 
 class UserPrompt(BaseModel):
     content: str = Field(..., min_length=1, max_length=1024)
+
+
+class Job(BaseModel):
+    id: Optional[PyObjectId] = Field(alias="_id", default=None)
+    uuid: UUID = Field(default_factory=uuid4)
+    user_id: UUID = Field(...)
+    document_id: UUID = Field(...)
+    batch_id: Optional[UUID] = Field(default=None)
+    type: str = Field(default="embed", max_length=64)
+    status: str = Field(default="pending", max_length=32)
+    progress: float = Field(default=0.0, ge=0.0, le=1.0)
+    checkpoint: int = Field(default=0, ge=0)
+    chunks: int = Field(default=0, ge=0)
+    attempts: int = Field(default=0, ge=0)
+    error: Optional[str] = Field(default=None)
+    # When a queued or running job is presumed lost, or a retry is due
+    next_attempt_at: Optional[datetime] = Field(default=None)
+    datetime_created: datetime = Field(default_factory=datetime.now)
+    datetime_updated: datetime = Field(default_factory=datetime.now)
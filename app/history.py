@@ -0,0 +1,50 @@
+"""history.py"""
+
+import os
+from typing import Optional
+
+from langchain_core.messages import BaseMessage, SystemMessage
+
+from app.util.tokens import count_message_tokens
+
+# Recent messages sent verbatim to the prompts, older ones are summarised
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "4"))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def get_window_start(
+    messages: list[BaseMessage],
+    budget: int = HISTORY_TOKEN_BUDGET,
+    max_turns: int = HISTORY_MAX_TURNS,
+) -> int:
+    """Returns the index of the oldest message kept verbatim.
+
+    Whole turns are kept from the most recent one backwards, as long as they
+    fit in `budget` tokens and there are at most `max_turns` of them.
+    """
+    start = len(messages)
+    tokens = 0
+
+    for turn in range(max_turns):
+        turn_start = max(0, len(messages) - 2 * (turn + 1))
+
+        if turn_start == start:
+            break
+
+        tokens += count_message_tokens(messages[turn_start:start])
+
+        if tokens > budget:
+            break
+
+        start = turn_start
+
+    return start
+
+
+def with_summary(summary: Optional[str], messages: list[BaseMessage]) -> list:
+    if not summary:
+        return messages
+
+    return [SystemMessage(content=SUMMARY_PREFIX + summary), *messages]
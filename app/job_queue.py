@@ -0,0 +1,174 @@
+"""job_queue.py"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+from app.data_connection.redis import URI as REDIS_URI
+from app.data_connection.redis import get_client as get_redis_client
+
+PROJECT_NAME = os.getenv("PROJECT_NAME", "knowledgeable-cobra")
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+# Seconds a job may run without progress before it is presumed lost and
+# queued again
+JOB_LEASE = float(os.getenv("JOB_LEASE", "600"))
+# Seconds between scans for jobs due for another attempt
+JOB_RECOVERY_INTERVAL = float(os.getenv("JOB_RECOVERY_INTERVAL", "15"))
+
+# Seconds a worker waits on an empty queue before polling again
+POLL_TIMEOUT = 1
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[str], Awaitable[None]]
+# Returns the ids of the jobs to queue again, including every pending job
+# when called with True because the queue holds none
+JobRecovery = Callable[[bool], Awaitable[list[str]]]
+
+
+class LocalJobQueue:
+    """In-process fallback used when no Redis is configured."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue[str] = asyncio.Queue()
+
+    async def put(self, *payloads: str):
+        for payload in payloads:
+            await self.queue.put(payload)
+
+    async def get(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def size(self) -> int:
+        return self.queue.qsize()
+
+
+class RedisJobQueue:
+    """Redis list shared by every server process."""
+
+    key = f"{PROJECT_NAME}:jobs"
+
+    async def put(self, *payloads: str):
+        await get_redis_client().lpush(self.key, *payloads)
+
+    async def get(self, timeout: float) -> Optional[str]:
+        result = await get_redis_client().brpop([self.key], timeout=timeout)
+
+        return None if result is None else result[1].decode()
+
+    async def size(self) -> int:
+        return await get_redis_client().llen(self.key)
+
+
+queue = None
+
+workers: list[asyncio.Task] = []
+
+
+def get_job_queue():
+    global queue
+
+    if queue is None:
+        queue = RedisJobQueue() if REDIS_URI else LocalJobQueue()
+
+    return queue
+
+
+async def enqueue(job_id: str):
+    await get_job_queue().put(json.dumps({"job_id": job_id}))
+
+
+async def enqueue_many(job_ids: list[str]):
+    payloads = [json.dumps({"job_id": job_id}) for job_id in job_ids]
+
+    await get_job_queue().put(*payloads)
+
+
+def get_retry_delay(attempt: int) -> float:
+    return JOB_RETRY_BACKOFF * 2 ** (attempt - 1)
+
+
+def _parse(payload: str) -> Optional[str]:
+    try:
+        return str(json.loads(payload)["job_id"])
+    except (ValueError, TypeError, KeyError):
+        logger.error("Dropped malformed job payload %r", payload)
+        return None
+
+
+async def _work(handler: JobHandler):
+    """Runs queued jobs, leaving attempts and retries to the handler.
+
+    Queue entries only carry a job id. The handler claims the job's record,
+    so duplicate entries are skipped, and records when it is due again.
+    """
+    job_queue = get_job_queue()
+
+    while True:
+        try:
+            payload = await job_queue.get(timeout=POLL_TIMEOUT)
+        except Exception:
+            logger.exception("Failed to fetch job from the queue")
+            await asyncio.sleep(POLL_TIMEOUT)
+            continue
+
+        if payload is None or (job_id := _parse(payload)) is None:
+            continue
+
+        try:
+            await handler(job_id)
+        except Exception:
+            logger.exception("Job %s failed", job_id)
+
+
+async def _recover(recover: JobRecovery):
+    """Queues jobs due for a retry or lost along with a worker.
+
+    Pending jobs are queued again only at startup and only if the queue is
+    empty, i.e. it was lost with the process or Redis. Pending jobs still
+    waiting in a queue are never pushed twice, however long it takes.
+    """
+    startup = True
+
+    while True:
+        try:
+            pending = startup and not await get_job_queue().size()
+
+            if job_ids := await recover(pending):
+                logger.info("Queued %d jobs again", len(job_ids))
+                await enqueue_many(job_ids)
+
+            startup = False
+        except Exception:
+            logger.exception("Failed to recover jobs")
+
+        await asyncio.sleep(JOB_RECOVERY_INTERVAL)
+
+
+def start_workers(
+    handler: JobHandler,
+    recover: Optional[JobRecovery] = None,
+    concurrency: int = JOB_CONCURRENCY,
+):
+    for _ in range(concurrency):
+        workers.append(asyncio.create_task(_work(handler)))
+
+    if recover is not None:
+        workers.append(asyncio.create_task(_recover(recover)))
+
+
+async def stop_workers():
+    for task in workers:
+        task.cancel()
+
+    await asyncio.gather(*workers, return_exceptions=True)
+
+    workers.clear()
@@ -0,0 +1,230 @@
+"""metrics.py"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Iterator, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Seconds, from fast cache lookups to slow generations
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)  # fmt: skip
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """Prometheus histogram, cumulative buckets are computed when rendered."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+
+        # labels -> (count per bucket and +Inf, sum)
+        self._series: dict[tuple, tuple[list[int], float]] = {}
+        self._lock = Lock()
+
+        histograms.append(self)
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple((name, str(labels.get(name, ""))) for name in self.labelnames)
+
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[dict]:
+        """Observes the duration of the block, labels may be added inside it."""
+        started = time.perf_counter()
+
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+
+        with self._lock:
+            series = {
+                key: (list(counts), total)
+                for key, (counts, total) in self._series.items()
+            }
+
+        for key, (counts, total) in series.items():
+            cumulative = 0
+
+            for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += count
+                labels = _format_labels((*key, ("le", str(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+
+        return lines
+
+
+histograms: list[Histogram] = []
+
+# name -> (documentation, callable returning {labels: value})
+gauges: dict[str, tuple[str, Callable[[], dict[tuple, float]]]] = {}
+
+
+def register_gauge(
+    name: str, documentation: str, collect: Callable[[], dict[tuple, float]]
+):
+    gauges[name] = (documentation, collect)
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts, by route.",
+    ("method", "route", "status"),
+)
+
+DIALOGUE_STAGE_DURATION = Histogram(
+    "dialogue_stage_duration_seconds",
+    "Time spent in each stage of a dialogue turn.",
+    ("stage", "vectordb", "embedding", "llm"),
+)
+
+INGESTION_STAGE_DURATION = Histogram(
+    "ingestion_stage_duration_seconds",
+    "Time spent in each stage of a document ingestion, per batch.",
+    ("stage", "vectordb", "embedding"),
+)
+
+
+class StageTimer(BaseCallbackHandler):
+    """Observes the stages of a RAG chain run from its callbacks.
+
+    Runs named after a stage in `stages` are timed as that stage, the
+    outermost retriever as "retrieve" and chat models outside the condense
+    stage as "generate", along with the time to their first token.
+    """
+
+    run_inline = True
+
+    stages = {"condense": "condense", "rerank": "rerank"}
+
+    def __init__(self, **labels: Any):
+        self.labels = labels
+
+        self._started: dict[UUID, tuple[str, float]] = {}
+        self._first_token: set[UUID] = set()
+
+    def _start(self, run_id: UUID, stage: str):
+        self._started[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        if run_id in self._started:
+            stage, started = self._started.pop(run_id)
+
+            DIALOGUE_STAGE_DURATION.observe(
+                time.perf_counter() - started, stage=stage, **self.labels
+            )
+
+    def on_chain_start(
+        self, serialized: dict, inputs: Any, *, run_id: UUID, **kwargs: Any
+    ):
+        if (stage := self.stages.get(kwargs.get("name") or "")) is not None:
+            self._start(run_id, stage)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._started.pop(run_id, None)
+
+    def on_retriever_start(
+        self,
+        serialized: dict,
+        query: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        # Retrievers fused by another one are part of its stage
+        if not any(stage == "retrieve" for stage, _ in self._started.values()):
+            self._start(run_id, "retrieve")
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any):
+        self._end(run_id)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._started.pop(run_id, None)
+
+    def on_chat_model_start(
+        self,
+        serialized: dict,
+        messages: Any,
+        *,
+        run_id: UUID,
+        tags: Optional[list[str]] = None,
+        **kwargs: Any,
+    ):
+        if "condense" not in (tags or []):
+            self._start(run_id, "generate")
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        if run_id in self._started and run_id not in self._first_token:
+            self._first_token.add(run_id)
+
+            DIALOGUE_STAGE_DURATION.observe(
+                time.perf_counter() - self._started[run_id][1],
+                stage="first_token",
+                **self.labels,
+            )
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        self._first_token.discard(run_id)
+        self._end(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._first_token.discard(run_id)
+        self._started.pop(run_id, None)
+
+
+def render() -> str:
+    lines = []
+
+    for histogram in histograms:
+        lines.extend(histogram.render())
+
+    for name, (documentation, collect) in gauges.items():
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+
+        for labels, value in collect().items():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
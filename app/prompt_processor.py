@@ -4,105 +4,269 @@ import os
 from typing import Callable
 from uuid import UUID
 
-from langchain_community.chat_models.cohere import ChatCohere
-from langchain_community.chat_models.tongyi import ChatTongyi
-from langchain_community.embeddings.cohere import CohereEmbeddings
-from langchain_community.embeddings.dashscope import DashScopeEmbeddings
-from langchain_community.vectorstores.dashvector import DashVector
-from langchain_community.vectorstores.milvus import Milvus
-from langchain_community.vectorstores.qdrant import Qdrant
-from langchain_community.vectorstores.weaviate import Weaviate
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
-
-from app.chain import get_rag_chain
-from app.data_connection.dashvector import get_client as get_dashvector_client
-from app.data_connection.qdrant import get_client as get_qdrant_client
-from app.data_connection.weaviate import get_client as get_weaviate_client
+from langchain_core.vectorstores import VectorStore
+
+from app.answer_cache import LibraryAnswerCache
+from app.backends import (
+    RELEVANCE_SCORE_VECTORDBS,
+    get_chat_model,
+    get_embeddings,
+    get_vectorstore,
+    is_vectorstore_bound,
+    vectorstores,
+)
+from app.chain import get_rag_chain, get_summary_chain
+from app.coalescer import COALESCE_REQUESTS, RequestCoalescer
+from app.condenser import CONDENSE_LLM, QuestionCondenser
+from app.data_connection.bm25 import get_index as get_lexical_index
+from app.data_connection.manager import on_replace
+from app.entity import RetrievalSettings
+from app.metrics import DIALOGUE_STAGE_DURATION
+from app.reranker import RERANK_OVERFETCH, get_reranker
+from app.retriever import BM25Retriever, FusionRetriever, get_lexical_weight
+from app.util.cache import LRUCache
+
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "64"))
+CHAIN_CACHE_TTL = float(os.getenv("CHAIN_CACHE_TTL", "3600"))
+
+# Built chains keyed by their configuration, so the embedding
+# client, vector store wrapper and chat model are reused across prompts
+chain_cache = LRUCache(maxsize=CHAIN_CACHE_SIZE, ttl=CHAIN_CACHE_TTL)
 
 
 def get_prompt_processor(
-    embedding: str, vectordb: str, collection: UUID, llm: str
+    embedding: str,
+    vectordb: str,
+    collection: UUID,
+    llm: str,
+    answer_cache: bool = False,
+    libraries: tuple[tuple[str, str, UUID, str], ...] = (),
+    retrieval: str = "",
 ) -> Callable:
-    chain = build_chain(embedding, vectordb, collection, llm)
+    chain = get_chain(
+        embedding, vectordb, collection, llm, answer_cache, libraries, retrieval
+    )
 
     return chain.ainvoke
 
 
-def build_chain(embedding: str, vectordb: str, collection: UUID, llm: str):
-    db_collection = VECTORDB_MAPPING[vectordb](
-        embedding=EMBEDDING_MAPPING[embedding](), collection=collection
+def get_prompt_streamer(
+    embedding: str,
+    vectordb: str,
+    collection: UUID,
+    llm: str,
+    answer_cache: bool = False,
+    libraries: tuple[tuple[str, str, UUID, str], ...] = (),
+    retrieval: str = "",
+) -> Callable:
+    chain = get_chain(
+        embedding, vectordb, collection, llm, answer_cache, libraries, retrieval
     )
 
-    chat = CHAT_MAPPING[llm](temperature=0.1)
+    return chain.astream
 
-    return get_rag_chain(retriever=db_collection.as_retriever(), llm=chat)
 
+def get_chain(
+    embedding: str,
+    vectordb: str,
+    collection: UUID,
+    llm: str,
+    answer_cache: bool = False,
+    libraries: tuple[tuple[str, str, UUID, str], ...] = (),
+    retrieval: str = "",
+):
+    key = (embedding, vectordb, collection, llm, answer_cache, libraries, retrieval)
 
-def get_cohere_embedding():
-    # return CohereEmbeddings(
-    #     model="embed-multilingual-light-v3.0", max_retries=5, request_timeout=20
-    # )
-    return CohereEmbeddings(max_retries=5, request_timeout=20)
+    chain = chain_cache.get(key)
 
+    if chain is None:
+        with DIALOGUE_STAGE_DURATION.time(
+            stage="build_chain", vectordb=vectordb, embedding=embedding, llm=llm
+        ):
+            chain = build_chain(*key)
 
-def get_dashscope_embedding():
-    return DashScopeEmbeddings(model="text-embedding-v2", max_retries=5)
+        # Chains holding a store built before its collection existed are
+        # rebuilt until it does, which may happen in another process
+        if all(
+            is_vectorstore_bound(
+                library_vectordb, library_embedding, library_collection
+            )
+            for library_embedding, library_vectordb, library_collection, _ in (
+                (embedding, vectordb, collection, retrieval),
+                *libraries,
+            )
+        ):
+            chain_cache.set(key, chain)
 
+    return chain
 
-def get_dashvector_collection(embedding, collection: UUID):
-    client = get_dashvector_client()
 
-    instance = DashVector(
-        # character must be in [a-zA-Z0-9] and symbols[_,-] and length must be in [3,32]
-        collection=client.get(name=collection.hex),
-        embedding=embedding,
-        text_field="text",
-    )
+# Chains summarising older dialogue turns, one per chat model
+summary_chains = {}
+
+
+def get_summariser(llm: str) -> Callable:
+    if llm not in summary_chains:
+        summary_chains[llm] = get_summary_chain(get_chat_model(llm, 0.1))
 
-    return instance
+    return summary_chains[llm].ainvoke
 
 
-def get_milvus_collection(embedding, collection: UUID):
-    instance = Milvus(
-        embedding_function=embedding,
-        # The first character of a collection name must be an underscore or letter
-        collection_name=f"_{collection.hex}",
-        connection_args={
-            "uri": os.getenv("MILVUS_URI", ""),
-            "token": os.getenv("MILVUS_API_KEY", ""),
-            "secure": os.getenv("MILVUS_URI", "").startswith("https"),
-        },
+def invalidate_chains(collection: UUID) -> int:
+    return chain_cache.invalidate(
+        lambda key: key[2] == collection
+        or any(library[2] == collection for library in key[5])
     )
 
-    return instance
 
+def invalidate_backend(pool: str) -> int:
+    """Drops the vector stores and chains holding a replaced client."""
+    vectordb = pool.removesuffix("_async")
 
-def get_qdrant_collection(embedding, collection: UUID):
-    client = get_qdrant_client()
+    vectorstores.invalidate(lambda key: key[0] == vectordb)
 
-    instance = Qdrant(
-        client=client, collection_name=collection.hex, embeddings=embedding
+    return chain_cache.invalidate(
+        lambda key: key[1] == vectordb
+        or any(library[1] == vectordb for library in key[5])
     )
 
-    return instance
 
+on_replace(invalidate_backend)
+
+
+def build_chain(
+    embedding: str,
+    vectordb: str,
+    collection: UUID,
+    llm: str,
+    answer_cache: bool = False,
+    libraries: tuple[tuple[str, str, UUID, str], ...] = (),
+    retrieval: str = "",
+):
+    """Builds the RAG chain of a library.
+
+    Extra `libraries`, given as (embedding, vectordb, collection, retrieval),
+    are searched concurrently with the main one. Unless the lexical weight is
+    0, the BM25 index of every library is searched as well and all results
+    are fused. `retrieval` is the JSON of a library's RetrievalSettings.
+    """
+    settings = get_retrieval_settings(retrieval)
+
+    # Candidates for the reranker, which keeps the main library's `k`
+    overfetch = RERANK_OVERFETCH if settings.rerank else 1
+
+    retrievers, weights = [], []
+
+    for (
+        library_embedding,
+        library_vectordb,
+        library_collection,
+        library_retrieval,
+    ) in ((embedding, vectordb, collection, retrieval), *libraries):
+        library_settings = get_retrieval_settings(library_retrieval)
+
+        # Thresholds stored before they were rejected for this backend
+        if library_vectordb not in RELEVANCE_SCORE_VECTORDBS:
+            library_settings = library_settings.model_copy(
+                update={"score_threshold": None}
+            )
+
+        if overfetch > 1:
+            library_settings = library_settings.model_copy(
+                update={
+                    "k": library_settings.k * overfetch,
+                    "fetch_k": max(
+                        library_settings.fetch_k, library_settings.k * overfetch
+                    ),
+                }
+            )
+
+        instance = get_vectorstore(
+            library_vectordb, library_embedding, library_collection
+        )
+
+        retrievers.append(get_retriever(instance, library_settings))
+        weights.append(1.0)
+
+        lexical_weight = get_lexical_weight(
+            library_vectordb, library_settings.lexical_weight
+        )
+
+        if lexical_weight:
+            retrievers.append(
+                BM25Retriever(
+                    index=get_lexical_index(library_collection.hex),
+                    k=library_settings.k,
+                    # Only key-value filters apply to the keyword index
+                    filter=(
+                        library_settings.filter
+                        if isinstance(library_settings.filter, dict)
+                        else None
+                    ),
+                )
+            )
+            weights.append(lexical_weight)
+
+    if len(retrievers) > 1:
+        retriever = FusionRetriever(
+            retrievers=retrievers, weights=weights, k=settings.k * overfetch
+        )
+    else:
+        retriever = retrievers[0]
+
+    chat = get_chat_model(llm, 0.1)
+
+    condense_llm = CONDENSE_LLM or llm
+
+    # Requests are only coalesced with those sharing the whole configuration
+    scope = (embedding, vectordb, collection, llm, answer_cache, libraries, retrieval)
+
+    return get_rag_chain(
+        retriever=retriever,
+        llm=chat,
+        condenser=QuestionCondenser(llm=condense_llm),
+        condense_llm=get_chat_model(condense_llm, 0),
+        reranker=get_reranker() if settings.rerank else None,
+        top_n=settings.k,
+        # Cached answers are only invalidated along with the main library
+        answer_cache=(
+            LibraryAnswerCache(
+                library=collection, llm=llm, embeddings=get_embeddings(embedding)
+            )
+            if answer_cache and not libraries
+            else None
+        ),
+        coalescer=RequestCoalescer(scope=scope) if COALESCE_REQUESTS else None,
+    )
 
-def get_weaviate_collection(embedding, collection: UUID):
-    client = get_weaviate_client()
 
-    instance = Weaviate(
-        client=client, index_name=f"collection_{collection.hex}", embedding=embedding
-    )
+def get_retrieval_settings(retrieval: str) -> RetrievalSettings:
+    if not retrieval:
+        return RetrievalSettings()
+
+    return RetrievalSettings.model_validate_json(retrieval)
+
+
+def get_retriever(instance: VectorStore, settings: RetrievalSettings):
+    search_kwargs = {"k": settings.k}
 
-    return instance
+    if settings.filter is not None:
+        search_kwargs["filter"] = settings.filter
 
+    if settings.mmr:
+        search_kwargs.update(fetch_k=settings.fetch_k, lambda_mult=settings.lambda_mult)
 
-def get_cohere_chat(temperature: float):
-    return ChatCohere(temperature=temperature)
+        return instance.as_retriever(search_type="mmr", search_kwargs=search_kwargs)
 
+    if settings.score_threshold is not None:
+        search_kwargs.update(score_threshold=settings.score_threshold)
 
-def get_tongyi_chat(temperature: float):
-    return ChatTongyi(model="qwen-max", model_kwargs={"temperature": temperature})
+        return instance.as_retriever(
+            search_type="similarity_score_threshold", search_kwargs=search_kwargs
+        )
+
+    return instance.as_retriever(search_kwargs=search_kwargs)
 
 
 MESSAGE_MAPPING = {
@@ -117,23 +281,3 @@ def construct_chat_history(messages: list[dict[str, str]]) -> list[BaseMessage]:
         MESSAGE_MAPPING[message["type"]](content=message["content"])
         for message in messages
     ]
-
-
-CHAT_MAPPING = {
-    "cohere": get_cohere_chat,
-    "dashscope": get_tongyi_chat,
-}
-
-
-EMBEDDING_MAPPING = {
-    "cohere": get_cohere_embedding,
-    "dashscope": get_dashscope_embedding,
-}
-
-
-VECTORDB_MAPPING = {
-    "dashvector": get_dashvector_collection,
-    "milvus": get_milvus_collection,
-    "qdrant": get_qdrant_collection,
-    "weaviate": get_weaviate_collection,
-}
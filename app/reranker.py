@@ -0,0 +1,142 @@
+"""reranker.py"""
+
+import asyncio
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from langchain_core.documents import Document
+
+from app.retriever import get_document_key
+from app.util.cache import LRUCache
+
+# One of the keys of RERANKER_MAPPING
+RERANKER = os.getenv("RERANKER", "cohere")
+COHERE_RERANK_MODEL = os.getenv("COHERE_RERANK_MODEL", "rerank-multilingual-v3.0")
+LOCAL_RERANK_MODEL = os.getenv(
+    "LOCAL_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+)
+# Candidates retrieved per chunk finally sent to the chat model
+RERANK_OVERFETCH = int(os.getenv("RERANK_OVERFETCH", "3"))
+# Query and chunk pairs scored per model call
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+RERANK_CACHE_TTL = float(os.getenv("RERANK_CACHE_TTL", "3600"))
+
+# Relevance scores keyed by model, query hash and chunk key
+scores = LRUCache(maxsize=RERANK_CACHE_SIZE, ttl=RERANK_CACHE_TTL)
+
+
+class Reranker(ABC):
+    """Reorders retrieved chunks by their relevance to the query.
+
+    Only the pairs missing from the score cache are scored, in batches of
+    RERANK_BATCH_SIZE sent concurrently.
+    """
+
+    model: str
+
+    @abstractmethod
+    async def ascore(self, query: str, texts: list[str]) -> list[float]:
+        """Relevance of each text to the query, higher is more relevant."""
+
+    async def arerank(
+        self, query: str, documents: list[Document], top_n: int
+    ) -> list[Document]:
+        query_key = hashlib.sha256(query.encode()).hexdigest()
+
+        keys = [
+            (self.model, query_key, get_document_key(document))
+            for document in documents
+        ]
+
+        results: list[Optional[float]] = [scores.get(key) for key in keys]
+
+        missing = [i for i, score in enumerate(results) if score is None]
+
+        batches = [
+            missing[start : start + RERANK_BATCH_SIZE]
+            for start in range(0, len(missing), RERANK_BATCH_SIZE)
+        ]
+
+        batch_scores = await asyncio.gather(
+            *(
+                self.ascore(query, [documents[i].page_content for i in batch])
+                for batch in batches
+            )
+        )
+
+        for batch, values in zip(batches, batch_scores, strict=True):
+            for i, score in zip(batch, values, strict=True):
+                results[i] = score
+                scores.set(keys[i], score)
+
+        ranked = sorted(range(len(documents)), key=lambda i: -results[i])
+
+        return [documents[i] for i in ranked[:top_n]]
+
+
+class CohereReranker(Reranker):
+    def __init__(self, model: str = COHERE_RERANK_MODEL):
+        import cohere
+
+        self.model = model
+        self.client = cohere.AsyncClient(api_key=os.getenv("COHERE_API_KEY", ""))
+
+    async def ascore(self, query: str, texts: list[str]) -> list[float]:
+        response = await self.client.rerank(
+            model=self.model, query=query, documents=texts
+        )
+
+        results = [0.0] * len(texts)
+
+        for result in response.results:
+            results[result.index] = result.relevance_score
+
+        return results
+
+
+class LocalReranker(Reranker):
+    """Cross-encoder run on the CPU, requires sentence-transformers."""
+
+    def __init__(self, model: str = LOCAL_RERANK_MODEL):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as exc:
+            raise ImportError(
+                "The local reranker requires `pip install sentence-transformers`"
+            ) from exc
+
+        self.model = model
+        self.encoder = CrossEncoder(model, device="cpu")
+
+    async def ascore(self, query: str, texts: list[str]) -> list[float]:
+        values = await asyncio.to_thread(
+            self.encoder.predict,
+            [(query, text) for text in texts],
+            batch_size=RERANK_BATCH_SIZE,
+        )
+
+        return [float(value) for value in values]
+
+
+RERANKER_MAPPING = {
+    "cohere": CohereReranker,
+    "local": LocalReranker,
+}
+
+reranker = None
+
+
+def get_reranker() -> Reranker:
+    global reranker
+
+    if reranker is None:
+        reranker = RERANKER_MAPPING[RERANKER]()
+
+    return reranker
+
+
+def get_stats() -> dict:
+    return {"reranker": RERANKER, "cache": scores.stats}
@@ -0,0 +1,144 @@
+"""retriever.py"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.data_connection.bm25 import BM25Index
+
+# Seconds a single store may take before its results are left out
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "5"))
+# Fusion weight of keyword search relative to vector search, 0 disables it
+LEXICAL_WEIGHT = float(os.getenv("LEXICAL_WEIGHT", "1.0"))
+# Vector stores whose libraries are searched by keyword by default. BM25
+# indexes live on the disk of the process that ingested the documents, so
+# only add remote stores when LEXICAL_INDEX_DIR is shared by every replica
+LEXICAL_VECTORDBS = set(os.getenv("LEXICAL_VECTORDBS", "local").split(","))
+# Damping constant of reciprocal-rank fusion
+RRF_K = 60
+
+logger = logging.getLogger(__name__)
+
+
+def get_document_key(document: Document) -> str:
+    """Identifies overlapping chunks returned by several stores."""
+    content = " ".join(document.page_content.split())
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def get_lexical_weight(vectordb: str, weight: Optional[float] = None) -> float:
+    """Returns the keyword search weight of a library, `weight` if set."""
+    if weight is not None:
+        return weight
+
+    return LEXICAL_WEIGHT if vectordb in LEXICAL_VECTORDBS else 0.0
+
+
+def fuse(
+    results: list[list[Document]], weights: Optional[list[float]] = None, k: int = RRF_K
+) -> list[Document]:
+    """Merges ranked lists with reciprocal-rank fusion, dropping duplicates."""
+    weights = weights or [1.0] * len(results)
+
+    scores: dict[str, float] = {}
+    documents: dict[str, Document] = {}
+
+    for weight, result in zip(weights, results, strict=True):
+        for rank, document in enumerate(result):
+            key = get_document_key(document)
+
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank + 1)
+            documents.setdefault(key, document)
+
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class FusionRetriever(BaseRetriever):
+    """Queries several retrievers concurrently and fuses their results.
+
+    A retriever failing or exceeding `timeout` seconds is left out of the
+    answer instead of failing it.
+    """
+
+    retrievers: list[BaseRetriever]
+    # Fusion weight of each retriever, all equal by default
+    weights: Optional[list[float]] = None
+    k: int = 4
+    timeout: float = RETRIEVAL_TIMEOUT
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        results = []
+
+        for retriever in self.retrievers:
+            try:
+                result = retriever.invoke(
+                    query, config={"callbacks": run_manager.get_child()}
+                )
+            except Exception:
+                logger.exception("Retriever %s failed", type(retriever).__name__)
+                result = []
+
+            results.append(result)
+
+        return fuse(results, self.weights)[: self.k]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        async def retrieve(retriever: BaseRetriever) -> list[Document]:
+            try:
+                return await asyncio.wait_for(
+                    retriever.ainvoke(
+                        query, config={"callbacks": run_manager.get_child()}
+                    ),
+                    timeout=self.timeout,
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Retriever %s timed out", type(retriever).__name__)
+            except Exception:
+                logger.exception("Retriever %s failed", type(retriever).__name__)
+
+            return []
+
+        results = await asyncio.gather(*(retrieve(r) for r in self.retrievers))
+
+        return fuse(list(results), self.weights)[: self.k]
+
+
+class BM25Retriever(BaseRetriever):
+    """Keyword search over the BM25 index of a library."""
+
+    index: BM25Index
+    k: int = 4
+    # Metadata values the returned chunks must have
+    filter: Optional[dict] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return [
+            Document(page_content=record["text"], metadata=record["metadata"])
+            for record, _ in self.index.search(query, self.k, where=self.filter)
+        ]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return await asyncio.to_thread(
+            self._get_relevant_documents, query, run_manager=run_manager
+        )
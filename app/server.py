@@ -1,54 +1,143 @@
 """server.py"""
 
-from typing import Annotated
+import asyncio
+import json
+import logging
+import resource
+import time
+from contextlib import asynccontextmanager
+from typing import Annotated, AsyncIterator, Optional
 from uuid import UUID
 
-from fastapi import Body, FastAPI, Form, Path, Request, UploadFile, status
-from fastapi.responses import PlainTextResponse, RedirectResponse
+from fastapi import Body, FastAPI, Form, Path, Query, Request, UploadFile, status
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from jinja2_fragments.fastapi import Jinja2Blocks
 
+from app import STARTED
 from app.authenticator import DUMMY_USER_DB, get_authenticator
 from app.config import Settings
 from app.controller import (
     create_dialogue,
     create_document,
+    create_embed_job,
     create_library,
-    emb_document,
+    ensure_indexes,
     get_dialogue,
     get_dialogues,
     get_document,
+    get_document_job,
     get_documents,
+    get_import,
+    get_job,
     get_libraries,
     get_library,
+    get_stats,
+    import_documents,
+    recover_embed_jobs,
+    remove_library,
+    run_embed_job,
+    stream_dialogue,
     update_dialogue,
+    update_library,
+    update_retrieval,
+    upload_documents,
 )
+from app.data_connection.manager import close_clients, monitor_clients
+from app.document_processor import shutdown_executor
 from app.entity import (
+    BulkImport,
+    BulkImportStatus,
     Dialogue,
     DialogueList,
     Document,
     DocumentList,
+    Job,
     Library,
     LibraryList,
+    RetrievalSettings,
     UserAuth,
     UserPrompt,
 )
+from app.job_queue import start_workers, stop_workers
+from app.metrics import CONTENT_TYPE, HTTP_REQUEST_DURATION
+from app.metrics import render as render_metrics
+from app.util.pagination import DEFAULT_PAGE_SIZE
+from app.util.registry import get_stats as get_backend_stats
 
 # from langserve import add_routes
 
 DUMMY_USER_ID = DUMMY_USER_DB["joe.bloggs"]
 
+logger = logging.getLogger(__name__)
+
 settings = Settings()
 templates = Jinja2Blocks(directory=settings.TEMPLATE_DIR)
 
 
-app = FastAPI(**settings.fastapi_kwargs)
+def _report_startup():
+    backends = "; ".join(
+        f"{kind}: {', '.join(record['enabled'])}"
+        for kind, record in get_backend_stats().items()
+    )
+
+    logger.info(
+        "Started in %.2fs with %.0f MB peak RSS, enabled backends are %s",
+        time.perf_counter() - STARTED,
+        # Kilobytes on Linux
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        backends,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ensure_indexes()
+    except Exception:
+        logger.warning("Failed to ensure Mongo indexes", exc_info=True)
+
+    start_workers(handler=run_embed_job, recover=recover_embed_jobs)
+
+    monitor = asyncio.create_task(monitor_clients())
+
+    _report_startup()
+
+    yield
+
+    monitor.cancel()
+
+    await stop_workers()
+    shutdown_executor()
+    await close_clients()
+
+
+app = FastAPI(lifespan=lifespan, **settings.fastapi_kwargs)
 app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 
 
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    with HTTP_REQUEST_DURATION.time(method=request.method) as labels:
+        response = await call_next(request)
+
+        # Route templates keep the label set bounded, unlike raw paths
+        route = request.scope.get("route")
+        labels.update(
+            route=getattr(route, "path", "unmatched"), status=response.status_code
+        )
+
+    return response
+
+
 @app.get("/")
-async def root(request: Request):
-    libraries = await get_libraries(user_id=DUMMY_USER_ID)
+async def root(request: Request, cursor: Optional[str] = Query(default=None)):
+    libraries = await get_libraries(user_id=DUMMY_USER_ID, cursor=cursor)
 
     return templates.TemplateResponse(
         "main.html",
@@ -67,12 +156,21 @@ async def about(request: Request):
 
 
 @app.get("/library/{library_id}/")
-async def library_page(request: Request, library_id: UUID = Path(...)):
+async def library_page(
+    request: Request,
+    library_id: UUID = Path(...),
+    documents_cursor: Optional[str] = Query(default=None),
+    dialogues_cursor: Optional[str] = Query(default=None),
+):
     library = await get_library(user_id=DUMMY_USER_ID, library_id=library_id)
 
-    documents = await get_documents(user_id=DUMMY_USER_ID, library_id=library_id)
+    documents = await get_documents(
+        user_id=DUMMY_USER_ID, library_id=library_id, cursor=documents_cursor
+    )
 
-    dialogues = await get_dialogues(user_id=DUMMY_USER_ID, library_id=library_id)
+    dialogues = await get_dialogues(
+        user_id=DUMMY_USER_ID, library_id=library_id, cursor=dialogues_cursor
+    )
 
     return templates.TemplateResponse(
         "library.html",
@@ -133,6 +231,32 @@ async def dialogue_update(
     )
 
 
+async def _sse_events(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    async for token in tokens:
+        # Multi-line tokens are sent as several data lines of one event
+        yield "".join(f"data: {line}\n" for line in token.split("\n")) + "\n"
+
+    yield "event: end\ndata: \n\n"
+
+
+@app.get("/dialogue/{dialogue_id}/stream/")
+async def dialogue_stream(
+    user_prompt: Annotated[str, Query()],
+    dialogue_id: UUID = Path(...),
+):
+    prompt = UserPrompt(content=user_prompt)
+
+    tokens = stream_dialogue(
+        user_id=DUMMY_USER_ID, dialogue_id=dialogue_id, user_prompt=prompt
+    )
+
+    return StreamingResponse(
+        _sse_events(tokens),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/signup/")
 async def signup(username: str):
     return PlainTextResponse("Signup is closed.")
@@ -164,9 +288,12 @@ async def home():
     return PlainTextResponse("Welcome! This is home page.")
 
 
-@app.get("/api/library/", response_model=LibraryList)
-async def libraries():
-    return await get_libraries(user_id=DUMMY_USER_ID)
+@app.get("/api/library/", response_model=LibraryList, response_class=JSONResponse)
+async def libraries(
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1),
+):
+    return await get_libraries(user_id=DUMMY_USER_ID, cursor=cursor, limit=limit)
 
 
 @app.post("/api/library/", response_model=Library, status_code=status.HTTP_201_CREATED)
@@ -179,19 +306,85 @@ async def library(library_id: UUID = Path(...)):
     return await get_library(user_id=DUMMY_USER_ID, library_id=library_id)
 
 
-@app.put("/api/library/{library_id}/")
-async def update_library(library_id: UUID = Path(...)):
-    return {"uuid": library_id}
+@app.put(
+    "/api/library/{library_id}/",
+    response_model=Library,
+    response_class=JSONResponse,
+)
+async def library_update(library_id: UUID = Path(...), instance: Library = Body(...)):
+    return await update_library(
+        user_id=DUMMY_USER_ID, library_id=library_id, instance=instance
+    )
 
 
-@app.delete("/api/library/{library_id}/")
-async def remove_library(library_id: UUID = Path(...)):
+@app.put(
+    "/api/library/{library_id}/retrieval/",
+    response_model=Library,
+    response_class=JSONResponse,
+)
+async def library_retrieval(
+    library_id: UUID = Path(...), settings: RetrievalSettings = Body(...)
+):
+    return await update_retrieval(
+        user_id=DUMMY_USER_ID, library_id=library_id, settings=settings
+    )
+
+
+@app.delete("/api/library/{library_id}/", response_class=JSONResponse)
+async def library_remove(library_id: UUID = Path(...)):
+    await remove_library(user_id=DUMMY_USER_ID, library_id=library_id)
+
     return {"uuid": library_id}
 
 
-@app.get("/api/library/{library_id}/document/", response_model=DocumentList)
-async def documents(library_id: UUID = Path(...)):
-    return await get_documents(user_id=DUMMY_USER_ID, library_id=library_id)
+@app.get(
+    "/api/library/{library_id}/document/",
+    response_model=DocumentList,
+    response_class=JSONResponse,
+)
+async def documents(
+    library_id: UUID = Path(...),
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1),
+):
+    return await get_documents(
+        user_id=DUMMY_USER_ID, library_id=library_id, cursor=cursor, limit=limit
+    )
+
+
+@app.post(
+    "/api/library/{library_id}/document/bulk/",
+    response_model=BulkImportStatus,
+    response_class=JSONResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def bulk_import(library_id: UUID = Path(...), instance: BulkImport = Body(...)):
+    return await import_documents(
+        user_id=DUMMY_USER_ID, library_id=library_id, sources=instance.documents
+    )
+
+
+@app.post(
+    "/api/library/{library_id}/document/bulk/upload/",
+    response_model=BulkImportStatus,
+    response_class=JSONResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def bulk_upload(files: list[UploadFile], library_id: UUID = Path(...)):
+    return await upload_documents(
+        user_id=DUMMY_USER_ID, library_id=library_id, files=files
+    )
+
+
+@app.get(
+    "/api/library/{library_id}/import/{batch_id}/",
+    response_model=BulkImportStatus,
+    response_class=JSONResponse,
+)
+async def bulk_import_status(library_id: UUID = Path(...), batch_id: UUID = Path(...)):
+    return await get_import(
+        user_id=DUMMY_USER_ID, library_id=library_id, batch_id=batch_id
+    )
 
 
 @app.post(
@@ -215,11 +408,26 @@ async def document(document_id: UUID = Path(...)):
     return await get_document(user_id=DUMMY_USER_ID, document_id=document_id)
 
 
-@app.post("/api/document/{document_id}/embed/")
+@app.post(
+    "/api/document/{document_id}/embed/",
+    response_model=Job,
+    response_class=JSONResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+)
 async def embed_document(document_id: UUID = Path(...)):
-    resp = await emb_document(user_id=DUMMY_USER_ID, document_id=document_id)
+    return await create_embed_job(user_id=DUMMY_USER_ID, document_id=document_id)
+
+
+@app.get(
+    "/api/document/{document_id}/job/", response_model=Job, response_class=JSONResponse
+)
+async def document_job(document_id: UUID = Path(...)):
+    return await get_document_job(user_id=DUMMY_USER_ID, document_id=document_id)
 
-    return {"result": resp}
+
+@app.get("/api/job/{job_id}/", response_model=Job, response_class=JSONResponse)
+async def job(job_id: UUID = Path(...)):
+    return await get_job(user_id=DUMMY_USER_ID, job_id=job_id)
 
 
 @app.delete("/api/document/{document_id}/")
@@ -227,9 +435,19 @@ async def remove_document(document_id: UUID = Path(...)):
     return {"uuid": document_id}
 
 
-@app.get("/api/library/{library_id}/dialogue/", response_model=DialogueList)
-async def dialogues(library_id: UUID = Path(...)):
-    return await get_dialogues(user_id=DUMMY_USER_ID, library_id=library_id)
+@app.get(
+    "/api/library/{library_id}/dialogue/",
+    response_model=DialogueList,
+    response_class=JSONResponse,
+)
+async def dialogues(
+    library_id: UUID = Path(...),
+    cursor: Optional[str] = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1),
+):
+    return await get_dialogues(
+        user_id=DUMMY_USER_ID, library_id=library_id, cursor=cursor, limit=limit
+    )
 
 
 @app.post(
@@ -260,11 +478,37 @@ async def prompt_send(
     }
 
 
+@app.post("/api/dialogue/{dialogue_id}/stream/")
+async def prompt_stream(
+    dialogue_id: UUID = Path(...),
+    user_prompt: UserPrompt = Body(...),
+):
+    async def chunks():
+        async for token in stream_dialogue(
+            user_id=DUMMY_USER_ID, dialogue_id=dialogue_id, user_prompt=user_prompt
+        ):
+            yield json.dumps({"content": token}) + "\n"
+
+        yield json.dumps({"dialogue_id": str(dialogue_id), "done": True}) + "\n"
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
 @app.delete("/api/dialogue/{dialogue_id}/")
 async def remove_dialogue(dialogue_id: UUID = Path(...)):
     return {"uuid": dialogue_id}
 
 
+@app.get("/api/stats/", response_class=JSONResponse)
+async def stats():
+    return await get_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
 # @app.post("/mongo/db/{db_name}")
 # async def create_mongo_db(db_name: str = Path(...)):
 #     client = get_client()
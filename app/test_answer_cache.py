@@ -0,0 +1,68 @@
+"""test_answer_cache.py"""
+
+from uuid import uuid4
+
+from app.answer_cache import SemanticCache
+
+LIBRARY = uuid4()
+
+
+def test_similar_question_hits():
+    cache = SemanticCache(threshold=0.95)
+    cache.store(LIBRARY, "cohere", [1.0, 0.0], "answer")
+
+    assert cache.lookup(LIBRARY, "cohere", [2.0, 0.1]) == "answer"
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 1.0]) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_answers_are_kept_per_library_and_llm():
+    cache = SemanticCache()
+    cache.store(LIBRARY, "cohere", [1.0, 0.0], "answer")
+
+    assert cache.lookup(LIBRARY, "tongyi", [1.0, 0.0]) is None
+    assert cache.lookup(uuid4(), "cohere", [1.0, 0.0]) is None
+
+
+def test_newer_epoch_misses_and_drops_older_answers():
+    cache = SemanticCache()
+    cache.store(LIBRARY, "cohere", [1.0, 0.0], "old", epoch=1)
+
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 0.0], epoch=1) == "old"
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 0.0], epoch=2) is None
+    assert cache.stats["size"] == 0
+
+    cache.store(LIBRARY, "cohere", [1.0, 0.0], "new", epoch=2)
+
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 0.0], epoch=2) == "new"
+
+
+def test_invalidate_drops_every_llm_of_library():
+    cache = SemanticCache()
+    other = uuid4()
+
+    for llm in ("cohere", "tongyi"):
+        cache.store(LIBRARY, llm, [1.0, 0.0], "answer")
+    cache.store(other, "cohere", [1.0, 0.0], "answer")
+
+    cache.invalidate(LIBRARY)
+
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 0.0]) is None
+    assert cache.lookup(LIBRARY, "tongyi", [1.0, 0.0]) is None
+    assert cache.lookup(other, "cohere", [1.0, 0.0]) == "answer"
+    assert cache.stats["libraries"] == 1
+
+
+def test_expired_and_oldest_answers_are_dropped():
+    cache = SemanticCache(ttl=-1)
+    cache.store(LIBRARY, "cohere", [1.0, 0.0], "answer")
+
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 0.0]) is None
+
+    cache = SemanticCache(maxsize=2)
+
+    for i, vector in enumerate(([1.0, 0.0], [0.0, 1.0], [-1.0, 0.0])):
+        cache.store(LIBRARY, "cohere", vector, str(i))
+
+    assert cache.lookup(LIBRARY, "cohere", [1.0, 0.0]) is None
+    assert cache.lookup(LIBRARY, "cohere", [-1.0, 0.0]) == "2"
@@ -0,0 +1,90 @@
+"""test_condenser.py"""
+
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from app import condenser
+from app.condenser import QuestionCondenser, hash_history, needs_condensing
+from app.util.cache import LRUCache
+
+HISTORY = [HumanMessage(content="What is BM25?"), AIMessage(content="A ranking.")]
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "Why?",
+        "How does it scale?",
+        "And for large libraries, is the index rebuilt on startup?",
+        "它怎么用",
+        "文档太短",
+    ],
+)
+def test_follow_ups_need_condensing(question):
+    assert needs_condensing(question)
+
+
+@pytest.mark.parametrize(
+    "question",
+    [
+        "How does BM25 rank documents in a library?",
+        "向量数据库如何计算余弦相似度",
+    ],
+)
+def test_standalone_questions_do_not(question):
+    assert not needs_condensing(question)
+
+
+def test_history_hash_depends_on_roles_and_content():
+    assert hash_history(HISTORY) == hash_history(list(HISTORY))
+    assert hash_history(HISTORY) != hash_history(HISTORY[:1])
+    assert hash_history(HISTORY[:1]) != hash_history(
+        [AIMessage(content=HISTORY[0].content)]
+    )
+
+
+def test_condensed_questions_are_cached(monkeypatch):
+    monkeypatch.setattr(condenser, "condensed_questions", LRUCache(maxsize=8))
+    calls = []
+
+    def condense(input: dict) -> str:
+        calls.append(input["question"])
+        return f"standalone {input['question']}"
+
+    chain = QuestionCondenser(llm="cohere").wrap(RunnableLambda(condense))
+
+    async def main():
+        return [
+            await chain.ainvoke({"question": question, "chat_history": history})
+            for question, history in [
+                ("Why?", HISTORY),
+                ("Why?", HISTORY),
+                ("Why?", HISTORY[:1]),
+                ("How does BM25 rank documents in a library?", HISTORY),
+            ]
+        ]
+
+    answers = asyncio.run(main())
+
+    assert answers == [
+        "standalone Why?",
+        "standalone Why?",
+        "standalone Why?",
+        "How does BM25 rank documents in a library?",
+    ]
+    assert calls == ["Why?", "Why?"]
+
+
+def test_strategies(monkeypatch):
+    monkeypatch.setattr(condenser, "condensed_questions", LRUCache(maxsize=8))
+    chain = RunnableLambda(lambda input: "condensed")
+    input = {"question": "How does BM25 rank documents?", "chat_history": HISTORY}
+
+    always = QuestionCondenser(llm="cohere", strategy="always").wrap(chain)
+    never = QuestionCondenser(llm="cohere", strategy="never").wrap(chain)
+
+    assert asyncio.run(always.ainvoke(input)) == "condensed"
+    assert asyncio.run(never.ainvoke({**input, "question": "Why?"})) == "Why?"
@@ -0,0 +1,47 @@
+"""test_context.py"""
+
+from langchain_core.documents import Document
+
+from app.context import merge_chunks
+
+TEXT = "The quick brown fox jumps over the lazy dog."
+
+
+def make_chunk(start: int, end: int, source: str = "a.pdf", page: int = 0):
+    return Document(
+        page_content=TEXT[start:end],
+        metadata={"source": source, "page": page, "start_index": start},
+    )
+
+
+def test_merge_overlapping_chunks():
+    chunks = [make_chunk(10, 30), make_chunk(0, 16)]
+
+    assert merge_chunks(chunks) == [TEXT[:30]]
+
+
+def test_merge_adjacent_chunks():
+    assert merge_chunks([make_chunk(0, 10), make_chunk(10, 20)]) == [TEXT[:20]]
+
+
+def test_keep_separate_spans_and_pages():
+    chunks = [
+        make_chunk(0, 10),
+        make_chunk(20, 30),
+        make_chunk(0, 10, page=1),
+        make_chunk(0, 10, source="b.pdf"),
+    ]
+
+    assert merge_chunks(chunks) == [TEXT[:10], TEXT[20:30]]
+
+
+def test_passages_follow_best_rank():
+    chunks = [make_chunk(20, 30, page=1), make_chunk(0, 10), make_chunk(25, 35, page=1)]
+
+    assert merge_chunks(chunks) == [TEXT[20:35], TEXT[:10]]
+
+
+def test_chunks_without_source_are_kept_apart():
+    chunks = [Document(page_content="one"), Document(page_content="two")]
+
+    assert merge_chunks(chunks) == ["one", "two"]
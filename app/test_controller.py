@@ -0,0 +1,186 @@
+"""test_controller.py"""
+
+import asyncio
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+
+from app import controller
+from app.entity import Job
+from benchmarks.mongo import Client
+
+USER_ID = uuid4()
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    client = Client()
+    monkeypatch.setattr(controller, "get_client", lambda: client)
+    monkeypatch.setattr(controller, "JOB_MAX_ATTEMPTS", 2)
+
+    return controller._get_collection(collection_name="job")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def insert_job(jobs, **fields) -> Job:
+    job = Job(user_id=USER_ID, document_id=uuid4(), next_attempt_at=None)
+    await jobs.insert_one({**job.model_dump(by_alias=True, exclude=["id"]), **fields})
+
+    return job
+
+
+def test_run_claims_job_once(jobs, monkeypatch):
+    calls = []
+
+    async def emb_document(user_id, document_id, on_progress, checkpoint):
+        calls.append(checkpoint)
+        await on_progress(3, 30, 0.5)
+
+    monkeypatch.setattr(controller, "emb_document", emb_document)
+
+    async def main():
+        job = await insert_job(jobs, checkpoint=2)
+
+        await asyncio.gather(
+            controller.run_embed_job(str(job.uuid)),
+            controller.run_embed_job(str(job.uuid)),
+        )
+
+        return await jobs.find_one({"uuid": job.uuid})
+
+    record = run(main())
+
+    assert calls == [2]
+    assert record["status"] == "done"
+    assert record["attempts"] == 1
+    assert record["checkpoint"] == 3
+    assert record["progress"] == 1.0
+    assert record["next_attempt_at"] is None
+
+
+def test_failed_job_is_retried_then_fails(jobs, monkeypatch):
+    async def emb_document(**kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(controller, "emb_document", emb_document)
+
+    async def main():
+        job = await insert_job(jobs)
+
+        with pytest.raises(RuntimeError):
+            await controller.run_embed_job(str(job.uuid))
+
+        retrying = await jobs.find_one({"uuid": job.uuid})
+
+        # Not due yet, so a duplicate entry does not claim it
+        await controller.run_embed_job(str(job.uuid))
+        assert (await jobs.find_one({"uuid": job.uuid}))["attempts"] == 1
+
+        await jobs.update_one(
+            {"uuid": job.uuid}, {"$set": {"next_attempt_at": datetime.now()}}
+        )
+
+        with pytest.raises(RuntimeError):
+            await controller.run_embed_job(str(job.uuid))
+
+        return retrying, await jobs.find_one({"uuid": job.uuid})
+
+    retrying, failed = run(main())
+
+    assert retrying["status"] == "retrying"
+    assert retrying["next_attempt_at"] > datetime.now()
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 2
+    assert "boom" in failed["error"]
+
+
+def test_progress_renews_lease(jobs, monkeypatch):
+    leases = []
+
+    async def emb_document(user_id, document_id, on_progress, checkpoint):
+        record = await jobs.find_one({"document_id": document_id})
+        leases.append(record["next_attempt_at"])
+
+        await asyncio.sleep(0.01)
+        await on_progress(1, 10, None)
+
+        record = await jobs.find_one({"document_id": document_id})
+        leases.append(record["next_attempt_at"])
+
+    monkeypatch.setattr(controller, "emb_document", emb_document)
+
+    async def main():
+        job = await insert_job(jobs)
+        await controller.run_embed_job(str(job.uuid))
+
+    run(main())
+
+    assert leases[1] > leases[0] > datetime.now()
+
+
+def test_recover_requeues_expired_and_due_jobs(jobs):
+    expired = datetime.now() - timedelta(seconds=1)
+
+    async def main():
+        lost = await insert_job(
+            jobs, status="running", attempts=1, next_attempt_at=expired
+        )
+        spent = await insert_job(
+            jobs, status="running", attempts=2, next_attempt_at=expired
+        )
+        due = await insert_job(
+            jobs, status="retrying", attempts=1, next_attempt_at=expired
+        )
+        queued = await insert_job(jobs, status="pending", next_attempt_at=expired)
+        running = await insert_job(
+            jobs,
+            status="running",
+            attempts=1,
+            next_attempt_at=controller._get_lease_end(),
+        )
+
+        job_ids = await controller.recover_embed_jobs()
+
+        statuses = {
+            name: (await jobs.find_one({"uuid": job.uuid}))["status"]
+            for name, job in [
+                ("lost", lost),
+                ("spent", spent),
+                ("due", due),
+                ("queued", queued),
+                ("running", running),
+            ]
+        }
+
+        return job_ids, [str(lost.uuid), str(due.uuid)], statuses
+
+    job_ids, expected, statuses = run(main())
+
+    assert sorted(job_ids) == sorted(expected)
+    assert statuses == {
+        "lost": "pending",
+        "spent": "failed",
+        "due": "pending",
+        "queued": "pending",
+        "running": "running",
+    }
+
+    # Recovered jobs get a fresh lease, so they are not queued twice
+    assert run(controller.recover_embed_jobs()) == []
+
+
+def test_recover_pending_jobs_of_lost_queue(jobs):
+    async def main():
+        queued = await insert_job(
+            jobs, status="pending", next_attempt_at=controller._get_lease_end()
+        )
+
+        return str(queued.uuid), await controller.recover_embed_jobs(pending=True)
+
+    job_id, job_ids = run(main())
+
+    assert job_ids == [job_id]
@@ -0,0 +1,70 @@
+"""test_embedding_cache.py"""
+
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app import embedding_cache
+from app.embedding_cache import CachedEmbeddings, _dumps, _loads
+from app.util.cache import LRUCache
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.texts: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        self.texts.append(text)
+        return [float(len(text)), -1.0]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "REDIS_URI", "")
+    monkeypatch.setattr(embedding_cache, "local_cache", LRUCache(maxsize=16))
+
+    return CountingEmbeddings()
+
+
+def test_identical_texts_are_embedded_once(model):
+    embeddings = CachedEmbeddings(model, namespace="test")
+
+    first = embeddings.embed_documents(["a", "bb", "a"])
+    second = embeddings.embed_documents(["bb", "ccc"])
+
+    assert first == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert second == [[2.0, 1.0], [3.0, 1.0]]
+    assert model.texts == ["a", "bb", "ccc"]
+
+
+def test_queries_and_namespaces_are_cached_apart(model):
+    embeddings = CachedEmbeddings(model, namespace="test")
+
+    embeddings.embed_documents(["a"])
+
+    assert embeddings.embed_query("a") == [1.0, -1.0]
+    assert asyncio.run(embeddings.aembed_query("a")) == [1.0, -1.0]
+
+    CachedEmbeddings(model, namespace="other").embed_documents(["a"])
+
+    assert model.texts == ["a", "a", "a"]
+
+
+def test_async_and_sync_share_the_cache(model):
+    embeddings = CachedEmbeddings(model, namespace="test")
+
+    asyncio.run(embeddings.aembed_documents(["a", "bb"]))
+
+    assert embeddings.embed_documents(["bb", "a"]) == [[2.0, 1.0], [1.0, 1.0]]
+    assert model.texts == ["a", "bb"]
+
+
+def test_vectors_round_trip_through_redis_encoding():
+    vector = [0.1, -2.5, 3.0]
+
+    assert _loads(_dumps(vector)) == vector
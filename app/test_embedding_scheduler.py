@@ -0,0 +1,102 @@
+"""test_embedding_scheduler.py"""
+
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from app import embedding_scheduler
+from app.embedding_scheduler import ScheduledEmbeddings, TokenBucket
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FlakyEmbeddings(Embeddings):
+    """Answers 429 to the first `failures` requests."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches: list[list[str]] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.failures:
+            self.failures -= 1
+            raise RateLimitError()
+
+        self.batches.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [float(len(text))]
+
+
+@pytest.fixture(autouse=True)
+def buckets(monkeypatch):
+    monkeypatch.setattr(embedding_scheduler, "buckets", {})
+    monkeypatch.setattr(embedding_scheduler, "stats", {})
+    monkeypatch.setenv("TEST_EMBEDDING_BATCH_SIZE", "2")
+    monkeypatch.setenv("TEST_EMBEDDING_RATE", "1000")
+    monkeypatch.setenv("TEST_EMBEDDING_QUERY_RATE", "1000")
+
+
+def test_bucket_spaces_requests_beyond_burst():
+    bucket = TokenBucket(rate=10.0)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_bucket_throttles_and_recovers():
+    bucket = TokenBucket(rate=64.0)
+
+    for _ in range(10):
+        bucket.throttle()
+
+    assert bucket.rate == 1.0
+
+    for _ in range(30):
+        bucket.recover()
+
+    assert bucket.rate == 64.0
+
+
+def test_documents_are_embedded_in_batches_in_order():
+    model = FlakyEmbeddings()
+    embeddings = ScheduledEmbeddings(model, provider="test")
+
+    vectors = asyncio.run(embeddings.aembed_documents(["a", "bb", "ccc", "dddd", "e"]))
+
+    assert vectors == [[1.0], [2.0], [3.0], [4.0], [1.0]]
+    assert sorted(map(len, model.batches)) == [1, 2, 2]
+    assert embeddings.embed_documents(["a", "bb", "ccc"]) == [[1.0], [2.0], [3.0]]
+
+
+def test_rate_limited_batches_are_retried_slower():
+    model = FlakyEmbeddings(failures=2)
+    embeddings = ScheduledEmbeddings(model, provider="test")
+
+    assert embeddings.embed_documents(["a"]) == [[1.0]]
+    assert embedding_scheduler.get_stats()["test"]["throttled"] == 2
+    assert embeddings.bucket.rate < embeddings.bucket.max_rate
+
+
+def test_queries_do_not_wait_behind_documents(monkeypatch):
+    monkeypatch.setenv("TEST_EMBEDDING_RATE", "1")
+    embeddings = ScheduledEmbeddings(FlakyEmbeddings(), provider="test")
+
+    # An ingestion that has reserved the document bucket far ahead
+    for _ in range(100):
+        embeddings.bucket.reserve()
+
+    assert embeddings.query_bucket is not embeddings.bucket
+    assert embeddings.query_bucket.reserve() == 0.0
+
+
+def test_missing_limits_fall_back_to_defaults(monkeypatch):
+    monkeypatch.setitem(embedding_scheduler.PROVIDER_LIMITS, "partial", {"rate": 1.0})
+
+    assert embedding_scheduler.get_provider_limit("partial", "rate") == 1.0
+    assert embedding_scheduler.get_provider_limit("partial", "query_rate") == 2.0
@@ -0,0 +1,50 @@
+"""test_history.py"""
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.history import SUMMARY_PREFIX, get_window_start, with_summary
+from app.util.tokens import count_message_tokens
+
+
+def make_turns(count: int, text: str = "word " * 20) -> list:
+    messages = []
+
+    for _ in range(count):
+        messages.extend([HumanMessage(content=text), AIMessage(content=text)])
+
+    return messages
+
+
+def test_window_keeps_at_most_max_turns():
+    messages = make_turns(6)
+
+    assert get_window_start(messages, budget=10000, max_turns=4) == 4
+
+
+def test_window_keeps_turns_within_budget():
+    messages = make_turns(6)
+    turn = count_message_tokens(messages[:2])
+
+    assert get_window_start(messages, budget=2 * turn, max_turns=4) == 8
+    assert get_window_start(messages, budget=turn - 1, max_turns=4) == 12
+
+
+def test_window_keeps_short_history_whole():
+    assert get_window_start(make_turns(2), budget=10000, max_turns=4) == 0
+    assert get_window_start([], budget=10000, max_turns=4) == 0
+
+
+def test_window_counts_unanswered_question_as_turn():
+    messages = [*make_turns(2), HumanMessage(content="question")]
+
+    assert get_window_start(messages, budget=10000, max_turns=1) == 3
+
+
+def test_with_summary():
+    messages = make_turns(1)
+
+    assert with_summary(None, messages) is messages
+    assert with_summary("earlier", messages) == [
+        SystemMessage(content=SUMMARY_PREFIX + "earlier"),
+        *messages,
+    ]
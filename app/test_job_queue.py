@@ -0,0 +1,63 @@
+"""test_job_queue.py"""
+
+import asyncio
+import json
+
+import pytest
+
+from app import job_queue
+from app.job_queue import LocalJobQueue
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = LocalJobQueue()
+    monkeypatch.setattr(job_queue, "queue", queue)
+    monkeypatch.setattr(job_queue, "JOB_RECOVERY_INTERVAL", 0.01)
+
+    return queue
+
+
+async def recover_for(recover, seconds: float = 0.05):
+    task = asyncio.create_task(job_queue._recover(recover))
+    await asyncio.sleep(seconds)
+    task.cancel()
+
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_pending_jobs_recovered_only_into_empty_queue_at_startup(queue):
+    calls = []
+
+    async def recover(pending: bool) -> list[str]:
+        calls.append(pending)
+        return ["a"] if pending else []
+
+    asyncio.run(recover_for(recover))
+
+    assert calls[0] is True
+    assert not any(calls[1:])
+    assert queue.queue.qsize() == 1
+
+
+def test_pending_jobs_not_recovered_while_queued(queue):
+    calls = []
+
+    async def recover(pending: bool) -> list[str]:
+        calls.append(pending)
+        return []
+
+    async def main():
+        await job_queue.enqueue("a")
+        await recover_for(recover)
+
+    asyncio.run(main())
+
+    assert calls and not any(calls)
+
+
+def test_parse_drops_malformed_payloads():
+    assert job_queue._parse(json.dumps({"job_id": "a"})) == "a"
+    assert job_queue._parse("not json") is None
+    assert job_queue._parse(json.dumps({"id": "a"})) is None
+    assert job_queue._parse(json.dumps(["a"])) is None
@@ -0,0 +1,101 @@
+"""test_metrics.py"""
+
+from uuid import uuid4
+
+import pytest
+
+from app import metrics
+from app.metrics import Histogram, StageTimer
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "histograms", [])
+    monkeypatch.setattr(metrics, "gauges", {})
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage="retrieve")
+
+    lines = histogram.render()
+
+    assert lines[:2] == ["# HELP test_seconds Test.", "# TYPE test_seconds histogram"]
+    assert lines[2:] == [
+        'test_seconds_bucket{stage="retrieve",le="0.1"} 1',
+        'test_seconds_bucket{stage="retrieve",le="1.0"} 3',
+        'test_seconds_bucket{stage="retrieve",le="+Inf"} 4',
+        'test_seconds_sum{stage="retrieve"} 6.05',
+        'test_seconds_count{stage="retrieve"} 4',
+    ]
+
+
+def test_time_observes_labels_added_inside_block():
+    histogram = Histogram("test_seconds", "Test.", ("method", "status"))
+
+    with histogram.time(method="GET") as labels:
+        labels["status"] = 200
+
+    assert 'test_seconds_count{method="GET",status="200"} 1' in histogram.render()
+
+
+def test_render_escapes_gauge_labels():
+    metrics.register_gauge("test_size", "Size.", lambda: {(("name", 'a"b'),): 3, (): 1})
+
+    assert metrics.render().splitlines() == [
+        "# HELP test_size Size.",
+        "# TYPE test_size gauge",
+        'test_size{name="a\\"b"} 3',
+        "test_size 1",
+    ]
+
+
+def test_stage_timer_observes_dialogue_stages(monkeypatch):
+    histogram = Histogram("test_seconds", "Test.", ("stage", "llm"))
+    monkeypatch.setattr(metrics, "DIALOGUE_STAGE_DURATION", histogram)
+    timer = StageTimer(llm="cohere")
+    runs = [uuid4() for _ in range(5)]
+
+    timer.on_chain_start({}, {}, run_id=runs[0], name="condense")
+    timer.on_chat_model_start({}, [], run_id=runs[1], tags=["condense"])
+    timer.on_llm_end(None, run_id=runs[1])
+    timer.on_chain_end({}, run_id=runs[0])
+
+    # Retrievers fused by the outer one are not timed apart
+    timer.on_retriever_start({}, "query", run_id=runs[2])
+    timer.on_retriever_start({}, "query", run_id=runs[3])
+    timer.on_retriever_end([], run_id=runs[3])
+    timer.on_retriever_end([], run_id=runs[2])
+
+    timer.on_chat_model_start({}, [], run_id=runs[4])
+    timer.on_llm_new_token("a", run_id=runs[4])
+    timer.on_llm_new_token("b", run_id=runs[4])
+    timer.on_llm_end(None, run_id=runs[4])
+
+    counts = {
+        line.split('"')[1]: line.rsplit(" ", 1)[1]
+        for line in histogram.render()
+        if line.startswith("test_seconds_count")
+    }
+
+    assert counts == {
+        "condense": "1",
+        "retrieve": "1",
+        "generate": "1",
+        "first_token": "1",
+    }
+
+
+def test_stage_timer_drops_failed_runs(monkeypatch):
+    histogram = Histogram("test_seconds", "Test.", ("stage",))
+    monkeypatch.setattr(metrics, "DIALOGUE_STAGE_DURATION", histogram)
+    timer = StageTimer()
+    run_id = uuid4()
+
+    timer.on_retriever_start({}, "query", run_id=run_id)
+    timer.on_retriever_error(ValueError(), run_id=run_id)
+    timer.on_retriever_end([], run_id=run_id)
+
+    assert histogram.render()[2:] == []
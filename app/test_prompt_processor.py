@@ -0,0 +1,80 @@
+"""test_prompt_processor.py"""
+
+from uuid import uuid4
+
+import pytest
+
+from app import backends, prompt_processor
+from app.util.cache import LRUCache
+
+FIRST, SECOND = uuid4(), uuid4()
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    builds = []
+
+    def build_chain(*key):
+        builds.append(key)
+        return object()
+
+    monkeypatch.setattr(prompt_processor, "build_chain", build_chain)
+    monkeypatch.setattr(prompt_processor, "chain_cache", LRUCache(maxsize=8))
+
+    return builds
+
+
+def get_chain(collection=FIRST, vectordb="local", llm="cohere", **kwargs):
+    return prompt_processor.get_chain("cohere", vectordb, collection, llm, **kwargs)
+
+
+def test_chain_is_built_once_per_configuration(builds):
+    chain = get_chain()
+
+    assert get_chain() is chain
+    assert get_chain(llm="tongyi") is not chain
+    assert get_chain(retrieval='{"k": 8}') is not chain
+    assert get_chain(answer_cache=True) is not chain
+    assert get_chain(collection=SECOND) is not chain
+    assert len(builds) == 5
+
+
+def test_invalidate_chains_of_library(builds):
+    other = get_chain(collection=SECOND)
+    combined = get_chain(collection=SECOND, libraries=(("cohere", "local", FIRST, ""),))
+    get_chain()
+
+    assert prompt_processor.invalidate_chains(FIRST) == 2
+
+    assert get_chain(collection=SECOND) is other
+    assert (
+        get_chain(collection=SECOND, libraries=(("cohere", "local", FIRST, ""),))
+        is not combined
+    )
+    assert len(builds) == 4
+
+
+def test_invalidate_chains_of_replaced_backend(builds):
+    local = get_chain()
+    get_chain(vectordb="qdrant")
+    get_chain(libraries=(("cohere", "qdrant", SECOND, ""),))
+
+    assert prompt_processor.invalidate_backend("qdrant_async") == 2
+    assert get_chain() is local
+
+
+def test_chains_of_unbound_stores_are_not_cached(builds, monkeypatch):
+    monkeypatch.setattr(prompt_processor, "vectorstores", LRUCache(maxsize=8))
+    monkeypatch.setattr(backends, "vectorstores", prompt_processor.vectorstores)
+
+    # The Milvus collection does not exist yet, so its store was not shared
+    get_chain(vectordb="milvus")
+    get_chain(libraries=(("cohere", "milvus", SECOND, ""),))
+
+    assert len(prompt_processor.chain_cache) == 0
+
+    prompt_processor.vectorstores.set(("milvus", "cohere", FIRST), object())
+    chain = get_chain(vectordb="milvus")
+
+    assert get_chain(vectordb="milvus") is chain
+    assert len(builds) == 3
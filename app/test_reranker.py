@@ -0,0 +1,42 @@
+"""test_reranker.py"""
+
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from app import reranker
+from app.reranker import Reranker
+from app.util.cache import LRUCache
+
+
+class LengthReranker(Reranker):
+    """Scores longer chunks higher."""
+
+    model = "length"
+
+    def __init__(self):
+        self.calls: list[list[str]] = []
+
+    async def ascore(self, query: str, texts: list[str]) -> list[float]:
+        self.calls.append(texts)
+        return [float(len(text)) for text in texts]
+
+
+def test_reranker_requires_ascore():
+    with pytest.raises(TypeError):
+        Reranker()
+
+
+def test_rerank_orders_and_caches_scores(monkeypatch):
+    monkeypatch.setattr(reranker, "scores", LRUCache(maxsize=16))
+    model = LengthReranker()
+    documents = [Document(page_content=text) for text in ("bb", "a", "cccc")]
+
+    ranked = asyncio.run(model.arerank("query", documents, 2))
+
+    assert [document.page_content for document in ranked] == ["cccc", "bb"]
+
+    asyncio.run(model.arerank("query", documents + [Document(page_content="ddd")], 4))
+
+    assert model.calls == [["bb", "a", "cccc"], ["ddd"]]
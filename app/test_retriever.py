@@ -0,0 +1,45 @@
+"""test_retriever.py"""
+
+import pytest
+from langchain_core.documents import Document
+
+from app.retriever import LEXICAL_WEIGHT, fuse, get_lexical_weight
+
+
+def make_documents(*texts: str) -> list[Document]:
+    return [Document(page_content=text) for text in texts]
+
+
+def test_fuse_ranks_by_reciprocal_rank():
+    fused = fuse([make_documents("a", "b", "c"), make_documents("b", "d")])
+
+    assert [document.page_content for document in fused] == ["b", "a", "d", "c"]
+
+
+def test_fuse_drops_duplicates_differing_in_whitespace():
+    first = Document(page_content="same  text\n", metadata={"store": 1})
+    second = Document(page_content="same text", metadata={"store": 2})
+
+    fused = fuse([[first], [second]])
+
+    assert fused == [first]
+
+
+def test_fuse_weights():
+    results = [make_documents("a", "b"), make_documents("b", "a")]
+
+    assert fuse(results, weights=[1.0, 0.5])[0].page_content == "a"
+    assert fuse(results, weights=[0.5, 1.0])[0].page_content == "b"
+
+
+def test_fuse_empty():
+    assert fuse([]) == []
+    assert fuse([[], []]) == []
+
+
+@pytest.mark.parametrize("weight", [None, 0.5])
+def test_lexical_weight_defaults_to_local_stores(weight):
+    assert get_lexical_weight("local", weight) == (
+        LEXICAL_WEIGHT if weight is None else weight
+    )
+    assert get_lexical_weight("qdrant", weight) == (0.0 if weight is None else weight)
@@ -0,0 +1,106 @@
+"""cache.py"""
+
+import time
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """In-process LRU cache with optional time-to-live eviction.
+
+    Entries are evicted when the cache grows beyond `maxsize`, or lazily on
+    access once they are older than `ttl` seconds. Hit, miss and eviction
+    counters are kept so they can be exposed for monitoring.
+    """
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Optional[tuple[float, Any]]:
+        entry = self._data.get(key)
+
+        if entry is None:
+            return None
+
+        if self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._data[key]
+            self.evictions += 1
+            return None
+
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._lookup(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+
+            return default if entry is None else entry[1]
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Removes every entry whose key matches `predicate`.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+
+            for key in keys:
+                del self._data[key]
+
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,41 @@
+"""pagination.py"""
+
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(document: dict, sort_field: str) -> str:
+    """Encodes the sort key of the last document of a page as an opaque token."""
+    payload = {"t": document[sort_field].isoformat(), "id": str(document["_id"])}
+
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    """Raises ValueError, or InvalidId for its id, on a malformed cursor."""
+    payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+    if not isinstance(payload, dict) or not all(
+        isinstance(payload.get(key), str) for key in ("t", "id")
+    ):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+    return datetime.fromisoformat(payload["t"]), ObjectId(payload["id"])
+
+
+def get_keyset_filter(sort_field: str, cursor: str) -> dict:
+    """Matches the documents after `cursor` in (sort_field, _id) descending order."""
+    value, object_id = decode_cursor(cursor)
+
+    return {
+        "$or": [
+            {sort_field: {"$lt": value}},
+            {sort_field: value, "_id": {"$lt": object_id}},
+        ]
+    }
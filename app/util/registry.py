@@ -0,0 +1,79 @@
+"""registry.py"""
+
+import os
+from collections.abc import MutableMapping
+from typing import Callable, Iterator, Optional
+
+registries: list["Registry"] = []
+
+
+def get_enabled(kind: str) -> Optional[set[str]]:
+    """Backends listed in `<KIND>_BACKENDS`, or None when all are enabled."""
+    value = os.getenv(f"{kind.upper()}_BACKENDS", "")
+
+    return {name.strip() for name in value.split(",") if name.strip()} or None
+
+
+class Registry(MutableMapping):
+    """Backend factories by name, limited to the enabled backends.
+
+    Factories import their SDK when called, so a process only pays the
+    import time and memory of the backends it uses. Setting
+    `<KIND>_BACKENDS` to comma-separated names leaves out the others, and
+    factories registered later, e.g. by plugins, are always enabled.
+    """
+
+    def __init__(self, kind: str, factories: dict[str, Callable]):
+        self.kind = kind
+
+        enabled = get_enabled(kind)
+
+        self.factories = {
+            name: factory
+            for name, factory in factories.items()
+            if enabled is None or name in enabled
+        }
+        self.used: set[str] = set()
+
+        registries.append(self)
+
+    def __getitem__(self, name: str) -> Callable:
+        if name not in self.factories:
+            raise KeyError(
+                f"{self.kind} backend {name!r} is not enabled, "
+                f"expected one of {sorted(self.factories)}"
+            )
+
+        self.used.add(name)
+
+        return self.factories[name]
+
+    def __setitem__(self, name: str, factory: Callable):
+        self.factories[name] = factory
+
+    def __delitem__(self, name: str):
+        del self.factories[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.factories
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.factories)
+
+    def __len__(self) -> int:
+        return len(self.factories)
+
+
+def get_stats() -> dict:
+    """Enabled and used backends by kind, across every registry."""
+    stats: dict[str, dict] = {}
+
+    for registry in registries:
+        record = stats.setdefault(registry.kind, {"enabled": set(), "used": set()})
+        record["enabled"].update(registry.factories)
+        record["used"].update(registry.used)
+
+    return {
+        kind: {key: sorted(names) for key, names in record.items()}
+        for kind, record in stats.items()
+    }
@@ -0,0 +1,106 @@
+"""singleflight.py"""
+
+import asyncio
+from typing import Any, AsyncIterator, Callable, Hashable, Optional
+
+
+class Flight:
+    """One in-flight run, replayed to every subscriber from its first chunk."""
+
+    def __init__(self):
+        self.chunks: list = []
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical async streams into one run.
+
+    The first caller of a key leads: its stream runs in a task of its own,
+    and callers arriving while it is in flight follow it, receiving every
+    chunk from the start. The run is cancelled only once all of its
+    subscribers are gone, and a key is forgotten as soon as its run ends, so
+    nothing is cached beyond the requests that overlap.
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+
+        self._flights: dict[Hashable, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def _run(self, key: Hashable, flight: Flight, stream: AsyncIterator):
+        try:
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+
+                async with flight.changed:
+                    flight.changed.notify_all()
+        except Exception as error:
+            flight.error = error
+        finally:
+            flight.done = True
+
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+            async with flight.changed:
+                flight.changed.notify_all()
+
+    async def stream(
+        self, key: Hashable, factory: Callable[[], AsyncIterator]
+    ) -> AsyncIterator[Any]:
+        """Yields the chunks of `factory()`, shared with identical calls."""
+        flight = self._flights.get(key)
+
+        if flight is None:
+            flight = self._flights[key] = Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, factory()))
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        flight.subscribers += 1
+        index = 0
+
+        try:
+            while True:
+                async with flight.changed:
+                    while index == len(flight.chunks) and not flight.done:
+                        await flight.changed.wait()
+
+                while index < len(flight.chunks):
+                    index += 1
+                    yield flight.chunks[index - 1]
+
+                if flight.done and index == len(flight.chunks):
+                    break
+
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            flight.subscribers -= 1
+
+            if not flight.done and not flight.subscribers:
+                # Later callers start afresh rather than follow a cancelled run
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+                flight.task.cancel()
+
+    @property
+    def stats(self) -> dict:
+        calls = self.leaders + self.followers
+
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "coalesced_rate": self.followers / calls if calls else 0.0,
+        }
@@ -0,0 +1,59 @@
+"""test_pagination.py"""
+
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.util.pagination import decode_cursor, encode_cursor, get_keyset_filter
+
+
+def test_cursor_round_trip():
+    document = {"_id": ObjectId(), "datetime_created": datetime(2024, 5, 1, 12, 30)}
+
+    cursor = encode_cursor(document, "datetime_created")
+
+    assert decode_cursor(cursor) == (document["datetime_created"], document["_id"])
+
+
+def test_keyset_filter_breaks_ties_by_id():
+    document = {"_id": ObjectId(), "datetime_created": datetime(2024, 5, 1)}
+
+    cursor = encode_cursor(document, "datetime_created")
+
+    assert get_keyset_filter("datetime_created", cursor) == {
+        "$or": [
+            {"datetime_created": {"$lt": document["datetime_created"]}},
+            {
+                "datetime_created": document["datetime_created"],
+                "_id": {"$lt": document["_id"]},
+            },
+        ]
+    }
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        b"[1]",
+        b"1",
+        b"null",
+        b'{"t": 1, "id": "0"}',
+        b'{"t": "2024-05-01"}',
+        b'{"t": "yesterday", "id": "0"}',
+        b"not json",
+    ],
+)
+def test_malformed_cursor_raises_value_error(payload):
+    with pytest.raises(ValueError):
+        decode_cursor(base64.urlsafe_b64encode(payload).decode())
+
+
+def test_cursor_with_invalid_id_raises_invalid_id():
+    payload = json.dumps({"t": "2024-05-01", "id": "0"}).encode()
+
+    with pytest.raises(InvalidId):
+        decode_cursor(base64.urlsafe_b64encode(payload).decode())
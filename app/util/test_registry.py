@@ -0,0 +1,61 @@
+"""test_registry.py"""
+
+import subprocess
+import sys
+
+import pytest
+
+from app.util import registry
+from app.util.registry import Registry, get_enabled
+
+
+@pytest.fixture(autouse=True)
+def registries(monkeypatch):
+    monkeypatch.setattr(registry, "registries", [])
+
+
+def test_all_backends_enabled_by_default(monkeypatch):
+    monkeypatch.delenv("TEST_BACKENDS", raising=False)
+
+    assert get_enabled("test") is None
+    assert sorted(Registry("test", {"a": int, "b": str})) == ["a", "b"]
+
+
+def test_backends_are_restricted_by_env(monkeypatch):
+    monkeypatch.setenv("TEST_BACKENDS", " a, c ,")
+    backends = Registry("test", {"a": int, "b": str})
+
+    assert list(backends) == ["a"]
+    assert "b" not in backends
+
+    with pytest.raises(KeyError, match="'b' is not enabled"):
+        backends["b"]
+
+    # Plugins registering later are enabled anyway
+    backends["b"] = str
+
+    assert backends["b"] is str
+
+
+def test_stats_merge_enabled_and_used_by_kind(monkeypatch):
+    monkeypatch.delenv("TEST_BACKENDS", raising=False)
+    first = Registry("test", {"a": int})
+    Registry("test", {"b": str})
+
+    first["a"]
+
+    assert registry.get_stats() == {"test": {"enabled": ["a", "b"], "used": ["a"]}}
+
+
+def test_backend_sdks_are_imported_lazily():
+    sdks = ["cohere", "dashscope", "dashvector", "pymilvus", "qdrant_client"]
+    code = (
+        "import sys, app.backends; "
+        f"print([sdk for sdk in {sdks!r} if sdk in sys.modules])"
+    )
+
+    output = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code], capture_output=True, check=True, text=True
+    ).stdout
+
+    assert output.strip() == "[]"
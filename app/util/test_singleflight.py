@@ -0,0 +1,165 @@
+"""test_singleflight.py"""
+
+import asyncio
+
+import pytest
+
+from app.util.singleflight import SingleFlight
+
+
+class Source:
+    """Counts runs of a stream that yields `chunks` once `gate` is set."""
+
+    def __init__(self, chunks: list, error: Exception = None):
+        self.chunks = chunks
+        self.error = error
+        self.runs = 0
+        self.cancelled = False
+        self.gate = asyncio.Event()
+
+    async def stream(self):
+        self.runs += 1
+
+        try:
+            for chunk in self.chunks:
+                await self.gate.wait()
+                yield chunk
+
+            if self.error is not None:
+                raise self.error
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def read_all(stream) -> list:
+    return [chunk async for chunk in stream]
+
+
+async def collect(flights: SingleFlight, key, source: Source) -> list:
+    return await read_all(flights.stream(key, source.stream))
+
+
+def test_identical_streams_share_one_run():
+    async def main():
+        flights = SingleFlight()
+        source = Source(["a", "b", "c"])
+
+        tasks = [asyncio.create_task(collect(flights, "key", source)) for _ in range(3)]
+        await asyncio.sleep(0)
+        source.gate.set()
+
+        assert await asyncio.gather(*tasks) == [["a", "b", "c"]] * 3
+        assert source.runs == 1
+        assert flights.stats == {
+            "in_flight": 0,
+            "leaders": 1,
+            "followers": 2,
+            "coalesced_rate": 2 / 3,
+        }
+
+    asyncio.run(main())
+
+
+def test_late_follower_replays_from_start():
+    async def main():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+        runs = []
+
+        async def stream():
+            runs.append(1)
+            yield "a"
+            await gate.wait()
+            yield "b"
+
+        leader = flights.stream("key", stream)
+        assert await leader.__anext__() == "a"
+
+        follower = asyncio.create_task(read_all(flights.stream("key", stream)))
+        await asyncio.sleep(0)
+        gate.set()
+
+        assert await follower == ["a", "b"]
+        assert [chunk async for chunk in leader] == ["b"]
+        assert len(runs) == 1
+
+    asyncio.run(main())
+
+
+def test_distinct_keys_and_finished_runs_are_not_shared():
+    async def main():
+        flights = SingleFlight()
+        source = Source(["a"])
+        source.gate.set()
+
+        await asyncio.gather(
+            collect(flights, "one", source), collect(flights, "two", source)
+        )
+        await collect(flights, "one", source)
+
+        assert source.runs == 3
+        assert len(flights) == 0
+
+    asyncio.run(main())
+
+
+def test_error_reaches_every_subscriber():
+    async def main():
+        flights = SingleFlight()
+        source = Source(["a"], error=ValueError("failed"))
+
+        tasks = [asyncio.create_task(collect(flights, "key", source)) for _ in range(2)]
+        await asyncio.sleep(0)
+        source.gate.set()
+
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert source.runs == 1
+        assert len(flights) == 0
+
+    asyncio.run(main())
+
+
+def test_follower_outlives_cancelled_leader():
+    async def main():
+        flights = SingleFlight()
+        source = Source(["a", "b"])
+
+        leader = asyncio.create_task(collect(flights, "key", source))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(collect(flights, "key", source))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        source.gate.set()
+
+        assert await follower == ["a", "b"]
+        assert not source.cancelled
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+
+
+def test_run_is_cancelled_without_subscribers():
+    async def main():
+        flights = SingleFlight()
+        source = Source(["a"])
+
+        task = asyncio.create_task(collect(flights, "key", source))
+        await asyncio.sleep(0)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        await asyncio.sleep(0)
+
+        assert source.cancelled
+        assert len(flights) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,23 @@
+"""tokens.py"""
+
+from langchain_core.messages import BaseMessage
+
+# Tokens added by chat formats around the content of every message
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    """Approximates the token count of a text without a model tokenizer.
+
+    CJK characters take about one token each and other text about four
+    characters per token, which is close enough for budgeting prompts.
+    """
+    cjk = sum(1 for char in text if "\u3000" <= char <= "\u9fff")
+
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages: list[BaseMessage]) -> int:
+    return sum(
+        count_tokens(str(message.content)) + MESSAGE_OVERHEAD for message in messages
+    )
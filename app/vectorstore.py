@@ -0,0 +1,204 @@
+"""vectorstore.py"""
+
+import asyncio
+from typing import Any, Iterable, Optional
+
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.data_connection.local import LocalIndex
+
+
+class LocalVectorStore(VectorStore):
+    """Vector store over a LocalIndex, searched in process."""
+
+    def __init__(self, index: LocalIndex, embedding: Embeddings):
+        self.index = index
+        self.embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities already
+        return lambda score: score
+
+    def _add(
+        self,
+        vectors: list[list[float]],
+        texts: list[str],
+        metadatas: Optional[list[dict]],
+        ids: Optional[list[str]] = None,
+    ) -> list[str]:
+        metadatas = metadatas or [{} for _ in texts]
+
+        rows = self.index.add(
+            vectors,
+            [
+                {"text": text, "metadata": metadata}
+                for text, metadata in zip(texts, metadatas, strict=True)
+            ],
+            ids=ids,
+        )
+
+        return ids or [str(i) for i in rows]
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+
+        return self._add(
+            self.embedding.embed_documents(texts), texts, metadatas, ids=ids
+        )
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+
+        vectors = await self.embedding.aembed_documents(texts)
+
+        return await asyncio.to_thread(self._add, vectors, texts, metadatas, ids)
+
+    def _to_documents(self, results: list[tuple[int, float]]):
+        records = self.index.get_documents([i for i, _ in results])
+
+        return [
+            (Document(page_content=record["text"], metadata=record["metadata"]), score)
+            for record, (_, score) in zip(records, results, strict=True)
+        ]
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self._to_documents(
+            self.index.search(embedding, k, where=kwargs.get("filter"))
+        )
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        vector = await self.embedding.aembed_query(query)
+
+        return await asyncio.to_thread(
+            self.similarity_search_with_score_by_vector, vector, k, **kwargs
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in self.similarity_search_with_score_by_vector(
+                embedding, k, **kwargs
+            )
+        ]
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return self.similarity_search_by_vector(
+            self.embedding.embed_query(query), k, **kwargs
+        )
+
+    async def asimilarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> list[Document]:
+        return [
+            document
+            for document, _ in await self.asimilarity_search_with_score(
+                query, k, **kwargs
+            )
+        ]
+
+    def max_marginal_relevance_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> list[Document]:
+        results = self.index.search(embedding, fetch_k, where=kwargs.get("filter"))
+
+        if not results:
+            return []
+
+        selected = maximal_marginal_relevance(
+            np.asarray(embedding, dtype=np.float32),
+            self.index.get_vectors([i for i, _ in results]),
+            lambda_mult=lambda_mult,
+            k=k,
+        )
+
+        documents = self._to_documents(results)
+
+        return [documents[i][0] for i in selected]
+
+    def max_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding.embed_query(query), k, fetch_k, lambda_mult, **kwargs
+        )
+
+    async def amax_marginal_relevance_search(
+        self,
+        query: str,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        **kwargs: Any,
+    ) -> list[Document]:
+        vector = await self.embedding.aembed_query(query)
+
+        return await asyncio.to_thread(
+            self.max_marginal_relevance_search_by_vector,
+            vector,
+            k,
+            fetch_k,
+            lambda_mult,
+            **kwargs,
+        )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        index: Optional[LocalIndex] = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        if index is None:
+            raise ValueError("A LocalIndex is required")
+
+        instance = cls(index=index, embedding=embedding)
+        instance.add_texts(texts, metadatas)
+
+        return instance
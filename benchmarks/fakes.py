@@ -0,0 +1,175 @@
+"""fakes.py"""
+
+import asyncio
+import hashlib
+import math
+import random
+import time
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.data_connection.bm25 import tokenize
+
+# Words the synthetic documents and questions are drawn from
+VOCABULARY = [
+    f"{stem}{suffix}"
+    for stem in (
+        "widget", "gear", "sensor", "valve", "pump", "filter", "relay", "motor",
+        "switch", "cable", "panel", "router", "socket", "driver", "bearing",
+        "spring", "bracket", "module", "battery", "display",
+    )
+    for suffix in ("", "s", "-a", "-b", "-x")
+]  # fmt: skip
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words vectors returned after a delay.
+
+    Texts sharing words get similar vectors, so retrieval results are
+    meaningful. `latency` is paid once per call, like a provider request.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.model = f"fake-{size}"
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.size] += 1.0 if value >> 63 else -1.0
+
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering from the prompt after a delay.
+
+    `latency` is the time to the first token and `token_latency` the time
+    between streamed tokens, the answer has `answer_tokens` words.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 32
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages: list[BaseMessage]) -> list[str]:
+        seed = hashlib.sha256(str(messages[-1].content).encode()).digest()
+        rng = random.Random(seed)  # noqa: S311
+
+        return [rng.choice(VOCABULARY) + " " for _ in range(self.answer_tokens)]
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._answer(messages)
+
+        time.sleep(self.latency + self.token_latency * (len(tokens) - 1))
+
+        message = AIMessage(content="".join(tokens).strip())
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._answer(messages)
+
+        await asyncio.sleep(self.latency + self.token_latency * (len(tokens) - 1))
+
+        message = AIMessage(content="".join(tokens).strip())
+
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+
+        for index, token in enumerate(self._answer(messages)):
+            if index:
+                await asyncio.sleep(self.token_latency)
+
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+
+            yield chunk
+
+
+class SyntheticLoader:
+    """Loader of generated pages, `document_path` seeds the text.
+
+    Like the PDF loader it yields one document per page.
+    """
+
+    pages = 8
+    words_per_page = 400
+
+    def __init__(self, document_path: str):
+        self.document_path = document_path
+
+    def lazy_load(self) -> Iterator[Document]:
+        rng = random.Random(self.document_path)  # noqa: S311
+
+        for page in range(self.pages):
+            words = rng.choices(VOCABULARY, k=self.words_per_page)
+
+            yield Document(
+                page_content=" ".join(words),
+                metadata={"source": self.document_path, "page": page},
+            )
+
+    def load(self) -> list[Document]:
+        return list(self.lazy_load())
+
+
+def make_question(seed: str, length: int = 6) -> str:
+    rng = random.Random(seed)  # noqa: S311
+
+    return f"What about {' '.join(rng.choices(VOCABULARY, k=length))}?"
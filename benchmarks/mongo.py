@@ -0,0 +1,262 @@
+"""mongo.py"""
+
+import copy
+from types import SimpleNamespace
+from typing import Any, Optional
+
+from bson import ObjectId
+
+
+def _get(document: dict, key: str) -> Any:
+    value = document
+
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+
+    return value
+
+
+def _compare(left: Any, right: Any) -> Optional[int]:
+    if left is None:
+        return None
+
+    try:
+        return (left > right) - (left < right)
+    except TypeError:
+        return None
+
+
+OPERATOR_MAPPING = {
+    "$lt": lambda value, arg: _compare(value, arg) == -1,
+    "$lte": lambda value, arg: _compare(value, arg) in (-1, 0),
+    "$gt": lambda value, arg: _compare(value, arg) == 1,
+    "$gte": lambda value, arg: _compare(value, arg) in (0, 1),
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$ne": lambda value, arg: value != arg,
+    "$exists": lambda value, arg: (value is not None) == arg,
+}
+
+
+def _match_value(value: Any, condition: Any) -> bool:
+    if (
+        isinstance(condition, dict)
+        and condition
+        and all(key.startswith("$") for key in condition)
+    ):
+        return all(
+            OPERATOR_MAPPING[operator](value, arg)
+            for operator, arg in condition.items()
+        )
+
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+
+    return value == condition
+
+
+def match(document: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            matched = any(match(document, clause) for clause in condition)
+        elif key == "$and":
+            matched = all(match(document, clause) for clause in condition)
+        else:
+            matched = _match_value(_get(document, key), condition)
+
+        if not matched:
+            return False
+
+    return True
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(document)
+
+    slices = {
+        key: value["$slice"]
+        for key, value in projection.items()
+        if isinstance(value, dict)
+    }
+    fields = {key: value for key, value in projection.items() if key not in slices}
+
+    if any(fields.values()):
+        result = {
+            key: copy.deepcopy(value)
+            for key, value in document.items()
+            if fields.get(key) or key == "_id" and fields.get("_id", True)
+        }
+    else:
+        result = {
+            key: copy.deepcopy(value)
+            for key, value in document.items()
+            if key not in fields
+        }
+
+    for key, count in slices.items():
+        if isinstance(document.get(key), list):
+            items = document[key]
+            result[key] = copy.deepcopy(items[:count] if count >= 0 else items[count:])
+
+    return result
+
+
+class Cursor:
+    def __init__(self, documents: list[dict], projection: Optional[dict] = None):
+        self.documents = documents
+        self.projection = projection
+        self.count = 0
+
+    def sort(self, key, direction: int = 1) -> "Cursor":
+        keys = key if isinstance(key, list) else [(key, direction)]
+
+        # Stable sorts applied from the least significant key
+        for field, order in reversed(keys):
+            self.documents.sort(
+                key=lambda document: (
+                    _get(document, field) is not None,
+                    _get(document, field),
+                ),
+                reverse=order < 0,
+            )
+
+        return self
+
+    def limit(self, count: int) -> "Cursor":
+        self.count = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list[dict]:
+        count = self.count or length
+        documents = self.documents[:count] if count else self.documents
+
+        return [project(document, self.projection) for document in documents]
+
+    async def __aiter__(self):
+        for document in await self.to_list():
+            yield document
+
+
+class Collection:
+    """The subset of the Motor collection API used by the app, kept in memory."""
+
+    def __init__(self):
+        self.documents: list[dict] = []
+
+    async def create_index(self, keys, **kwargs) -> str:
+        return "_".join(f"{field}_{order}" for field, order in keys)
+
+    async def insert_one(self, document: dict) -> SimpleNamespace:
+        document = copy.deepcopy(document)
+        document.setdefault("_id", ObjectId())
+
+        self.documents.append(document)
+
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    async def insert_many(self, documents: list[dict], **kwargs) -> SimpleNamespace:
+        ids = [(await self.insert_one(document)).inserted_id for document in documents]
+
+        return SimpleNamespace(inserted_ids=ids)
+
+    def find(
+        self, filter: Optional[dict] = None, projection: Optional[dict] = None
+    ) -> Cursor:
+        return Cursor(
+            [document for document in self.documents if match(document, filter)],
+            projection,
+        )
+
+    async def find_one(
+        self,
+        filter: Optional[dict] = None,
+        projection: Optional[dict] = None,
+        sort: Optional[list] = None,
+    ) -> Optional[dict]:
+        cursor = self.find(filter, projection)
+
+        if sort:
+            cursor.sort(sort)
+
+        documents = await cursor.to_list(1)
+
+        return documents[0] if documents else None
+
+    async def count_documents(self, filter: dict) -> int:
+        return sum(match(document, filter) for document in self.documents)
+
+    def _apply(self, document: dict, update: dict):
+        for operator, fields in update.items():
+            for key, value in fields.items():
+                if operator == "$set":
+                    document[key] = copy.deepcopy(value)
+                elif operator == "$inc":
+                    document[key] = document.get(key, 0) + value
+                elif operator == "$push":
+                    items = value["$each"] if isinstance(value, dict) else [value]
+                    document.setdefault(key, []).extend(copy.deepcopy(items))
+
+    async def update_one(
+        self, filter: dict, update: dict, upsert: bool = False
+    ) -> SimpleNamespace:
+        for document in self.documents:
+            if match(document, filter):
+                self._apply(document, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+
+        if upsert:
+            document = {
+                key: value for key, value in filter.items() if not key.startswith("$")
+            }
+            self._apply(document, {"$set": update.get("$setOnInsert", {})})
+            self._apply(document, update)
+            await self.insert_one(document)
+
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    async def update_many(self, filter: dict, update: dict) -> SimpleNamespace:
+        documents = [document for document in self.documents if match(document, filter)]
+
+        for document in documents:
+            self._apply(document, update)
+
+        return SimpleNamespace(
+            matched_count=len(documents), modified_count=len(documents)
+        )
+
+    async def delete_many(self, filter: dict) -> SimpleNamespace:
+        count = len(self.documents)
+        self.documents = [
+            document for document in self.documents if not match(document, filter)
+        ]
+
+        return SimpleNamespace(deleted_count=count - len(self.documents))
+
+
+class Database:
+    def __init__(self):
+        self.collections: dict[str, Collection] = {}
+
+    def get_collection(self, name: str) -> Collection:
+        return self.collections.setdefault(name, Collection())
+
+    __getitem__ = get_collection
+
+
+class Client:
+    """In-memory stand-in for AsyncIOMotorClient."""
+
+    def __init__(self):
+        self.databases: dict[str, Database] = {}
+
+    def get_database(self, name: str) -> Database:
+        return self.databases.setdefault(name, Database())
+
+    __getitem__ = get_database
+
+    def close(self):
+        # The data outlives the client, as it would on a server
+        pass
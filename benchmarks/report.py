@@ -0,0 +1,167 @@
+"""report.py"""
+
+import math
+from typing import Optional
+
+# Relative change of a metric beyond which a comparison flags a regression
+REGRESSION_THRESHOLD = 0.1
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARISON_MAPPING = {
+    "throughput": True,
+    "latency.p50": False,
+    "latency.p95": False,
+    "latency.p99": False,
+    "first_token.p50": False,
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of `values`, `q` in [0, 100]."""
+    ranked = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ranked)))
+
+    return ranked[rank - 1]
+
+
+def summarise(values: list[float]) -> Optional[dict]:
+    if not values:
+        return None
+
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def build_result(
+    scenario: str,
+    concurrency: int,
+    run: dict,
+    timings: tuple[str, ...],
+    memory: dict,
+) -> dict:
+    duration = run["duration"]
+    completed = run["requests"] - run["errors"]
+
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": run["requests"],
+        "errors": run["errors"],
+        "duration": duration,
+        "throughput": completed / duration if duration else 0.0,
+        "memory": memory,
+    }
+
+    for key, values in run["samples"].items():
+        if key in timings:
+            result[key] = summarise(values)
+        else:
+            total = sum(values)
+            result[key] = {
+                "total": total,
+                "per_second": total / duration if duration else 0.0,
+            }
+
+    return result
+
+
+def _get_metric(result: dict, metric: str) -> Optional[float]:
+    value = result
+
+    for key in metric.split("."):
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+
+    return value
+
+
+def compare(
+    results: list[dict],
+    baseline: list[dict],
+    threshold: float = REGRESSION_THRESHOLD,
+) -> list[dict]:
+    """Compares results to a baseline run by scenario and concurrency.
+
+    Returns one row per metric present in both, `regression` is set when
+    the metric got worse by more than `threshold`.
+    """
+    previous = {(item["scenario"], item["concurrency"]): item for item in baseline}
+
+    rows = []
+
+    for result in results:
+        before = previous.get((result["scenario"], result["concurrency"]))
+
+        if before is None:
+            continue
+
+        for metric, higher_is_better in COMPARISON_MAPPING.items():
+            old = _get_metric(before, metric)
+            new = _get_metric(result, metric)
+
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+
+            rows.append(
+                {
+                    "scenario": result["scenario"],
+                    "concurrency": result["concurrency"],
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "change": change,
+                    "regression": worse > threshold,
+                }
+            )
+
+    return rows
+
+
+def format_results(results: list[dict]) -> str:
+    lines = [
+        f"{'scenario':<10} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'p99 ms':>9} {'ttft ms':>9} {'errors':>6} {'rss MB':>8}"
+    ]
+
+    for result in results:
+        latency = result["latency"] or {}
+        first_token = result.get("first_token") or {}
+
+        def ms(summary: dict, key: str) -> str:
+            return f"{summary[key] * 1000:9.1f}" if key in summary else f"{'-':>9}"
+
+        lines.append(
+            f"{result['scenario']:<10} {result['concurrency']:>5} "
+            f"{result['throughput']:9.2f} {ms(latency, 'p50')} {ms(latency, 'p95')} "
+            f"{ms(latency, 'p99')} {ms(first_token, 'p50')} {result['errors']:>6} "
+            f"{result['memory']['peak_rss_mb']:8.1f}"
+        )
+
+    return "\n".join(lines)
+
+
+def format_comparison(rows: list[dict]) -> str:
+    lines = [
+        f"{'scenario':<10} {'conc':>5} {'metric':<16} {'baseline':>10} "
+        f"{'current':>10} {'change':>8}"
+    ]
+
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+
+        lines.append(
+            f"{row['scenario']:<10} {row['concurrency']:>5} {row['metric']:<16} "
+            f"{row['baseline']:10.4f} {row['current']:10.4f} "
+            f"{row['change']:+8.1%}{flag}"
+        )
+
+    return "\n".join(lines)
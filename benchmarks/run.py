@@ -0,0 +1,198 @@
+"""run.py
+
+Benchmarks ingestion and dialogues against local stand-ins:
+
+    python -m benchmarks.run --scenario chain dialogue --concurrency 1 8 32
+    python -m benchmarks.run --baseline benchmarks/results/main.json
+
+The chat model and embeddings are deterministic fakes with configurable
+latency, Mongo is kept in memory and vectors go to the local index in a
+temporary directory, so runs are reproducible and need no services.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from benchmarks.report import (
+    REGRESSION_THRESHOLD,
+    build_result,
+    compare,
+    format_comparison,
+    format_results,
+)
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+
+    parser.add_argument(
+        "--scenario",
+        nargs="+",
+        default=["ingest", "chain", "dialogue"],
+        choices=["ingest", "chain", "dialogue"],
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument(
+        "--requests", type=int, default=64, help="Requests per scenario and level"
+    )
+    parser.add_argument(
+        "--corpus", type=int, default=16, help="Documents in the queried library"
+    )
+    parser.add_argument("--turns", type=int, default=3, help="Turns per dialogue")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--answer-tokens", type=int, default=32)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also report peak Python allocations, which slows every scenario",
+    )
+    parser.add_argument("--label", default=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--output", type=Path, help="Defaults to results/LABEL.json")
+    parser.add_argument("--baseline", type=Path, help="Results to compare with")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+
+    return parser.parse_args(argv)
+
+
+def configure(directory: Path):
+    """Keeps the app's data and clients local, before it is imported."""
+    os.environ.update(
+        {
+            "LOCAL_VECTOR_DIR": str(directory / "vectors"),
+            "LEXICAL_INDEX_DIR": str(directory / "lexical"),
+            "UPLOAD_DIR": str(directory / "uploads"),
+            # Empty values are not overridden by a .env file
+            "REDIS_URI": "",
+            "LANGCHAIN_TRACING_V2": "false",
+        }
+    )
+
+
+def get_memory(trace: bool) -> dict:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Kilobytes on Linux, bytes on macOS
+    memory = {"peak_rss_mb": peak / (2**20 if sys.platform == "darwin" else 2**10)}
+
+    if trace:
+        memory["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+
+    return memory
+
+
+async def run(args: argparse.Namespace) -> list[dict]:
+    from app.server import app
+    from benchmarks.scenarios import SCENARIO_MAPPING, TIMINGS, install
+
+    install(
+        llm_latency=args.llm_latency,
+        token_latency=args.token_latency,
+        answer_tokens=args.answer_tokens,
+        embedding_latency=args.embedding_latency,
+    )
+
+    results = []
+
+    print(format_results([]), flush=True)
+
+    async with app.router.lifespan_context(app):
+        for scenario in args.scenario:
+            for concurrency in args.concurrency:
+                if args.trace_memory:
+                    tracemalloc.reset_peak()
+
+                outcome = await SCENARIO_MAPPING[scenario](
+                    requests=args.requests,
+                    concurrency=concurrency,
+                    corpus=args.corpus,
+                    turns=args.turns,
+                )
+
+                results.append(
+                    build_result(
+                        scenario,
+                        concurrency,
+                        outcome,
+                        timings=TIMINGS,
+                        memory=get_memory(args.trace_memory),
+                    )
+                )
+
+                print(format_results(results[-1:]).splitlines()[-1], flush=True)
+
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    directory = Path(tempfile.mkdtemp(prefix="benchmark-"))
+    configure(directory)
+
+    if args.trace_memory:
+        tracemalloc.start()
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    output = args.output or RESULTS_DIR / f"{args.label}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+
+    settings = {
+        key: str(value) if isinstance(value, Path) else value
+        for key, value in vars(args).items()
+    }
+
+    output.write_text(
+        json.dumps(
+            {
+                "label": args.label,
+                "created": datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "settings": settings,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+    print(f"Results written to {output}")
+
+    if args.baseline is None:
+        return 0
+
+    rows = compare(
+        results,
+        json.loads(args.baseline.read_text())["results"],
+        threshold=args.threshold,
+    )
+
+    print(f"\nCompared with {args.baseline}")
+    print(format_comparison(rows))
+
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""scenarios.py"""
+
+import asyncio
+import json
+import logging
+import time
+from itertools import count
+from typing import Awaitable, Callable, Optional
+from uuid import UUID, uuid4
+
+from app import backends, document_processor, prompt_processor
+from app.controller import create_dialogue, create_library
+from app.data_connection import mongo
+from app.embedding_cache import CachedEmbeddings
+from app.embedding_scheduler import PROVIDER_LIMITS, ScheduledEmbeddings
+from app.entity import Dialogue, Library
+from app.server import DUMMY_USER_ID, app
+from benchmarks.fakes import (
+    FakeChatModel,
+    FakeEmbeddings,
+    SyntheticLoader,
+    make_question,
+)
+from benchmarks.mongo import Client
+
+# Key of the stand-ins in the app's chat, embedding and loader mappings
+NAME = "benchmark"
+VECTORDB = "local"
+
+# Sample keys summarised as latency percentiles, the others are summed
+TIMINGS = ("latency", "first_token")
+
+logger = logging.getLogger(__name__)
+
+# Operation run once per request, given the worker and request numbers
+Operation = Callable[[int, int], Awaitable[Optional[dict]]]
+
+
+def install(
+    llm_latency: float = 0.0,
+    token_latency: float = 0.0,
+    answer_tokens: int = 32,
+    embedding_latency: float = 0.0,
+):
+    """Registers the stand-ins with the app and points Mongo at memory."""
+    PROVIDER_LIMITS.setdefault(
+        NAME, {"batch_size": 96, "rate": 1000.0, "query_rate": 1000.0}
+    )
+
+    def get_embedding():
+        embeddings = ScheduledEmbeddings(
+            FakeEmbeddings(latency=embedding_latency), provider=NAME
+        )
+
+        return CachedEmbeddings(embeddings, namespace=f"{NAME}:{embeddings.model}")
+
+    def get_chat(temperature: float, model: Optional[str] = None):
+        return FakeChatModel(
+            latency=llm_latency,
+            token_latency=token_latency,
+            answer_tokens=answer_tokens,
+        )
+
+    backends.CHAT_MAPPING[NAME] = get_chat
+    backends.EMBEDDING_MAPPING[NAME] = get_embedding
+    document_processor.LOADER_MAPPING[NAME] = SyntheticLoader
+
+    client = Client()
+
+    mongo.pool.factory = lambda: client
+    mongo.pool.check = None
+
+
+async def run_load(operation: Operation, requests: int, concurrency: int) -> dict:
+    """Runs `requests` operations from `concurrency` closed-loop workers."""
+    indexes = iter(range(requests))
+    samples: dict[str, list[float]] = {key: [] for key in TIMINGS}
+    errors = 0
+
+    async def work(worker: int):
+        nonlocal errors
+
+        for index in indexes:
+            started = time.perf_counter()
+
+            try:
+                measures = await operation(worker, index) or {}
+            except Exception:
+                logger.exception("Request %d failed", index)
+                errors += 1
+                continue
+
+            # Operations may time themselves, leaving out their own setup
+            latency = measures.pop("latency", time.perf_counter() - started)
+            samples["latency"].append(latency)
+
+            for key, value in measures.items():
+                samples.setdefault(key, []).append(value)
+
+    started = time.perf_counter()
+
+    await asyncio.gather(*(work(worker) for worker in range(concurrency)))
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "duration": time.perf_counter() - started,
+        "samples": samples,
+    }
+
+
+async def setup_library(documents: int = 0) -> UUID:
+    """Creates a library holding `documents` synthetic documents."""
+    library = Library(
+        user_id=DUMMY_USER_ID,
+        name=f"Benchmark {uuid4().hex[:8]}",
+        description="Synthetic documents",
+        embedding=NAME,
+        vectordb=VECTORDB,
+    )
+
+    await create_library(library)
+
+    await asyncio.gather(
+        *(
+            document_processor.process_document(
+                NAME, f"corpus-{index}", library.uuid, NAME, VECTORDB
+            )
+            for index in range(documents)
+        )
+    )
+
+    return library.uuid
+
+
+async def ingest(requests: int, concurrency: int, **kwargs) -> dict:
+    """Ingests synthetic documents into one library with `process_document`."""
+    library = await setup_library()
+
+    async def operation(worker: int, index: int) -> dict:
+        chunks = await document_processor.process_document(
+            NAME, f"{library.hex}-{index}", library, NAME, VECTORDB
+        )
+
+        return {"chunks": chunks}
+
+    return await run_load(operation, requests, concurrency)
+
+
+async def chain(requests: int, concurrency: int, corpus: int, **kwargs) -> dict:
+    """Answers single questions with the RAG chain, bypassing the server."""
+    library = await setup_library(documents=corpus)
+
+    async def operation(worker: int, index: int):
+        await prompt_processor.get_chain(NAME, VECTORDB, library, NAME).ainvoke(
+            {"question": make_question(f"{library}-{index}"), "chat_history": []}
+        )
+
+    return await run_load(operation, requests, concurrency)
+
+
+async def call(asgi_app, method: str, path: str, payload: dict) -> tuple[int, list]:
+    """Sends one request to an ASGI app.
+
+    Returns the status and the body chunks, each with the time it was sent.
+    """
+    body = json.dumps(payload).encode()
+    finished = asyncio.Event()
+    received = False
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+
+    async def receive() -> dict:
+        nonlocal received
+
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        # The client only disconnects once the response is complete
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    status = 0
+    chunks = []
+
+    async def send(message: dict):
+        nonlocal status
+
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                chunks.append((time.perf_counter(), message["body"]))
+            if not message.get("more_body"):
+                finished.set()
+
+    await asgi_app(scope, receive, send)
+    finished.set()
+
+    return status, chunks
+
+
+async def dialogue(
+    requests: int, concurrency: int, corpus: int, turns: int, **kwargs
+) -> dict:
+    """Streams dialogue turns through the server's routes.
+
+    Every worker holds a dialogue for `turns` turns, so later turns carry
+    chat history and go through question condensing.
+    """
+    library = await setup_library(documents=corpus)
+
+    sessions: dict[int, list] = {}
+    dialogues = count()
+
+    async def operation(worker: int, index: int) -> dict:
+        session = sessions.get(worker)
+
+        if session is None or session[1] >= turns:
+            instance = await create_dialogue(
+                user_id=DUMMY_USER_ID,
+                instance=Dialogue(
+                    user_id=DUMMY_USER_ID,
+                    library_id=library,
+                    llm=NAME,
+                    title=f"Benchmark {next(dialogues)}",
+                ),
+            )
+            session = sessions[worker] = [instance.uuid, 0]
+
+        session[1] += 1
+
+        started = time.perf_counter()
+
+        status, chunks = await call(
+            app,
+            "POST",
+            f"/api/dialogue/{session[0]}/stream/",
+            {"content": make_question(f"{library}-{index}")},
+        )
+
+        if status != 200 or not chunks:
+            raise RuntimeError(f"Dialogue turn failed with status {status}")
+
+        return {
+            "latency": chunks[-1][0] - started,
+            "first_token": chunks[0][0] - started,
+        }
+
+    return await run_load(operation, requests, concurrency)
+
+
+SCENARIO_MAPPING = {
+    "ingest": ingest,
+    "chain": chain,
+    "dialogue": dialogue,
+}